@@ -1,162 +1,195 @@
 # app.py
-from flask import Flask, request, jsonify
+import logging
+import os
+import threading
+import time
+
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-import base64
-import numpy as np
-import cv2
-import tensorflow as tf
-import json
-import re
-import matplotlib
-import ollama
-
-from pdf2image import convert_from_bytes
-from crud import save_invoice_to_db
-from database import create_tables, get_db, Invoice, InvoiceItem
-from utils.ocr_utils import preprocess_image
-
-matplotlib.use("Agg")
+
+_import_start = time.perf_counter()
+
+from database import check_db_connection, create_tables, init_app as init_db_sessions, pool_status
+from ingest import ingestor
+from pipeline import detection_batcher, load_document, model_registry, run_pipeline
+from utils.fast_extract import fast_path_stats
+from utils.llm import llm_stats
+from utils.llm_cache import llm_cache
+from utils.metrics import HTTP_REQUEST_SECONDS, REGISTRY, register_stats_collector, timed_stage
+from utils.ocr_utils import parse_bool
+from utils.result_cache import hash_file, result_cache
+from utils.stats_cache import stats_cache
+from utils.status_sweeper import status_sweeper
+from utils.upload_utils import MAX_CONTENT_LENGTH, UploadError, read_upload
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("app")
 
 app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
 CORS(app)
+# One session per request, closed on teardown; read-only GETs go to the replica
+init_db_sessions(app)
 
 from routes.invoices import invoices_bp
 from routes.stats import stats_bp
-
-# Create tables at startup
-create_tables()
+from routes.jobs import jobs_bp
+from routes.batch import batch_bp
+from stats_routes import stats_bp as api_stats_bp
 
 # Register blueprint
 app.register_blueprint(invoices_bp)
 app.register_blueprint(stats_bp)
-
-
-model_path = "models/saved_model"
-model = tf.saved_model.load(model_path)
+app.register_blueprint(jobs_bp)
+app.register_blueprint(batch_bp)
+# stats_routes uses the same blueprint name as routes/stats, register it under its own
+app.register_blueprint(api_stats_bp, name="api_stats")
+
+startup_timings = {"imports": round(time.perf_counter() - _import_start, 3)}
+logger.info("startup: imports took %.3fs", startup_timings["imports"])
+
+# Seconds between two attempts at creating tables and running migrations
+SCHEMA_RETRY_SECONDS = float(os.environ.get("SCHEMA_RETRY_SECONDS", 30))
+# Tables and migrations (backfills, clients and rollup builds): /readyz
+# answers 503 until they have succeeded
+schema_status = {"state": "migrating", "error": None, "attempts": 0}
+
+
+def startup():
+    """Create tables and load + warm up the detector without blocking the workers."""
+    model_registry.start()
+    while True:
+        schema_status["attempts"] += 1
+        start = time.perf_counter()
+        try:
+            create_tables()
+        except Exception as e:
+            schema_status.update(state="failed", error=str(e))
+            logger.exception("startup: create_tables failed, retrying in %.0fs", SCHEMA_RETRY_SECONDS)
+            time.sleep(SCHEMA_RETRY_SECONDS)
+            continue
+        startup_timings["create_tables"] = round(time.perf_counter() - start, 3)
+        logger.info("startup: create_tables took %.3fs", startup_timings["create_tables"])
+        schema_status.update(state="ready", error=None)
+        break
+
+    # The sweeper writes the status column added by the migrations
+    status_sweeper.start()
+
+
+threading.Thread(target=startup, name="startup", daemon=True).start()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_latency(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            blueprint=request.blueprint or "app",
+            endpoint=request.endpoint or "unknown",
+            method=request.method,
+            status=response.status_code,
+        )
+    return response
 
 
 @app.route("/ocr", methods=["POST"])
 def predict():
-    if not request.is_json:
-        return jsonify({"error": "Request must be application/json"}), 415
-
-    data = request.get_json()
-
-    if "file" not in data:
-        return jsonify({"error": "No file data provided"}), 400
-    if "file_type" not in data:
-        return jsonify({"error": "No file_type specified (must be 'image' or 'pdf')"}), 400
+    timings = {}
+    try:
+        with timed_stage("upload", timings):
+            file_data, file_type, options = read_upload(request)
+    except UploadError as e:
+        return jsonify({"error": e.message}), e.status
 
-    base64_data = data["file"]
-    file_type = data["file_type"].lower()
+    show_timings = parse_bool(options.get("timings"))
 
     try:
-        # Strip base64 prefix if present
-        prefix_pattern = r"^data:(application\/pdf|image\/[a-zA-Z]+);base64,(.+)"
-        match = re.match(prefix_pattern, base64_data)
-        if match:
-            base64_data = match.group(2)
-
-        base64_data = base64_data.strip().replace("\n", "")
-        missing_padding = len(base64_data) % 4
-        if missing_padding:
-            base64_data += "=" * (4 - missing_padding)
-
-        file_data = base64.b64decode(base64_data)
-        
-        if file_type == "pdf":
-            # Specify poppler path (update this to your actual path)
-            poppler_path = r"C:\poppler-24.08.0\Library\bin"
-            
-            # Handle PDF file with explicit poppler path
-            images = convert_from_bytes(
-                file_data,
-                poppler_path=poppler_path
-            )
-            
-            if not images:
-                return jsonify({"error": "Failed to extract images from PDF"}), 400
-            
-            # Process each page (for simplicity, we'll just use the first page here)
-            image = np.array(images[0])
-            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-            
-        elif file_type == "image":
-            # Handle image file (original logic)
-            image_array = np.frombuffer(file_data, np.uint8)
-            image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-        else:
-            return jsonify({"error": "Invalid file_type (must be 'image' or 'pdf')"}), 400
-
+        with timed_stage("cache", timings):
+            file_hash = hash_file(file_data)
+            # Skip the whole pipeline for files we have already processed
+            cached = None if options["force"] else result_cache.lookup(file_hash)
+        if cached is not None:
+            if show_timings:
+                cached["timings"] = timings
+            return jsonify(cached)
+
+        with timed_stage("decode", timings):
+            document = load_document(file_data, file_type, options.get("preprocess"))
     except Exception as e:
         return jsonify({"error": f"Invalid file data: {str(e)}"}), 400
 
     try:
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        input_tensor = tf.convert_to_tensor(image_rgb, dtype=tf.uint8)[tf.newaxis, ...]
-        detections = model(input_tensor)
-        num_detections = int(detections.pop("num_detections"))
-        detections = {
-            key: value[0, :num_detections].numpy() for key, value in detections.items()
-        }
-
-        boxes = detections["detection_boxes"]
-        classes = detections["detection_classes"].astype(np.int64)
-        scores = detections["detection_scores"]
-        threshold = 0.5
-
-        valid_detections = scores >= threshold
-        boxes = boxes[valid_detections]
-        scores = scores[valid_detections]
-        classes = classes[valid_detections]
-
-        extracted_texts = []
-        config = "--oem 3 --psm 6"
-
-        for i in range(len(boxes)):
-            box = boxes[i]
-            ymin, xmin, ymax, xmax = box
-            roi = image[
-                int(ymin * image.shape[0]) : int(ymax * image.shape[0]),
-                int(xmin * image.shape[1]) : int(xmax * image.shape[1]),
-            ]
-            preprocessed_roi = preprocess_image(roi)
-            import pytesseract
-
-            text = pytesseract.image_to_string(
-                preprocessed_roi, config=config, lang="eng"
-            )
-            extracted_texts.append(text.strip())
-
-        texts = "   |||   ".join(extracted_texts)
-
-        msg = (
-            "can you parse this text and give me json format version with these corresponding values: "
-            "Company Name, Company Address, Customer Name, Customer Address, Invoice Number, Invoice Date, Due Date, "
-            "Description, Quantity, Unit Price, Taxes, Amount, Total. If you can't find values of corresponding field then leave it empty. The text is :"
-        )
+        result_json, json_part = run_pipeline(document, timings, file_hash=file_hash)
+        if result_json is None:
+            return json_part
+        if show_timings:
+            result_json = {**result_json, "timings": timings}
+        return jsonify(result_json)
+    except Exception as e:
+        return jsonify({"error": f"Failed to process image: {str(e)}"}), 500
 
-        response = ollama.chat(
-            model="gemma2:2b",
-            messages=[{"role": "user", "content": msg + texts}],
-        )
-        ollama_out = response["message"]["content"]
 
-        start_index = ollama_out.find("{")
-        end_index = ollama_out.rfind("}") + 1
-        json_part = ollama_out[start_index:end_index]
+@app.route("/ocr/stats", methods=["GET"])
+def ocr_stats():
+    return jsonify({
+        "detection": detection_batcher.stats(),
+        "result_cache": result_cache.stats(),
+        "llm_cache": llm_cache.stats(),
+        "fast_path": fast_path_stats.stats(),
+        "llm": llm_stats.stats(),
+        "ingest": ingestor.stats(),
+        "db_pool": pool_status(),
+        "status_sweeper": status_sweeper.stats(),
+        "stats_cache": stats_cache.stats(),
+    })
 
-        try:
-            invoice_data = json.loads(json_part)
-            invoice_id = save_invoice_to_db(invoice_data, texts, json_part)
-            result_json = invoice_data
-            result_json["invoice_id"] = invoice_id
-            return jsonify(result_json)
-        except json.JSONDecodeError:
-            return json_part
 
-    except Exception as e:
-        return jsonify({"error": f"Failed to process image: {str(e)}"}), 500
+register_stats_collector("result_cache", result_cache.stats)
+register_stats_collector("llm_cache", llm_cache.stats)
+register_stats_collector("fast_path", fast_path_stats.stats)
+register_stats_collector("llm", llm_stats.stats)
+register_stats_collector("stats_cache", stats_cache.stats)
+_detection_batches = REGISTRY.gauge(
+    "detection_batches", "Detection forward passes per batch size", ["batch_size"]
+)
+
+
+def _collect_detection_batches():
+    for size, count in detection_batcher.stats()["batch_size_histogram"].items():
+        _detection_batches.set(count, batch_size=size)
+
+
+REGISTRY.add_collector(_collect_detection_batches)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    db_ok = check_db_connection()
+    ready = model_registry.ready and db_ok and schema_status["state"] == "ready"
+    return jsonify({
+        "status": "ready" if ready else "not_ready",
+        "database": "ok" if db_ok else "unreachable",
+        "schema": dict(schema_status),
+        "model": model_registry.status(),
+        "startup_timings": startup_timings,
+    }), 200 if ready else 503
 
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+# benchmarks/common.py
+"""
+Helpers shared by the benchmark suite: timing, database selection and the
+JSON result format used by benchmarks.compare.
+"""
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+DEFAULT_BENCH_DB = os.path.join(tempfile.gettempdir(), "invoice_ocr_bench.db")
+
+
+def use_database(url: str | None = None) -> str:
+    """
+    Point the app at the benchmark database. database.py reads DATABASE_URL
+    at import time, so this must run before anything imports it.
+    """
+    url = url or os.environ.get("BENCH_DATABASE_URL") or f"sqlite:///{DEFAULT_BENCH_DB}"
+    os.environ["DATABASE_URL"] = url
+    return url
+
+
+def measure(func, repeat: int = 5, warmup: int = 1) -> dict:
+    """Time func() `repeat` times after `warmup` untimed calls."""
+    for _ in range(warmup):
+        func()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+def summarize(durations: list[float]) -> dict:
+    values = 1000 * np.asarray(durations, dtype=np.float64)
+    return {
+        "runs": len(durations),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "min_ms": round(float(values.min()), 3),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path: str, results: dict, **meta):
+    """
+    Results are a flat {name: timing summary} mapping so that two runs can be
+    compared key by key; skipped benchmarks hold {"skipped": reason} and
+    failing ones {"error": message}.
+    """
+    document = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            **meta,
+        },
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+
+
+def load_results(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def print_results(results: dict):
+    width = max((len(name) for name in results), default=10)
+    print(f"{'benchmark':<{width}} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10}")
+    for name, row in results.items():
+        if "skipped" in row or "error" in row:
+            status = "skipped" if "skipped" in row else "error"
+            print(f"{name:<{width}} {status}: {row[status]}")
+            continue
+        print(f"{name:<{width}} {row['mean_ms']:>10.3f} {row['p50_ms']:>10.3f} {row['p95_ms']:>10.3f}")
@@ -0,0 +1,96 @@
+# benchmarks/compare.py
+"""
+Compare two benchmark result files and fail on regressions.
+
+    python -m benchmarks.compare baseline.json current.json
+    python -m benchmarks.compare baseline.json current.json --threshold 0.10 --metric p95_ms
+
+A benchmark regresses when its --metric grew by more than --threshold
+(0.20 = 20 %) and by more than --min-delta-ms, which keeps sub-millisecond
+noise from failing the run. A benchmark that now errors also counts as a
+regression. Exits with status 1 when anything regressed.
+"""
+import argparse
+import sys
+
+from benchmarks.common import load_results
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.2,
+            metric: str = "p50_ms", min_delta_ms: float = 1.0) -> tuple[list[dict], list[str]]:
+    """Returns (rows, regressions); rows hold one comparison per benchmark of the current run."""
+    rows = []
+    regressions = []
+    for name, row in current.items():
+        before = baseline.get(name)
+        if "error" in row:
+            if before is None or "error" not in before:
+                regressions.append(f"{name}: {row['error']}")
+            rows.append({"name": name, "status": "error"})
+            continue
+        if before is None or metric not in before or metric not in row:
+            rows.append({"name": name, "status": "new" if before is None else "skipped"})
+            continue
+
+        old, new = before[metric], row[metric]
+        change = (new - old) / old if old else 0.0
+        regressed = change > threshold and new - old > min_delta_ms
+        if regressed:
+            regressions.append(f"{name}: {metric} {old:.3f} -> {new:.3f} ms ({change:+.1%})")
+        rows.append({
+            "name": name,
+            "status": "regressed" if regressed else "ok",
+            "before": old,
+            "after": new,
+            "change": change,
+        })
+    return rows, regressions
+
+
+def print_comparison(rows: list[dict], metric: str):
+    width = max((len(row["name"]) for row in rows), default=10)
+    print(f"{'benchmark':<{width}} {'before':>10} {'after':>10} {'change':>9}  ({metric})")
+    for row in rows:
+        if "change" not in row:
+            print(f"{row['name']:<{width}} {row['status']:>10}")
+            continue
+        flag = "  REGRESSED" if row["status"] == "regressed" else ""
+        print(f"{row['name']:<{width}} {row['before']:>10.3f} {row['after']:>10.3f} {row['change']:>+9.1%}{flag}")
+
+
+def check(baseline_path: str, current_path: str, threshold: float = 0.2,
+          metric: str = "p50_ms", min_delta_ms: float = 1.0) -> bool:
+    baseline = load_results(baseline_path)
+    current = load_results(current_path)
+    rows, regressions = compare(baseline["results"], current["results"], threshold, metric, min_delta_ms)
+    print(f"baseline {baseline['meta'].get('commit')} ({baseline['meta'].get('created_at')}), "
+          f"current {current['meta'].get('commit')} ({current['meta'].get('created_at')})")
+    print_comparison(rows, metric)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return False
+    print(f"\nNo regression beyond {threshold:.0%}")
+    return True
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown (0.2 = 20%%)")
+    parser.add_argument("--metric", default="p50_ms", choices=("mean_ms", "p50_ms", "p95_ms", "min_ms"))
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if not check(args.baseline, args.current, args.threshold, args.metric, args.min_delta_ms):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
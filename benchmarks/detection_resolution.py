@@ -0,0 +1,137 @@
+# benchmarks/detection_resolution.py
+"""
+Compare detection latency and box recall at several input long-edge sizes.
+
+    python -m benchmarks.detection_resolution --images path/to/invoices
+    python -m benchmarks.detection_resolution --images samples --sizes 0,1600,1024,640 --json out.json
+
+Boxes found at full resolution (size 0) are the reference; recall is the
+share of reference boxes matched (IoU >= --iou) by the boxes found at each
+size. PDFs in the directory are rasterized page by page.
+"""
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from utils.detection import resize_for_detection
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+
+
+def load_images(directory: str, poppler_path: str | None = None) -> list[tuple[str, np.ndarray]]:
+    images = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        ext = os.path.splitext(name)[1].lower()
+        if ext in IMAGE_EXTENSIONS:
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+            if image is not None:
+                images.append((name, image))
+        elif ext == ".pdf":
+            from pdf2image import convert_from_path
+
+            for i, page in enumerate(convert_from_path(path, poppler_path=poppler_path), start=1):
+                images.append((f"{name}#{i}", cv2.cvtColor(np.array(page), cv2.COLOR_RGB2BGR)))
+    return images
+
+
+def iou(a, b) -> float:
+    ymin, xmin = max(a[0], b[0]), max(a[1], b[1])
+    ymax, xmax = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ymax - ymin) * max(0.0, xmax - xmin)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def recall(reference, boxes, threshold: float) -> float | None:
+    if len(reference) == 0:
+        return None
+    matched = sum(1 for ref in reference if any(iou(ref, box) >= threshold for box in boxes))
+    return matched / len(reference)
+
+
+def detect(model, image, long_edge: int, score_threshold: float):
+    import tensorflow as tf
+
+    resized = resize_for_detection(image, long_edge)
+    image_rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+    start = time.perf_counter()
+    detections = model(tf.convert_to_tensor(image_rgb, dtype=tf.uint8)[tf.newaxis, ...])
+    elapsed = time.perf_counter() - start
+    num_detections = int(detections["num_detections"][0])
+    boxes = detections["detection_boxes"][0, :num_detections].numpy()
+    scores = detections["detection_scores"][0, :num_detections].numpy()
+    return boxes[scores >= score_threshold], elapsed, resized.shape[:2]
+
+
+def run(model, images, sizes, repeat: int, score_threshold: float, iou_threshold: float) -> dict:
+    results = {str(size): {"latency_ms": [], "recall": [], "input_pixels": []} for size in sizes}
+
+    for name, image in images:
+        # Warm-up so graph tracing is not counted, and full-resolution reference
+        detect(model, image, 0, score_threshold)
+        reference, _, _ = detect(model, image, 0, score_threshold)
+
+        for size in sizes:
+            durations = []
+            for _ in range(repeat):
+                boxes, elapsed, shape = detect(model, image, size, score_threshold)
+                durations.append(elapsed)
+            row = results[str(size)]
+            row["latency_ms"].append(1000 * float(np.median(durations)))
+            row["input_pixels"].append(shape[0] * shape[1])
+            image_recall = recall(reference, boxes, iou_threshold)
+            if image_recall is not None:
+                row["recall"].append(image_recall)
+
+    summary = {}
+    for size, row in results.items():
+        summary[size] = {
+            "images": len(row["latency_ms"]),
+            "mean_latency_ms": round(float(np.mean(row["latency_ms"])), 2) if row["latency_ms"] else None,
+            "mean_input_pixels": int(np.mean(row["input_pixels"])) if row["input_pixels"] else None,
+            "recall": round(float(np.mean(row["recall"])), 4) if row["recall"] else None,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="directory of invoice images / PDFs")
+    parser.add_argument("--model", default="models/saved_model")
+    parser.add_argument("--sizes", default="0,1600,1280,1024,800,640",
+                        help="comma-separated long-edge sizes, 0 = full resolution")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--score-threshold", type=float, default=0.5)
+    parser.add_argument("--iou", type=float, default=0.5)
+    parser.add_argument("--poppler-path", default=os.environ.get("POPPLER_PATH"))
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    import tensorflow as tf
+
+    model = tf.saved_model.load(args.model)
+    images = load_images(args.images, args.poppler_path)
+    if not images:
+        parser.error(f"no images found in {args.images}")
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    summary = run(model, images, sizes, args.repeat, args.score_threshold, args.iou)
+
+    print(f"{'long edge':>10} {'latency ms':>11} {'pixels':>12} {'recall':>8}")
+    for size, row in summary.items():
+        label = "full" if size == "0" else size
+        box_recall = "-" if row["recall"] is None else f"{row['recall']:.3f}"
+        print(f"{label:>10} {row['mean_latency_ms']:>11.2f} {row['mean_input_pixels']:>12} {box_recall:>8}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# benchmarks/fake_ollama.py
+"""
+Local stand-in for the ollama HTTP API, so the LLM stage can be benchmarked
+without a model. POST /api/chat streams the JSON of a synthetic invoice as
+NDJSON chunks at a configurable time-to-first-token and token rate.
+
+    with FakeOllamaServer(tokens_per_s=200) as server:
+        os.environ["OLLAMA_HOST"] = server.url
+        ...
+
+Can also be run on its own: python -m benchmarks.fake_ollama --port 11434
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from benchmarks.synthetic import invoice_record
+
+# Characters per streamed chunk, roughly one token
+CHUNK_CHARS = 4
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # ollama answers "Ollama is running" on /, the client only checks the status
+        self._send_json({"status": "ok"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path != "/api/chat":
+            self._send_json({"error": f"unsupported path {self.path}"}, 404)
+            return
+
+        server = self.server
+        content = server.next_response()
+        model = request.get("model", "fake")
+        if not request.get("stream", True):
+            time.sleep(server.ttft + len(content) / CHUNK_CHARS / server.tokens_per_s)
+            self._send_json({
+                "model": model,
+                "message": {"role": "assistant", "content": content},
+                "done": True,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(server.ttft)
+        try:
+            for i in range(0, len(content), CHUNK_CHARS):
+                self._write_chunk({
+                    "model": model,
+                    "message": {"role": "assistant", "content": content[i:i + CHUNK_CHARS]},
+                    "done": False,
+                })
+                time.sleep(1 / server.tokens_per_s)
+            # ollama ends every stream with a done message
+            self._write_chunk({"model": model, "message": {"role": "assistant", "content": ""}, "done": True})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream once the JSON object was complete
+            pass
+
+    def _write_chunk(self, payload: dict):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 ttft: float = 0.05, tokens_per_s: float = 200.0, seed: int = 0):
+        super().__init__((host, port), _Handler)
+        self.ttft = ttft
+        self.tokens_per_s = tokens_per_s
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._count = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def next_response(self) -> str:
+        with self._lock:
+            self._count += 1
+            return json.dumps(invoice_record(self._rng, self._count), indent=2)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--ttft", type=float, default=0.05, help="seconds before the first token")
+    parser.add_argument("--tokens-per-s", type=float, default=200.0)
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(args.host, args.port, args.ttft, args.tokens_per_s)
+    print(f"Fake ollama listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# benchmarks/preprocess_profiles.py
+"""
+Compare the preprocess_image profiles on sample ROIs: time per ROI and, when
+tesseract is installed, character accuracy of the OCR output.
+
+    python -m benchmarks.preprocess_profiles
+    python -m benchmarks.preprocess_profiles --rois path/to/rois --json out.json
+
+A ROI directory holds images (png/jpg) with the expected text in a .txt file
+of the same name. Without --rois, synthetic invoice ROIs are generated
+(clean, low contrast, gaussian noise, salt & pepper, blurred).
+"""
+import argparse
+import difflib
+import json
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+from utils.ocr_utils import PREPROCESS_PROFILES, choose_profile, preprocess_image
+
+SAMPLE_LINES = [
+    "Invoice No: INV-2024-0042",
+    "Invoice Date: 12/03/2024",
+    "Due Date: 2024-04-12",
+    "Consulting services 12 x 85.00",
+    "VAT (20%): 204.00",
+    "Total: 1,224.00 EUR",
+]
+
+
+def render_text(text: str, scale: float = 0.8) -> np.ndarray:
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    (width, height), baseline = cv2.getTextSize(text, font, scale, 2)
+    image = np.full((height + baseline + 20, width + 20, 3), 255, dtype=np.uint8)
+    cv2.putText(image, text, (10, height + 10), font, scale, (0, 0, 0), 2, cv2.LINE_AA)
+    return image
+
+
+def degrade(image: np.ndarray, kind: str, rng: np.random.Generator) -> np.ndarray:
+    if kind == "clean":
+        return image
+    if kind == "low_contrast":
+        return (image.astype(np.float32) * 0.35 + 120).astype(np.uint8)
+    if kind == "gaussian_noise":
+        noise = rng.normal(0, 35, image.shape)
+        return np.clip(image.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+    if kind == "salt_pepper":
+        noisy = image.copy()
+        mask = rng.random(image.shape[:2])
+        noisy[mask < 0.04] = 0
+        noisy[mask > 0.96] = 255
+        return noisy
+    if kind == "blurred":
+        return cv2.GaussianBlur(image, (5, 5), 1.5)
+    raise ValueError(kind)
+
+
+def synthetic_rois(seed: int = 0) -> list[tuple[str, np.ndarray, str]]:
+    rng = np.random.default_rng(seed)
+    rois = []
+    for kind in ("clean", "low_contrast", "gaussian_noise", "salt_pepper", "blurred"):
+        for i, line in enumerate(SAMPLE_LINES):
+            rois.append((f"{kind}-{i}", degrade(render_text(line), kind, rng), line))
+    return rois
+
+
+def load_rois(directory: str) -> list[tuple[str, np.ndarray, str | None]]:
+    rois = []
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp"):
+            continue
+        image = cv2.imread(os.path.join(directory, name), cv2.IMREAD_COLOR)
+        if image is None:
+            continue
+        expected = None
+        text_path = os.path.join(directory, stem + ".txt")
+        if os.path.exists(text_path):
+            with open(text_path, encoding="utf-8") as f:
+                expected = f.read().strip()
+        rois.append((stem, image, expected))
+    return rois
+
+
+def tesseract_available() -> bool:
+    try:
+        import pytesseract  # noqa: F401
+    except ImportError:
+        return False
+    return shutil.which("tesseract") is not None
+
+
+def run(rois, repeat: int = 3, with_ocr: bool = True) -> dict:
+    if with_ocr:
+        import pytesseract
+        from utils.ocr_engine import TESSERACT_CONFIG, TESSERACT_LANG
+
+    results = {}
+    for profile in PREPROCESS_PROFILES + ("auto",):
+        durations = []
+        scores = []
+        chosen = {}
+        for name, image, expected in rois:
+            if profile == "auto":
+                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+                picked = choose_profile(gray)
+                chosen[picked] = chosen.get(picked, 0) + 1
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                preprocessed = preprocess_image(image, profile)
+            durations.append((time.perf_counter() - start) / repeat)
+
+            if with_ocr and expected is not None:
+                text = pytesseract.image_to_string(
+                    preprocessed, config=TESSERACT_CONFIG, lang=TESSERACT_LANG
+                ).strip()
+                scores.append(difflib.SequenceMatcher(None, text, expected).ratio())
+
+        results[profile] = {
+            "rois": len(rois),
+            "mean_ms": round(1000 * float(np.mean(durations)), 3),
+            "p95_ms": round(1000 * float(np.percentile(durations, 95)), 3),
+            "accuracy": round(float(np.mean(scores)), 4) if scores else None,
+        }
+        if chosen:
+            results[profile]["chosen_profiles"] = chosen
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rois", help="directory of ROI images with .txt ground truth")
+    parser.add_argument("--repeat", type=int, default=3, help="preprocessing runs per ROI")
+    parser.add_argument("--no-ocr", action="store_true", help="only time preprocessing")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    rois = load_rois(args.rois) if args.rois else synthetic_rois()
+    with_ocr = not args.no_ocr and tesseract_available()
+    if not args.no_ocr and not with_ocr:
+        print("tesseract not found, reporting preprocessing time only")
+
+    results = run(rois, repeat=args.repeat, with_ocr=with_ocr)
+
+    print(f"{'profile':<10} {'mean ms':>9} {'p95 ms':>9} {'accuracy':>9}")
+    for profile, row in results.items():
+        accuracy = "-" if row["accuracy"] is None else f"{row['accuracy']:.3f}"
+        print(f"{profile:<10} {row['mean_ms']:>9.3f} {row['p95_ms']:>9.3f} {accuracy:>9}")
+    if "chosen_profiles" in results.get("auto", {}):
+        print(f"auto picked: {results['auto']['chosen_profiles']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
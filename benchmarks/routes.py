@@ -0,0 +1,179 @@
+# benchmarks/routes.py
+"""
+Time every route of routes/stats.py, routes/invoices.py and stats_routes.py
+against a seeded database, through the Flask test client (no server, no
+model: the app is assembled from the blueprints only).
+
+    python -m benchmarks.routes --invoices 100000
+    python -m benchmarks.routes --database postgresql://... --invoices 1000000 --route-repeat 3
+
+The database is seeded up to --invoices rows when it holds fewer (see
+benchmarks.seed_db). A route answering an error status is reported with
+its error instead of timings. The stats response cache is invalidated
+before every call, so the routes above time their queries; CACHED_ROUTES
+are also timed served from the cache, as a plain GET and as a revalidation
+answered with 304.
+"""
+import argparse
+
+from benchmarks.common import measure, print_results, use_database, write_results
+
+# (method, path, json body); {invoice_id} and {client} are filled in at run time
+ROUTES = [
+    ("GET", "/invoices", None),
+    ("GET", "/invoices?limit=100&count=false", None),
+    ("GET", "/invoices?status=overdue&min_amount=100&fields=id,total_amount", None),
+    ("GET", "/invoices/{invoice_id}", None),
+    ("PUT", "/invoices/{invoice_id}", "update"),
+    ("GET", "/clients", None),
+    ("GET", "/clients?sort=revenue&limit=100", None),
+    ("GET", "/stats/revenue-per-day?days=7", None),
+    ("GET", "/stats/revenue-per-day?days=90", None),
+    ("GET", "/stats/summary", None),
+    ("GET", "/stats/top-clients", None),
+    ("GET", "/stats/recent-invoices", None),
+    ("GET", "/stats/total-revenue", None),
+    ("GET", "/stats/revenue-per-company", None),
+    ("GET", "/api/stats/dashboard?period=all", None),
+    ("GET", "/api/stats/dashboard?period=month", None),
+    ("GET", "/api/stats/invoice-activity?period=30days", None),
+    ("GET", "/api/stats/invoice-activity?period=year", None),
+    ("GET", "/api/stats/top-clients?sortBy=revenue&limit=5", None),
+    ("GET", "/api/stats/top-clients?sortBy=count&limit=5", None),
+    ("GET", "/api/stats/client/{client}?period=all", None),
+    ("GET", "/api/stats/invoice-status?period=all", None),
+]
+
+# Stats routes also timed with a warm response cache
+CACHED_ROUTES = [
+    "/stats/summary",
+    "/api/stats/dashboard?period=all",
+]
+
+
+def create_app():
+    from flask import Flask
+
+    from database import init_app
+    from routes.invoices import invoices_bp
+    from routes.stats import stats_bp
+    from stats_routes import stats_bp as api_stats_bp
+
+    app = Flask(__name__)
+    init_app(app)
+    app.register_blueprint(invoices_bp)
+    app.register_blueprint(stats_bp)
+    app.register_blueprint(api_stats_bp, name="api_stats")
+    return app
+
+
+def _sample_invoice():
+    from sqlalchemy import func, select
+
+    from database import SessionLocal, Invoice
+
+    with SessionLocal() as db:
+        # Middle of the id range, away from both ends of any index
+        low, high = db.execute(select(func.min(Invoice.id), func.max(Invoice.id))).one()
+        invoice = db.get(Invoice, (low + high) // 2) or db.get(Invoice, high)
+        return invoice.id, invoice.customer_name
+
+
+def _update_payload(client, invoice_id: int) -> dict:
+    """Current values of the invoice in the PUT body, so the update is a no-op."""
+    invoice = client.get(f"/invoices/{invoice_id}").get_json()
+    item = invoice["items"][0] if invoice["items"] else {}
+    return {
+        "invoiceNumber": invoice["invoice_number"],
+        "companyName": invoice["company_name"],
+        "companyAddress": invoice["company_address"],
+        "clientName": invoice["customer_name"],
+        "clientAddress": invoice["customer_address"],
+        "date": invoice["invoice_date"],
+        "dueDate": invoice["due_date"],
+        "taxes": invoice["taxes"],
+        "total": invoice["total_amount"],
+        "description": item.get("description"),
+        "quantity": item.get("quantity"),
+        "unitPrice": item.get("unit_price"),
+        "amount": item.get("amount"),
+    }
+
+
+def _time_route(client, name: str, method: str, path: str, repeat: int, warmup: int,
+                body=None, headers=None, cached: bool = False) -> dict:
+    from utils.stats_cache import stats_cache
+
+    sizes = []
+
+    def call():
+        if not cached:
+            stats_cache.bump()
+        response = client.open(path, method=method, json=body, headers=headers)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{name} returned {response.status_code}: {response.get_data(as_text=True)[:200].strip()}")
+        sizes.append(len(response.get_data()))
+
+    try:
+        return {**measure(call, repeat, warmup), "response_bytes": sizes[-1]}
+    except RuntimeError as e:
+        # Kept in the results so that a route starting to fail shows up in comparisons
+        return {"error": str(e)}
+
+
+def run(repeat: int = 5, warmup: int = 1) -> dict:
+    app = create_app()
+    client = app.test_client()
+    invoice_id, customer = _sample_invoice()
+    bodies = {"update": _update_payload(client, invoice_id)}
+
+    results = {}
+    for method, template, body in ROUTES:
+        path = template.format(invoice_id=invoice_id, client=customer)
+        name = f"{method} {template}"
+        results[name] = _time_route(client, name, method, path, repeat, warmup, body=bodies.get(body))
+
+    for path in CACHED_ROUTES:
+        etag = client.get(path).headers.get("ETag")
+        name = f"GET {path} (cached)"
+        results[name] = _time_route(client, name, "GET", path, repeat, warmup, cached=True)
+        name = f"GET {path} (304)"
+        results[name] = _time_route(
+            client, name, "GET", path, repeat, warmup, headers={"If-None-Match": etag}, cached=True
+        )
+    return results
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--invoices", type=int, default=100_000, help="seed the database up to this many invoices")
+    parser.add_argument("--customers", type=int, default=5000)
+    parser.add_argument("--database", help="SQLAlchemy URL (default: BENCH_DATABASE_URL or a temp SQLite file)")
+    parser.add_argument("--route-repeat", type=int, default=5)
+
+
+def prepare_database(url: str | None, invoices: int, customers: int) -> tuple[str, int]:
+    from benchmarks.seed_db import invoice_count, seed
+
+    url = use_database(url)
+    existing = invoice_count()
+    if existing < invoices:
+        print(f"Seeding {invoices - existing} invoices into {url}")
+        seed(invoices - existing, customers=customers)
+    return url, max(existing, invoices)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    url, invoices = prepare_database(args.database, args.invoices, args.customers)
+    results = run(args.route_repeat)
+    print_results(results)
+    if args.json:
+        write_results(args.json, results, suite="routes", invoices=invoices, database=url.split("://")[0])
+
+
+if __name__ == "__main__":
+    main()
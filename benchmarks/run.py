@@ -0,0 +1,75 @@
+# benchmarks/run.py
+"""
+Run the whole benchmark suite (pipeline stages, then routes on a seeded
+database) and write a single JSON result file.
+
+    python -m benchmarks.run --json results/current.json
+    python -m benchmarks.run --json results/current.json --baseline results/main.json --threshold 0.15
+
+With --baseline the run is compared against a previous result file and the
+command exits with status 1 on regressions (see benchmarks.compare). Each
+suite runs in its own process, since the database URL is fixed when the app
+modules are imported.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks import compare, routes, stages
+from benchmarks.common import load_results, print_results, write_results
+
+
+def _run_suite(module: str, arguments: list[str]) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "results.json")
+        subprocess.run([sys.executable, "-m", module, *arguments, "--json", output], check=True)
+        return load_results(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    stages.add_arguments(parser)
+    routes.add_arguments(parser)
+    compare.add_arguments(parser)
+    parser.add_argument("--skip-stages", action="store_true")
+    parser.add_argument("--skip-routes", action="store_true")
+    parser.add_argument("--json", required=True, help="write the results to this file")
+    parser.add_argument("--baseline", help="previous result file to compare against")
+    args = parser.parse_args()
+
+    results = {}
+    meta = {"suite": "all"}
+    if not args.skip_stages:
+        stage_args = [
+            "--pages", str(args.pages), "--repeat", str(args.repeat), "--detector", args.detector,
+            "--stub-latency-ms", str(args.stub_latency_ms),
+            "--llm-ttft", str(args.llm_ttft), "--llm-tokens-per-s", str(args.llm_tokens_per_s),
+        ]
+        if args.only:
+            stage_args += ["--only", args.only]
+        results.update(_run_suite("benchmarks.stages", stage_args)["results"])
+    if not args.skip_routes:
+        route_args = [
+            "--invoices", str(args.invoices), "--customers", str(args.customers),
+            "--route-repeat", str(args.route_repeat),
+        ]
+        if args.database:
+            route_args += ["--database", args.database]
+        document = _run_suite("benchmarks.routes", route_args)
+        results.update(document["results"])
+        meta.update(invoices=document["meta"]["invoices"], database=document["meta"]["database"])
+
+    print()
+    print_results(results)
+    write_results(args.json, results, **meta)
+
+    if args.baseline:
+        print()
+        if not compare.check(args.baseline, args.json, args.threshold, args.metric, args.min_delta_ms):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
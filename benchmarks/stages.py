@@ -0,0 +1,255 @@
+# benchmarks/stages.py
+"""
+Benchmark each stage of the OCR pipeline on synthetic invoices, without
+network or GPU:
+
+  preprocess.<profile>  preprocess_image on the text-line ROIs of a page
+  rasterize             one PDF page rendered by poppler (skipped if missing)
+  detection             resize + detector on a page; "stub" finds text lines
+                        with OpenCV, or pass --detector saved_model/tflite
+  tesseract             ocr_rois on the ROIs of a page (skipped if missing)
+  fast_extract          rule-based field extraction on the OCR text
+  llm                   chat_json against a local fake ollama server
+  db.save_invoice       save_invoice_to_db on a scratch SQLite database
+  db.save_invoices_bulk save_invoices_bulk on --pages x 8 invoices
+
+    python -m benchmarks.stages
+    python -m benchmarks.stages --only preprocess,llm --json stages.json
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.common import measure, print_results, use_database, write_results
+from benchmarks.synthetic import (
+    degrade, encode_pdf, invoice_record, line_boxes, ocr_text, render_invoice,
+)
+
+STAGES = ("preprocess", "rasterize", "detection", "tesseract", "fast_extract", "llm", "db")
+
+
+def make_pages(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    records = [invoice_record(rng, i) for i in range(count)]
+    pages = [degrade(render_invoice(record), rng) for record in records]
+    return records, pages
+
+
+def bench_preprocess(pages, repeat: int) -> dict:
+    from utils.ocr_engine import crop_rois
+    from utils.ocr_utils import PREPROCESS_PROFILES, preprocess_image
+
+    rois = [roi for page in pages for roi in crop_rois(page, line_boxes(page))]
+    results = {}
+    for profile in PREPROCESS_PROFILES + ("auto",):
+        def run():
+            for roi in rois:
+                preprocess_image(roi, profile)
+
+        results[f"preprocess.{profile}"] = {**measure(run, repeat), "rois": len(rois)}
+    return results
+
+
+def bench_rasterize(pages, repeat: int) -> dict:
+    from pipeline import POPPLER_PATH, render_pdf_page
+
+    if shutil.which("pdftoppm") is None and not os.path.isdir(POPPLER_PATH):
+        return {"rasterize": {"skipped": "poppler not found"}}
+    pdf = encode_pdf(pages[:1])
+    return {"rasterize": measure(lambda: render_pdf_page(pdf, 1), repeat)}
+
+
+class StubDetector:
+    """
+    Detector stand-in with the interface of utils.detectors.Detector: boxes
+    come from the OpenCV text-line finder, plus an optional fixed latency to
+    mimic a model.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+
+    def load(self):
+        return self
+
+    def detect_batch(self, batch) -> dict:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        per_image = [line_boxes(image) for image in batch]
+        size = max((len(boxes) for boxes in per_image), default=0)
+        boxes = np.zeros((len(batch), size, 4), dtype=np.float32)
+        scores = np.zeros((len(batch), size), dtype=np.float32)
+        for i, image_boxes in enumerate(per_image):
+            boxes[i, :len(image_boxes)] = image_boxes
+            scores[i, :len(image_boxes)] = 1.0
+        return {
+            "num_detections": np.array([len(b) for b in per_image], dtype=np.float32),
+            "detection_boxes": boxes,
+            "detection_scores": scores,
+            "detection_classes": np.ones((len(batch), size), dtype=np.float32),
+        }
+
+
+def bench_detection(pages, repeat: int, backend: str, latency_ms: float) -> dict:
+    from pipeline import DETECTION_LONG_EDGE
+    from utils.detection import resize_for_detection
+
+    if backend == "stub":
+        detector = StubDetector(latency_ms).load()
+    else:
+        from utils.detectors import create_detector
+
+        try:
+            detector = create_detector(backend).load()
+        except Exception as e:
+            return {"detection": {"skipped": f"{backend} detector unavailable: {e}"}}
+
+    def run():
+        for page in pages:
+            image = resize_for_detection(page, DETECTION_LONG_EDGE)
+            detector.detect_batch(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)[np.newaxis, ...])
+
+    return {"detection": {**measure(run, repeat), "backend": detector.name, "pages": len(pages)}}
+
+
+def bench_tesseract(pages, repeat: int) -> dict:
+    if shutil.which("tesseract") is None:
+        return {"tesseract": {"skipped": "tesseract not found"}}
+    from utils.ocr_engine import crop_rois, ocr_rois
+
+    page_rois = [crop_rois(page, line_boxes(page)) for page in pages]
+
+    def run():
+        for rois in page_rois:
+            ocr_rois(rois)
+
+    return {"tesseract": {**measure(run, repeat), "pages": len(pages)}}
+
+
+def bench_fast_extract(records, repeat: int) -> dict:
+    from utils.fast_extract import extract_fields
+
+    texts = [ocr_text(record) for record in records]
+
+    def run():
+        for text in texts:
+            extract_fields(text)
+
+    return {"fast_extract": {**measure(run, repeat), "documents": len(texts)}}
+
+
+def bench_llm(records, repeat: int, ttft: float, tokens_per_s: float) -> dict:
+    from benchmarks.fake_ollama import FakeOllamaServer
+    from pipeline import LLM_MODEL, PROMPT
+    from utils.llm import chat_json
+
+    prompt = PROMPT + ocr_text(records[0])
+    with FakeOllamaServer(ttft=ttft, tokens_per_s=tokens_per_s) as server:
+        # The ollama client reads OLLAMA_HOST when it is first imported
+        os.environ["OLLAMA_HOST"] = server.url
+        try:
+            summary = measure(lambda: chat_json(LLM_MODEL, prompt), repeat)
+        except Exception as e:
+            return {"llm": {"skipped": f"ollama client unavailable: {e}"}}
+    return {"llm": {**summary, "ttft_s": ttft, "tokens_per_s": tokens_per_s}}
+
+
+def bench_db(records, repeat: int, bulk_factor: int = 8) -> dict:
+    import json
+
+    from crud import save_invoice_to_db, save_invoices_bulk
+    from database import create_tables
+
+    create_tables()
+    payloads = [(record, ocr_text(record), json.dumps(record)) for record in records]
+
+    def run():
+        for record, text, raw_json in payloads:
+            if save_invoice_to_db(record, text, raw_json) is None:
+                raise RuntimeError("save_invoice_to_db failed")
+
+    entries = [
+        {"invoice_data": record, "raw_text": text, "raw_json": raw_json}
+        for record, text, raw_json in payloads
+    ] * bulk_factor
+
+    def run_bulk():
+        _, failures = save_invoices_bulk(entries)
+        if failures:
+            raise RuntimeError(f"save_invoices_bulk failed: {failures[0]['error']}")
+
+    return {
+        "db.save_invoice": {**measure(run, repeat), "invoices": len(payloads)},
+        "db.save_invoices_bulk": {**measure(run_bulk, repeat), "invoices": len(entries)},
+    }
+
+
+def run(stages, pages_count: int = 2, repeat: int = 5, detector: str = "stub",
+        stub_latency_ms: float = 0.0, llm_ttft: float = 0.05, llm_tokens_per_s: float = 200.0) -> dict:
+    records, pages = make_pages(pages_count)
+    results = {}
+    if "preprocess" in stages:
+        results.update(bench_preprocess(pages, repeat))
+    if "rasterize" in stages:
+        results.update(bench_rasterize(pages, repeat))
+    if "detection" in stages:
+        results.update(bench_detection(pages, repeat, detector, stub_latency_ms))
+    if "tesseract" in stages:
+        results.update(bench_tesseract(pages, repeat))
+    if "fast_extract" in stages:
+        results.update(bench_fast_extract(records, repeat))
+    if "llm" in stages:
+        results.update(bench_llm(records, repeat, llm_ttft, llm_tokens_per_s))
+    if "db" in stages:
+        results.update(bench_db(records, repeat))
+    return results
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--only", help=f"comma-separated stages among {', '.join(STAGES)}")
+    parser.add_argument("--pages", type=int, default=2, help="synthetic invoice pages per run")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--detector", default="stub", help="stub, saved_model or tflite")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0)
+    parser.add_argument("--llm-ttft", type=float, default=0.05)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=200.0)
+
+
+def selected_stages(only: str | None) -> tuple:
+    if not only:
+        return STAGES
+    stages = tuple(stage.strip() for stage in only.split(",") if stage.strip())
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"Unknown stages: {', '.join(sorted(unknown))}")
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    # save_invoice_to_db writes to a scratch database, never to DATABASE_URL
+    scratch = os.path.join(tempfile.mkdtemp(prefix="bench-stages-"), "stages.db")
+    use_database(f"sqlite:///{scratch}")
+
+    results = run(
+        selected_stages(args.only), args.pages, args.repeat, args.detector,
+        args.stub_latency_ms, args.llm_ttft, args.llm_tokens_per_s,
+    )
+    print_results(results)
+    if args.json:
+        write_results(args.json, results, suite="stages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# benchmarks/synthetic.py
+"""
+Synthetic invoices for the benchmarks: field dicts shaped like the LLM output,
+rendered invoice images, PDFs and the OCR-like text the pipeline produces.
+"""
+import datetime
+import io
+
+import cv2
+import numpy as np
+
+COMPANIES = [
+    "Acme Consulting SARL", "Blue Harbor Logistics", "Nordic Paper Supply",
+    "Atelier Dupont", "Greenfield Software", "Maison Lefevre & Fils",
+    "Orion Electrical", "Studio Graphique Lumen",
+]
+STREETS = ["Rue de la Paix", "Main Street", "Avenue Victor Hugo", "Harbour Road", "Boulevard Voltaire"]
+CITIES = ["75002 Paris", "69003 Lyon", "London EC1A 1BB", "13001 Marseille", "Bruxelles 1000"]
+SERVICES = [
+    "Consulting services", "Software license", "Maintenance contract", "Printer paper A4",
+    "Cable installation", "Logo design", "Transport Paris-Lyon", "Support hours",
+]
+
+
+def _address(rng: np.random.Generator) -> str:
+    return f"{rng.integers(1, 200)} {rng.choice(STREETS)}, {rng.choice(CITIES)}"
+
+
+def invoice_record(rng: np.random.Generator, index: int, customers: int = 500,
+                   today: datetime.date | None = None, max_age_days: int = 730) -> dict:
+    """One invoice as returned by the LLM (same keys as INVOICE_FIELDS)."""
+    today = today or datetime.date.today()
+    invoice_date = today - datetime.timedelta(days=int(rng.integers(0, max_age_days)))
+    items = int(rng.integers(1, 5))
+    quantities = rng.integers(1, 20, items)
+    unit_prices = np.round(rng.uniform(5, 900, items), 2)
+    amounts = np.round(quantities * unit_prices, 2)
+    subtotal = float(amounts.sum())
+    taxes = round(subtotal * 0.2, 2)
+    return {
+        "Company Name": str(rng.choice(COMPANIES)),
+        "Company Address": _address(rng),
+        "Customer Name": f"Client {int(rng.integers(0, customers)):05d}",
+        "Customer Address": _address(rng),
+        "Invoice Number": f"INV-{invoice_date.year}-{index:06d}",
+        "Invoice Date": invoice_date.isoformat(),
+        "Due Date": (invoice_date + datetime.timedelta(days=30)).isoformat(),
+        "Description": [str(d) for d in rng.choice(SERVICES, items)],
+        "Quantity": [str(int(q)) for q in quantities],
+        "Unit Price": [f"{p:.2f}" for p in unit_prices],
+        "Amount": [f"{a:.2f}" for a in amounts],
+        "Taxes": f"{taxes:.2f}",
+        "Total": f"{subtotal + taxes:.2f}",
+    }
+
+
+def invoice_lines(record: dict) -> list[str]:
+    """The text lines printed on the invoice, top to bottom."""
+    lines = [
+        record["Company Name"],
+        record["Company Address"],
+        f"Invoice No: {record['Invoice Number']}",
+        f"Invoice Date: {record['Invoice Date']}",
+        f"Due Date: {record['Due Date']}",
+        f"Bill to: {record['Customer Name']}",
+        record["Customer Address"],
+    ]
+    for description, quantity, price, amount in zip(
+        record["Description"], record["Quantity"], record["Unit Price"], record["Amount"]
+    ):
+        lines.append(f"{description}  {quantity} x {price}  {amount}")
+    lines.append(f"VAT (20%): {record['Taxes']}")
+    lines.append(f"Total: {record['Total']} EUR")
+    return lines
+
+
+def ocr_text(record: dict) -> str:
+    """Text as the OCR stage joins it (one ROI per printed line)."""
+    from pipeline import TEXT_SEPARATOR
+
+    return TEXT_SEPARATOR.join(invoice_lines(record))
+
+
+def render_invoice(record: dict, width: int = 1654, height: int = 2339) -> np.ndarray:
+    """Render the invoice as a BGR page (A4 at 200 dpi by default)."""
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    scale = width / 1400
+    y = int(height * 0.06)
+    step = int(70 * scale)
+    for i, line in enumerate(invoice_lines(record)):
+        if i == 7:
+            # Gap between the header block and the items table
+            y += step
+        cv2.putText(page, line, (int(width * 0.08), y), font, scale, (0, 0, 0), 2, cv2.LINE_AA)
+        y += step
+    return page
+
+
+def degrade(image: np.ndarray, rng: np.random.Generator, noise: float = 12.0) -> np.ndarray:
+    """Scanner-like noise and a slight blur."""
+    noisy = image.astype(np.float32) + rng.normal(0, noise, image.shape)
+    return cv2.GaussianBlur(np.clip(noisy, 0, 255).astype(np.uint8), (3, 3), 0.8)
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    ok, buffer = cv2.imencode(".png", image)
+    if not ok:
+        raise ValueError("Could not encode image")
+    return buffer.tobytes()
+
+
+def encode_pdf(pages: list[np.ndarray], dpi: int = 200) -> bytes:
+    from PIL import Image
+
+    images = [Image.fromarray(cv2.cvtColor(page, cv2.COLOR_BGR2RGB)) for page in pages]
+    output = io.BytesIO()
+    images[0].save(output, format="PDF", save_all=True, append_images=images[1:], resolution=dpi)
+    return output.getvalue()
+
+
+def line_boxes(image: np.ndarray) -> np.ndarray:
+    """
+    Normalized (ymin, xmin, ymax, xmax) boxes around the text lines, found
+    with a morphological close. Stands in for the detector's output.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(15, gray.shape[1] // 40), 3))
+    closed = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    height, width = gray.shape[:2]
+    boxes = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w < width * 0.02 or h < 8:
+            continue
+        pad = 4
+        boxes.append([
+            max(0, y - pad) / height, max(0, x - pad) / width,
+            min(height, y + h + pad) / height, min(width, x + w + pad) / width,
+        ])
+    boxes.sort()
+    return np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
@@ -1,68 +1,512 @@
 # crud.py
-from database import Invoice, InvoiceItem, get_db
-from sqlalchemy.orm import Session
-from utils.ocr_utils import safe_parse_float
+import datetime
 
+from database import Client, Invoice, InvoiceDailyStats, InvoiceFileHash, InvoiceItem, get_db
+from sqlalchemy import Date, case, cast, delete, func, insert, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, aliased
+from utils.metrics import DB_ERRORS
+from utils.ocr_utils import client_key, parse_date, safe_parse_float
+from utils.result_cache import result_cache
+from utils.stats_cache import stats_cache
 
-def save_invoice_to_db(invoice_data: dict, raw_text: str, raw_json: str) -> int | None:
+
+INVOICE_STATUSES = ("paid", "pending", "overdue")
+
+
+def invoice_status(total_amount, due_date: datetime.date | None, today: datetime.date | None = None) -> str:
+    """
+    Status of an invoice from its data: paid when nothing is due (no or a
+    zero total), overdue once the due date has passed, pending otherwise.
+    """
+    if total_amount is None or float(total_amount) <= 0:
+        return "paid"
+    today = today or datetime.datetime.utcnow().date()
+    if due_date is not None and due_date < today:
+        return "overdue"
+    return "pending"
+
+
+def _invoice_row(invoice_data: dict, raw_text: str, raw_json: str) -> dict:
+    invoice_date = invoice_data.get("Invoice Date", "")
+    due_date = invoice_data.get("Due Date", "")
+    customer_name = invoice_data.get("Customer Name", "")
+    total_amount = safe_parse_float(invoice_data.get("Total"))
+    due_date_parsed = parse_date(due_date)
+    created_at = datetime.datetime.utcnow()
+    status = invoice_status(total_amount, due_date_parsed, created_at.date())
+    return {
+        "company_name": invoice_data.get("Company Name", ""),
+        "company_address": invoice_data.get("Company Address", ""),
+        "customer_name": customer_name,
+        "customer_address": invoice_data.get("Customer Address", ""),
+        "client_key": client_key(customer_name),
+        "invoice_number": invoice_data.get("Invoice Number", ""),
+        "invoice_date": invoice_date,
+        "due_date": due_date,
+        "invoice_date_parsed": parse_date(invoice_date),
+        "due_date_parsed": due_date_parsed,
+        "total_amount": total_amount,
+        "taxes": safe_parse_float(invoice_data.get("Taxes")),
+        "status": status,
+        "paid_at": created_at if status == "paid" else None,
+        "raw_text": raw_text,
+        "raw_json": raw_json,
+        "created_at": created_at,
+    }
+
+
+def _item_rows(invoice_data: dict) -> list[dict]:
+    """Item rows of an invoice, without their invoice_id."""
+    if not isinstance(invoice_data.get("Description"), list):
+        return [{
+            "description": invoice_data.get("Description", ""),
+            "quantity": safe_parse_float(invoice_data.get("Quantity")),
+            "unit_price": safe_parse_float(invoice_data.get("Unit Price")),
+            "amount": safe_parse_float(invoice_data.get("Amount")),
+        }]
+
+    descriptions = invoice_data.get("Description", [])
+    quantities = invoice_data.get("Quantity", [])
+    unit_prices = invoice_data.get("Unit Price", [])
+    amounts = invoice_data.get("Amount", [])
+    return [
+        {
+            "description": descriptions[i],
+            "quantity": safe_parse_float(quantities[i]) if i < len(quantities) else None,
+            "unit_price": safe_parse_float(unit_prices[i]) if i < len(unit_prices) else None,
+            "amount": safe_parse_float(amounts[i]) if i < len(amounts) else None,
+        }
+        for i in range(len(descriptions))
+    ]
+
+
+def _dialect_name(db) -> str:
+    """Database dialect of a Session or a Connection."""
+    return (db.get_bind() if isinstance(db, Session) else db).dialect.name
+
+
+def _upsert_insert(db, model):
+    """INSERT supporting ON CONFLICT for the session's database, or None."""
+    dialect = _dialect_name(db)
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    return None
+
+
+def _upsert_file_hashes(db: Session, rows: list[dict]):
+    """Point each file hash at its (new) invoice, inserting or updating in one statement."""
+    if not rows:
+        return
+    statement = _upsert_insert(db, InvoiceFileHash)
+    if statement is not None:
+        statement = statement.on_conflict_do_update(
+            index_elements=[InvoiceFileHash.file_hash],
+            set_={"invoice_id": statement.excluded.invoice_id},
+        )
+        db.execute(statement, rows)
+        return
+    for row in rows:
+        db.merge(InvoiceFileHash(**row))
+
+
+def _clean_address(address) -> str:
+    address = address.strip() if isinstance(address, str) else ""
+    return "" if address.lower() == "null" else address
+
+
+def _client_name(name) -> str:
+    # Displayed name of a client: the trimmed name of its latest invoice
+    return name.strip() if isinstance(name, str) else ""
+
+
+def _client_deltas(invoice_rows: list[dict]) -> list[dict]:
+    """What the invoice rows add to each client, one row per client key."""
+    clients = {}
+    for row in invoice_rows:
+        key = row.get("client_key")
+        if not key:
+            continue
+        amount = row.get("total_amount") or 0.0
+        created_at = row["created_at"]
+        client = clients.get(key)
+        if client is None:
+            clients[key] = {
+                "key": key,
+                "name": _client_name(row.get("customer_name")),
+                "address": _clean_address(row.get("customer_address")),
+                "invoice_count": 1,
+                "total_value": amount,
+                "first_invoice_at": created_at,
+                "last_invoice_at": created_at,
+            }
+            continue
+        client["invoice_count"] += 1
+        client["total_value"] += amount
+        client["first_invoice_at"] = min(client["first_invoice_at"], created_at)
+        if created_at >= client["last_invoice_at"]:
+            client["last_invoice_at"] = created_at
+            client["name"] = _client_name(row.get("customer_name")) or client["name"]
+            client["address"] = _clean_address(row.get("customer_address")) or client["address"]
+    return list(clients.values())
+
+
+def _add_to_clients(db: Session, invoice_rows: list[dict]):
+    """
+    Add new invoices to the totals of their clients, creating the clients
+    seen for the first time. The increments happen in the upsert itself, so
+    concurrent writers never lose an update.
+    """
+    deltas = _client_deltas(invoice_rows)
+    if not deltas:
+        return
+    statement = _upsert_insert(db, Client)
+    if statement is not None:
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(
+            index_elements=[Client.key],
+            set_={
+                "name": case((excluded.last_invoice_at >= Client.last_invoice_at, excluded.name), else_=Client.name),
+                "address": case((excluded.address != "", excluded.address), else_=Client.address),
+                "invoice_count": Client.invoice_count + excluded.invoice_count,
+                "total_value": Client.total_value + excluded.total_value,
+                "first_invoice_at": case(
+                    (Client.first_invoice_at <= excluded.first_invoice_at, Client.first_invoice_at),
+                    else_=excluded.first_invoice_at,
+                ),
+                "last_invoice_at": case(
+                    (Client.last_invoice_at >= excluded.last_invoice_at, Client.last_invoice_at),
+                    else_=excluded.last_invoice_at,
+                ),
+            },
+        )
+        db.execute(statement, deltas)
+        return
+    for delta in deltas:
+        client = db.query(Client).filter(Client.key == delta["key"]).with_for_update().first()
+        if client is None:
+            db.add(Client(**delta))
+            continue
+        if client.last_invoice_at is None or delta["last_invoice_at"] >= client.last_invoice_at:
+            client.name = delta["name"]
+        client.address = delta["address"] or client.address
+        client.invoice_count += delta["invoice_count"]
+        client.total_value += delta["total_value"]
+        client.first_invoice_at = min(filter(None, (client.first_invoice_at, delta["first_invoice_at"])))
+        client.last_invoice_at = max(filter(None, (client.last_invoice_at, delta["last_invoice_at"])))
+
+
+def _client_totals():
+    """SELECT of the clients table columns, computed from the invoices."""
+    latest = aliased(Invoice)
+    latest_name = (
+        select(func.trim(latest.customer_name))
+        .where(latest.client_key == Invoice.client_key)
+        .order_by(latest.created_at.desc(), latest.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    return select(
+        Invoice.client_key,
+        latest_name,
+        func.coalesce(func.max(Invoice.customer_address), ""),
+        func.count(Invoice.id),
+        func.coalesce(func.sum(Invoice.total_amount), 0.0),
+        func.min(Invoice.created_at),
+        func.max(Invoice.created_at),
+    ).where(Invoice.client_key.is_not(None)).group_by(Invoice.client_key)
+
+
+CLIENT_COLUMNS = ["key", "name", "address", "invoice_count", "total_value", "first_invoice_at", "last_invoice_at"]
+
+
+def refresh_clients(db: Session, keys):
+    """
+    Recompute the given clients from their invoices (an edited invoice may
+    move from one client to another, or change amount). Clients left
+    without invoices are removed. Runs in the caller's transaction.
+    """
+    keys = {key for key in keys if key}
+    if not keys:
+        return
+    rows = db.execute(_client_totals().where(Invoice.client_key.in_(keys))).all()
+    for row in rows:
+        values = dict(zip(CLIENT_COLUMNS, row))
+        client = db.query(Client).filter(Client.key == values["key"]).first()
+        if client is None:
+            db.add(Client(**values))
+            continue
+        for column, value in values.items():
+            setattr(client, column, value)
+    missing = keys - {row[0] for row in rows}
+    if missing:
+        db.execute(delete(Client).where(Client.key.in_(missing)))
+
+
+def rebuild_clients(db):
+    """Rebuild the whole clients table from the invoices (db: Session or Connection)."""
+    db.execute(delete(Client))
+    db.execute(insert(Client).from_select(CLIENT_COLUMNS, _client_totals()))
+
+
+def _daily_stats_deltas(added, removed) -> list[dict]:
+    """What adding and removing the invoice rows changes, per rollup row."""
+    deltas = {}
+    for sign, rows in ((1, added), (-1, removed)):
+        for row in rows:
+            if not row.get("created_at"):
+                continue
+            key = (row["created_at"].date(), row.get("company_name") or "", row.get("client_key") or "")
+            delta = deltas.setdefault(key, {
+                "day": key[0], "company_name": key[1], "client_key": key[2],
+                "invoice_count": 0, "total_amount": 0.0, "null_total_count": 0,
+            })
+            amount = row.get("total_amount")
+            delta["invoice_count"] += sign
+            delta["total_amount"] += sign * (float(amount) if amount is not None else 0.0)
+            delta["null_total_count"] += sign * (amount is None)
+    # A total going from None to 0 (or back) only moves null_total_count
+    return [
+        delta for delta in deltas.values()
+        if delta["invoice_count"] or delta["total_amount"] or delta["null_total_count"]
+    ]
+
+
+def update_daily_stats(db: Session, added=(), removed=()):
+    """
+    Apply invoice rows added and removed (an edit removes the old version
+    and adds the new one) to the invoice_daily_stats rollup, in the
+    caller's transaction. Each row needs created_at, company_name,
+    client_key and total_amount.
+    """
+    deltas = _daily_stats_deltas(added, removed)
+    if not deltas:
+        return
+    statement = _upsert_insert(db, InvoiceDailyStats)
+    if statement is not None:
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(
+            index_elements=[InvoiceDailyStats.day, InvoiceDailyStats.company_name, InvoiceDailyStats.client_key],
+            set_={
+                "invoice_count": InvoiceDailyStats.invoice_count + excluded.invoice_count,
+                "total_amount": InvoiceDailyStats.total_amount + excluded.total_amount,
+                "null_total_count": InvoiceDailyStats.null_total_count + excluded.null_total_count,
+            },
+        )
+        db.execute(statement, deltas)
+    else:
+        for delta in deltas:
+            key = (delta["day"], delta["company_name"], delta["client_key"])
+            stats = db.get(InvoiceDailyStats, key, with_for_update=True)
+            if stats is None:
+                db.add(InvoiceDailyStats(**delta))
+                continue
+            stats.invoice_count += delta["invoice_count"]
+            stats.total_amount += delta["total_amount"]
+            stats.null_total_count += delta["null_total_count"]
+        db.flush()
+    if removed:
+        # Drop the rows left empty
+        keys = [(delta["day"], delta["company_name"], delta["client_key"]) for delta in deltas]
+        db.execute(delete(InvoiceDailyStats).where(
+            tuple_(InvoiceDailyStats.day, InvoiceDailyStats.company_name, InvoiceDailyStats.client_key).in_(keys),
+            InvoiceDailyStats.invoice_count <= 0,
+        ))
+
+
+def rebuild_daily_stats(db):
+    """Rebuild the whole invoice_daily_stats rollup from the invoices (db: Session or Connection)."""
+    # CAST(... AS DATE) on SQLite keeps only the year: use date() there
+    if _dialect_name(db) == "sqlite":
+        day = func.date(Invoice.created_at)
+    else:
+        day = cast(Invoice.created_at, Date)
+    company_name = func.coalesce(Invoice.company_name, "")
+    client = func.coalesce(Invoice.client_key, "")
+    totals = (
+        select(
+            day,
+            company_name,
+            client,
+            func.count(Invoice.id),
+            func.coalesce(func.sum(Invoice.total_amount), 0.0),
+            func.count(Invoice.id) - func.count(Invoice.total_amount),
+        )
+        .where(Invoice.created_at.is_not(None))
+        .group_by(day, company_name, client)
+    )
+    db.execute(delete(InvoiceDailyStats))
+    db.execute(insert(InvoiceDailyStats).from_select(
+        ["day", "company_name", "client_key", "invoice_count", "total_amount", "null_total_count"], totals
+    ))
+
+
+def invoice_stats_row(invoice: Invoice) -> dict:
+    """The columns of an invoice that the clients and daily stats depend on."""
+    return {
+        "created_at": invoice.created_at,
+        "company_name": invoice.company_name,
+        "client_key": invoice.client_key,
+        "total_amount": invoice.total_amount,
+    }
+
+
+def save_invoice_to_db(
+    invoice_data: dict, raw_text: str, raw_json: str, file_hash: str | None = None
+) -> int | None:
+    """
+    Save an invoice, its items, its file hash, its client's totals and the
+    daily stats in a single transaction.
+    The flush assigns the invoice id without committing, so a failure never
+    leaves an invoice without its items.
+    """
     db_gen = get_db()
     db: Session = next(db_gen)
     try:
-        new_invoice = Invoice(
-            company_name=invoice_data.get("Company Name", ""),
-            company_address=invoice_data.get("Company Address", ""),
-            customer_name=invoice_data.get("Customer Name", ""),
-            customer_address=invoice_data.get("Customer Address", ""),
-            invoice_number=invoice_data.get("Invoice Number", ""),
-            invoice_date=invoice_data.get("Invoice Date", ""),
-            due_date=invoice_data.get("Due Date", ""),
-            total_amount=safe_parse_float(invoice_data.get("Total")),
-            taxes=safe_parse_float(invoice_data.get("Taxes")),
-            raw_text=raw_text,
-            raw_json=raw_json,
-        )
-
+        row = _invoice_row(invoice_data, raw_text, raw_json)
+        new_invoice = Invoice(**row)
         db.add(new_invoice)
-        db.commit()
-        db.refresh(new_invoice)
-
-        # Handle items
-        if isinstance(invoice_data.get("Description"), list):
-            descriptions = invoice_data.get("Description", [])
-            quantities = invoice_data.get("Quantity", [])
-            unit_prices = invoice_data.get("Unit Price", [])
-            amounts = invoice_data.get("Amount", [])
-
-            for i in range(len(descriptions)):
-                item = InvoiceItem(
-                    invoice_id=new_invoice.id,
-                    description=descriptions[i] if i < len(descriptions) else None,
-                    quantity=(
-                        safe_parse_float(quantities[i]) if i < len(quantities) else None
-                    ),
-                    unit_price=(
-                        safe_parse_float(unit_prices[i])
-                        if i < len(unit_prices)
-                        else None
-                    ),
-                    amount=safe_parse_float(amounts[i]) if i < len(amounts) else None,
-                )
-                db.add(item)
-        else:
-            item = InvoiceItem(
-                invoice_id=new_invoice.id,
-                description=invoice_data.get("Description", ""),
-                quantity=safe_parse_float(invoice_data.get("Quantity")),
-                unit_price=safe_parse_float(invoice_data.get("Unit Price")),
-                amount=safe_parse_float(invoice_data.get("Amount")),
-            )
-            db.add(item)
+        db.flush()
+
+        items = _item_rows(invoice_data)
+        if items:
+            db.execute(insert(InvoiceItem), [{**item, "invoice_id": new_invoice.id} for item in items])
 
+        if file_hash:
+            # upsert so a forced reprocessing points the hash at the new invoice
+            _upsert_file_hashes(db, [{"file_hash": file_hash, "invoice_id": new_invoice.id}])
+
+        _add_to_clients(db, [row])
+        update_daily_stats(db, added=[row])
         db.commit()
+        stats_cache.bump()
         return new_invoice.id
     except Exception as e:
         db.rollback()
+        DB_ERRORS.inc(operation="save_invoice")
         print(f"Error saving invoice to DB: {str(e)}")
         return None
     finally:
         db.close()
+
+
+def _insert_invoices(db: Session, rows: list[dict]) -> list[int]:
+    """
+    Insert the invoices with their items and file hashes (executemany with
+    RETURNING for the ids), and add them to their clients and to the daily
+    stats. Each row holds
+    "invoice", "items" and "file_hash". Returns the new ids, in row order.
+    """
+    result = db.execute(
+        insert(Invoice).returning(Invoice.id, sort_by_parameter_order=True),
+        [row["invoice"] for row in rows],
+    )
+    ids = list(result.scalars())
+
+    items = [
+        {**item, "invoice_id": invoice_id}
+        for row, invoice_id in zip(rows, ids)
+        for item in row["items"]
+    ]
+    if items:
+        db.execute(insert(InvoiceItem), items)
+    _upsert_file_hashes(db, [
+        {"file_hash": row["file_hash"], "invoice_id": invoice_id}
+        for row, invoice_id in zip(rows, ids)
+        if row["file_hash"]
+    ])
+    _add_to_clients(db, [row["invoice"] for row in rows])
+    update_daily_stats(db, added=[row["invoice"] for row in rows])
+    return ids
+
+
+def save_invoices_bulk(invoices: list[dict]) -> tuple[list[int | None], list[dict]]:
+    """
+    Persist many invoices at once. Each entry is a dict with "invoice_data",
+    "raw_text", "raw_json" and optionally "file_hash".
+
+    All rows go in one transaction with bulk INSERTs. If that transaction
+    fails, the rows are retried one by one, each in its own savepoint, so
+    that a bad row only fails itself. Returns (ids, failures): ids follows
+    the input order with None for rows that were not saved, and failures
+    lists {"index", "error"} for each of them.
+    """
+    ids = [None] * len(invoices)
+    failures = []
+    rows = {}
+    for index, entry in enumerate(invoices):
+        try:
+            invoice_data = entry["invoice_data"]
+            rows[index] = {
+                "invoice": _invoice_row(invoice_data, entry.get("raw_text"), entry.get("raw_json")),
+                "items": _item_rows(invoice_data),
+                "file_hash": entry.get("file_hash"),
+            }
+        except Exception as e:
+            failures.append({"index": index, "error": f"Invalid invoice data: {str(e)}"})
+    if not rows:
+        return ids, failures
+
+    db_gen = get_db()
+    db: Session = next(db_gen)
+    try:
+        try:
+            for index, invoice_id in zip(rows, _insert_invoices(db, list(rows.values()))):
+                ids[index] = invoice_id
+            db.commit()
+        except Exception:
+            db.rollback()
+            ids = [None] * len(invoices)
+            for index, row in rows.items():
+                try:
+                    with db.begin_nested():
+                        ids[index] = _insert_invoices(db, [row])[0]
+                except Exception as e:
+                    # The driver error, without the SQL and parameters SQLAlchemy appends
+                    failures.append({"index": index, "error": str(getattr(e, "orig", None) or e)})
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        ids = [None] * len(invoices)
+        failures = [{"index": index, "error": str(e)} for index in range(len(invoices))]
+    finally:
+        db.close()
+        stats_cache.bump()
+
+    failures.sort(key=lambda failure: failure["index"])
+    if failures:
+        DB_ERRORS.inc(len(failures), operation="save_invoices_bulk")
+        print(f"Error saving {len(failures)} of {len(invoices)} invoices to DB")
+    return ids, failures
+
+
+def delete_invoice_from_db(db: Session, invoice_id: int) -> bool:
+    """
+    Delete an invoice with its items and file hashes, and take it out of its
+    client, of the daily stats and of the result cache. Commits; returns
+    False when the invoice does not exist.
+    """
+    invoice = db.get(Invoice, invoice_id)
+    if invoice is None:
+        return False
+    try:
+        removed = invoice_stats_row(invoice)
+        file_hashes = db.scalars(
+            select(InvoiceFileHash.file_hash).where(InvoiceFileHash.invoice_id == invoice_id)
+        ).all()
+        db.execute(delete(InvoiceFileHash).where(InvoiceFileHash.invoice_id == invoice_id))
+        db.delete(invoice)
+        db.flush()
+        refresh_clients(db, {removed["client_key"]})
+        update_daily_stats(db, removed=[removed])
+        db.commit()
+        for file_hash in file_hashes:
+            result_cache.forget(file_hash)
+        stats_cache.bump()
+        return True
+    except Exception:
+        db.rollback()
+        DB_ERRORS.inc(operation="delete_invoice")
+        raise
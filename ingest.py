@@ -0,0 +1,465 @@
+# ingest.py
+"""
+Bulk ingestion: many documents run through decode -> detect -> OCR -> LLM ->
+DB as separate stages connected by bounded queues, each stage with its own
+concurrency, so that CPU-bound OCR overlaps with latency-bound LLM calls.
+
+Used by POST /ocr/batch and from the command line:
+
+    python -m ingest invoices/2024-03/
+    python -m ingest invoices/ --recursive --llm-workers 8 --journal march.jsonl
+
+Invoices are committed in small bulk inserts as soon as they leave the LLM
+stage (a bad row only fails itself), and the CLI appends each outcome to a journal file; rerunning the same
+command after a crash skips the files already ingested.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from crud import save_invoices_bulk
+from pipeline import (
+    TEXT_SEPARATOR, detect_boxes, extract_invoice_data, load_document, ocr_boxes, render_pdf_page,
+)
+from utils.metrics import timed_stage
+from utils.result_cache import hash_file, result_cache
+from utils.stage_pipeline import Stage, StagedPipeline
+from utils.upload_utils import guess_file_type
+
+INGEST_DECODE_WORKERS = int(os.environ.get("INGEST_DECODE_WORKERS", 2))
+INGEST_DETECT_WORKERS = int(os.environ.get("INGEST_DETECT_WORKERS", 2))
+INGEST_OCR_WORKERS = int(os.environ.get("INGEST_OCR_WORKERS", 2))
+INGEST_LLM_WORKERS = int(os.environ.get("INGEST_LLM_WORKERS", 4))
+INGEST_DB_WORKERS = int(os.environ.get("INGEST_DB_WORKERS", 1))
+# Invoices saved together by one bulk insert, waiting at most INGEST_DB_BATCH_WAIT_MS
+INGEST_DB_BATCH_SIZE = int(os.environ.get("INGEST_DB_BATCH_SIZE", 16))
+INGEST_DB_BATCH_WAIT_MS = float(os.environ.get("INGEST_DB_BATCH_WAIT_MS", 200))
+# Documents waiting between two stages
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", 8))
+# Rendered pages kept in memory between the decode and OCR stages, all
+# documents together (the queues count documents, not pages). Pages of a
+# document beyond this budget are rendered again when needed.
+INGEST_MAX_PAGES = int(os.environ.get("INGEST_MAX_PAGES", 32))
+INGEST_BATCH_RETENTION = int(os.environ.get("INGEST_BATCH_RETENTION", 100))
+
+
+class PageBudget:
+    """Counts rendered pages in flight; acquire(n) blocks until n pages are free."""
+
+    def __init__(self, pages: int):
+        self.pages = max(1, pages)
+        self.in_use = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, count: int) -> int:
+        count = min(count, self.pages)
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_use + count <= self.pages)
+            self.in_use += count
+        return count
+
+    def release(self, count: int):
+        if not count:
+            return
+        with self._condition:
+            self.in_use -= count
+            self._condition.notify_all()
+
+
+page_budget = PageBudget(INGEST_MAX_PAGES)
+
+
+class IngestItem:
+    def __init__(self, name: str, file_data: bytes, file_type: str, options: dict, batch):
+        self.name = name
+        self.file_data = file_data
+        self.file_type = file_type
+        self.options = options
+        self.batch = batch
+        self.file_hash = None
+        self.document = None
+        self.pages = None
+        self.page_permits = 0
+        self.boxes = None
+        self.texts = None
+        self.invoice_data = None
+        self.json_part = None
+        self.invoice_id = None
+        self.status = "failed"
+        self.stage = "queued"
+        self.error = None
+        self.done = False
+        self.timings = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "status": self.status,
+            "invoice_id": self.invoice_id,
+            "error": self.error,
+            "timings": self.timings,
+        }
+
+
+class IngestBatch:
+    """Progress of one set of documents submitted together."""
+
+    def __init__(self, total: int, on_item=None):
+        self.id = uuid.uuid4().hex
+        self.total = total
+        self.on_item = on_item
+        self.counts = {"succeeded": 0, "cached": 0, "failed": 0}
+        self.files = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        if total == 0:
+            self.finished_at = self.created_at
+            self._finished.set()
+
+    @property
+    def completed(self) -> int:
+        return sum(self.counts.values())
+
+    def record(self, item: IngestItem):
+        with self._lock:
+            self.counts[item.status] += 1
+            self.files.append(item.to_dict())
+            if self.completed >= self.total:
+                self.finished_at = time.time()
+                self._finished.set()
+        if self.on_item is not None:
+            self.on_item(item)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._finished.wait(timeout)
+
+    def docs_per_minute(self) -> float:
+        elapsed = (self.finished_at or time.time()) - self.created_at
+        return round(60 * self.completed / elapsed, 2) if elapsed > 0 else 0.0
+
+    def to_dict(self, include_files: bool = True) -> dict:
+        with self._lock:
+            result = {
+                "batch_id": self.id,
+                "status": "done" if self.finished_at else "running",
+                "total": self.total,
+                "completed": self.completed,
+                **self.counts,
+                "docs_per_minute": self.docs_per_minute(),
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+            if include_files:
+                result["files"] = list(self.files)
+        return result
+
+
+def _decode(item: IngestItem):
+    item.file_hash = hash_file(item.file_data)
+    cached = None if item.options.get("force") else result_cache.lookup(item.file_hash)
+    if cached is not None:
+        item.invoice_id = cached["invoice_id"]
+        item.status = "cached"
+        item.done = True
+        return
+    with timed_stage("decode"):
+        item.document = load_document(item.file_data, item.file_type, item.options.get("preprocess"))
+        if item.document["file_type"] == "pdf":
+            # Waits for room in the page budget before rendering anything
+            item.page_permits = page_budget.acquire(item.document["page_count"])
+            item.pages = [render_pdf_page(item.document["file_data"], number)
+                          for number in range(1, item.page_permits + 1)]
+            item.pages += [None] * (item.document["page_count"] - item.page_permits)
+        else:
+            item.page_permits = page_budget.acquire(1)
+            item.pages = [item.document.pop("image")]
+    item.file_data = None
+
+
+def _page(item: IngestItem, index: int):
+    """A page of the document, rendered again when it did not fit in the page budget."""
+    page = item.pages[index]
+    if page is None:
+        page = render_pdf_page(item.document["file_data"], index + 1)
+    return page
+
+
+def _detect(item: IngestItem):
+    item.boxes = [detect_boxes(_page(item, index)) for index in range(len(item.pages))]
+
+
+def _ocr(item: IngestItem):
+    profile = item.document.get("profile")
+    texts = []
+    for index, boxes in enumerate(item.boxes):
+        texts.extend(ocr_boxes(_page(item, index), boxes, profile))
+    item.texts = TEXT_SEPARATOR.join(texts)
+    item.document = item.pages = item.boxes = None
+    _release_pages(item)
+
+
+def _release_pages(item: IngestItem):
+    page_budget.release(item.page_permits)
+    item.page_permits = 0
+
+
+def _extract(item: IngestItem):
+    with timed_stage("llm"):
+        item.invoice_data, item.json_part = extract_invoice_data(item.texts, item.timings)
+    if item.invoice_data is None:
+        raise ValueError(f"LLM output is not valid JSON: {item.json_part[:200]}")
+
+
+def _save(items: list[IngestItem]):
+    """Persist the extracted invoices of several documents with one bulk insert."""
+    with timed_stage("db"):
+        ids, failures = save_invoices_bulk([
+            {
+                "invoice_data": item.invoice_data,
+                "raw_text": item.texts,
+                "raw_json": item.json_part,
+                "file_hash": item.file_hash,
+            }
+            for item in items
+        ])
+    errors = {failure["index"]: failure["error"] for failure in failures}
+    for index, (item, invoice_id) in enumerate(zip(items, ids)):
+        if invoice_id is None:
+            item.error = f"db: {errors.get(index, 'Failed to save invoice to DB')}"
+            item.done = True
+            continue
+        item.invoice_id = invoice_id
+        item.status = "succeeded"
+        result_json = {**item.invoice_data, "invoice_id": invoice_id}
+        result_cache.store(item.file_hash, result_json)
+
+
+class Ingestor:
+    """
+    Long-lived staged pipeline shared by all batches. Documents are fed from
+    a background thread per batch, which blocks while the first stage queue
+    is full instead of holding every decoded document in memory.
+    """
+
+    def __init__(self, decode_workers: int = INGEST_DECODE_WORKERS,
+                 detect_workers: int = INGEST_DETECT_WORKERS,
+                 ocr_workers: int = INGEST_OCR_WORKERS,
+                 llm_workers: int = INGEST_LLM_WORKERS,
+                 db_workers: int = INGEST_DB_WORKERS,
+                 db_batch_size: int = INGEST_DB_BATCH_SIZE,
+                 db_batch_wait_ms: float = INGEST_DB_BATCH_WAIT_MS,
+                 queue_size: int = INGEST_QUEUE_SIZE,
+                 retention: int = INGEST_BATCH_RETENTION):
+        self.pipeline = StagedPipeline(
+            [
+                Stage("decode", _decode, decode_workers),
+                Stage("detect", _detect, detect_workers),
+                Stage("ocr", _ocr, ocr_workers),
+                Stage("llm", _extract, llm_workers),
+                Stage("db", _save, db_workers, batch_size=db_batch_size, max_wait_ms=db_batch_wait_ms),
+            ],
+            on_done=self._finish,
+            queue_size=queue_size,
+        )
+        self.retention = retention
+        self._batches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _finish(self, item: IngestItem):
+        # A document that failed before the OCR stage still holds its pages
+        item.pages = None
+        _release_pages(item)
+        item.batch.record(item)
+
+    def submit_batch(self, files, options: dict | None = None, on_item=None) -> IngestBatch:
+        """
+        files is a sequence of (name, file_data, file_type); file_data may
+        also be a callable returning the bytes, read when the file is fed.
+        """
+        options = options or {}
+        files = list(files)
+        batch = IngestBatch(len(files), on_item)
+        with self._lock:
+            self._batches[batch.id] = batch
+            self._evict_finished()
+
+        def feed():
+            for name, file_data, file_type in files:
+                if callable(file_data):
+                    try:
+                        file_data = file_data()
+                    except Exception as e:
+                        item = IngestItem(name, b"", file_type, options, batch)
+                        item.error = f"read: {e}"
+                        batch.record(item)
+                        continue
+                self.pipeline.submit(IngestItem(name, file_data, file_type, options, batch))
+
+        if files:
+            threading.Thread(target=feed, name=f"ingest-feed-{batch.id[:8]}", daemon=True).start()
+        return batch
+
+    def get(self, batch_id: str) -> IngestBatch | None:
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def stats(self) -> dict:
+        return self.pipeline.stats()
+
+    def close(self):
+        """Wait for the queued documents and stop the stage workers."""
+        self.pipeline.join()
+
+    def _evict_finished(self):
+        excess = len(self._batches) - self.retention
+        if excess <= 0:
+            return
+        for batch_id in [b.id for b in self._batches.values() if b.finished_at][:excess]:
+            del self._batches[batch_id]
+
+
+ingestor = Ingestor()
+
+
+def files_from_directory(directory: str, recursive: bool = False) -> list[tuple[str, object, str]]:
+    """Documents of a directory, read lazily when fed to the pipeline."""
+    files = []
+    for root, dirs, names in os.walk(directory):
+        dirs.sort()
+        for name in sorted(names):
+            file_type = guess_file_type(None, name)
+            if not file_type or name.startswith("."):
+                continue
+            path = os.path.join(root, name)
+            files.append((os.path.relpath(path, directory), _reader(path), file_type))
+        if not recursive:
+            break
+    return files
+
+
+def _reader(path: str):
+    def read() -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+    return read
+
+
+class IngestJournal:
+    """
+    Append-only JSON lines log of per-file outcomes. Each line is flushed to
+    disk before the next document completes, so an interrupted run can be
+    resumed without redoing the files already ingested.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Last line cut short by a crash
+                        continue
+                    self.entries[entry["name"]] = entry
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def completed(self, name: str) -> bool:
+        entry = self.entries.get(name)
+        return entry is not None and entry["status"] in ("succeeded", "cached")
+
+    def append(self, entry: dict):
+        with self._lock:
+            self.entries[entry["name"]] = entry
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def _print_progress(batch: IngestBatch, ingestor_: Ingestor, skipped: int):
+    queues = ", ".join(f"{name} {stage['queued']}" for name, stage in ingestor_.stats().items())
+    print(
+        f"{batch.completed}/{batch.total} done "
+        f"({batch.counts['succeeded']} ok, {batch.counts['cached']} cached, {batch.counts['failed']} failed"
+        f"{f', {skipped} already in journal' if skipped else ''}) "
+        f"{batch.docs_per_minute():.1f} docs/min | queued: {queues}",
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--recursive", action="store_true")
+    parser.add_argument("--journal", help="outcome log used to resume (default: <directory>/.ingest-journal.jsonl)")
+    parser.add_argument("--force", action="store_true", help="reprocess files already ingested")
+    parser.add_argument("--preprocess", choices=("fast", "balanced", "accurate", "auto"))
+    parser.add_argument("--decode-workers", type=int, default=INGEST_DECODE_WORKERS)
+    parser.add_argument("--detect-workers", type=int, default=INGEST_DETECT_WORKERS)
+    parser.add_argument("--ocr-workers", type=int, default=INGEST_OCR_WORKERS)
+    parser.add_argument("--llm-workers", type=int, default=INGEST_LLM_WORKERS)
+    parser.add_argument("--db-workers", type=int, default=INGEST_DB_WORKERS)
+    parser.add_argument("--db-batch-size", type=int, default=INGEST_DB_BATCH_SIZE)
+    parser.add_argument("--queue-size", type=int, default=INGEST_QUEUE_SIZE)
+    parser.add_argument("--progress-every", type=float, default=5.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    from database import create_tables
+    from pipeline import model_registry
+
+    create_tables()
+    model_registry.start()
+
+    journal = IngestJournal(args.journal or os.path.join(args.directory, ".ingest-journal.jsonl"))
+    files = files_from_directory(args.directory, args.recursive)
+    pending = files if args.force else [f for f in files if not journal.completed(f[0])]
+    skipped = len(files) - len(pending)
+    print(f"{len(files)} documents found, {len(pending)} to ingest")
+
+    def on_item(item: IngestItem):
+        journal.append({**item.to_dict(), "file_hash": item.file_hash, "finished_at": time.time()})
+        if item.status == "failed":
+            print(f"FAILED {item.name}: {item.error}", flush=True)
+
+    runner = Ingestor(
+        decode_workers=args.decode_workers,
+        detect_workers=args.detect_workers,
+        ocr_workers=args.ocr_workers,
+        llm_workers=args.llm_workers,
+        db_workers=args.db_workers,
+        db_batch_size=args.db_batch_size,
+        queue_size=args.queue_size,
+    )
+    options = {"force": args.force, "preprocess": args.preprocess}
+    batch = runner.submit_batch(pending, options, on_item=on_item)
+    try:
+        while not batch.wait(args.progress_every):
+            _print_progress(batch, runner, skipped)
+    except KeyboardInterrupt:
+        print("Interrupted; completed documents are saved, rerun to resume")
+        journal.close()
+        sys.exit(130)
+    runner.close()
+    journal.close()
+
+    _print_progress(batch, runner, skipped)
+    busy = ", ".join(f"{name} {stage['busy_seconds']:.1f}s" for name, stage in runner.stats().items())
+    print(f"stage busy time: {busy}")
+    if batch.counts["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+# migrations.py
+"""
+Schema migrations for databases created before a column or index existed
+(create_all only creates missing tables). Each step runs once, in order, and
+is recorded in the schema_migrations table. create_tables() applies pending
+steps at startup; on a large database run them ahead of a deploy instead:
+
+    python -m migrations
+    python -m migrations --list
+    python -m migrations --rebuild-clients
+    python -m migrations --rebuild-daily-stats
+
+Steps are idempotent, so a step interrupted halfway is simply run again.
+"""
+import argparse
+import datetime
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, String, Table, bindparam, insert, inspect, or_, select, text, update,
+)
+
+from crud import invoice_status, rebuild_clients, rebuild_daily_stats
+from database import Invoice, InvoiceItem, engine as default_engine
+from utils.ocr_utils import client_key, parse_date
+from utils.stats_cache import stats_cache
+
+# Rows read and updated per transaction by the backfills
+BACKFILL_BATCH_SIZE = 1000
+# Arbitrary key of the PostgreSQL advisory lock held while migrating
+MIGRATION_LOCK_ID = 720_431_987
+
+metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _add_columns(engine, table, names):
+    with engine.begin() as connection:
+        existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+        for name in names:
+            if name in existing:
+                continue
+            column_type = table.c[name].type.compile(connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}"))
+
+
+def _create_indexes(engine, table, names):
+    # Indexes are named explicitly: later steps may add columns the
+    # table's other indexes depend on
+    indexes = {index.name: index for index in table.indexes}
+    with engine.begin() as connection:
+        for name in names:
+            indexes[name].create(connection, checkfirst=True)
+
+
+def add_parsed_invoice_dates(engine):
+    _add_columns(engine, Invoice.__table__, ["invoice_date_parsed", "due_date_parsed"])
+
+
+def create_stats_indexes(engine):
+    _create_indexes(engine, Invoice.__table__, [
+        "ix_invoices_created_at",
+        "ix_invoices_company_name",
+        "ix_invoices_customer_name",
+        "ix_invoices_invoice_date_parsed",
+        "ix_invoices_due_date_parsed",
+    ])
+    _create_indexes(engine, InvoiceItem.__table__, ["ix_invoice_items_invoice_id"])
+
+
+def _backfill(engine, sources, targets, compute):
+    """
+    Fill the invoices `targets` columns where they are NULL with
+    compute(row), row holding the `sources` columns; compute returns the
+    values of the targets, in order. Runs in batches of BACKFILL_BATCH_SIZE
+    rows, each in its own transaction.
+    """
+    invoices = Invoice.__table__
+    statement = (
+        update(invoices)
+        .where(invoices.c.id == bindparam("row_id"))
+        .values({target: bindparam(f"new_{target}") for target in targets})
+    )
+    missing = or_(*(invoices.c[target].is_(None) for target in targets))
+    last_id = 0
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                select(invoices.c.id, *(invoices.c[source] for source in sources))
+                .where(invoices.c.id > last_id)
+                .where(missing)
+                .order_by(invoices.c.id)
+                .limit(BACKFILL_BATCH_SIZE)
+            ).all()
+            if not rows:
+                return
+            last_id = rows[-1].id
+            updates = []
+            for row in rows:
+                values = compute(row)
+                if any(value is not None for value in values):
+                    updates.append({"row_id": row.id, **{f"new_{t}": v for t, v in zip(targets, values)}})
+            if updates:
+                connection.execute(statement, updates)
+
+
+def backfill_parsed_invoice_dates(engine):
+    _backfill(
+        engine,
+        ["invoice_date", "due_date"],
+        ["invoice_date_parsed", "due_date_parsed"],
+        lambda row: (parse_date(row.invoice_date), parse_date(row.due_date)),
+    )
+
+
+def create_invoice_list_index(engine):
+    _create_indexes(engine, Invoice.__table__, ["ix_invoices_created_at_id"])
+
+
+def add_client_keys(engine):
+    _add_columns(engine, Invoice.__table__, ["client_key"])
+    _create_indexes(engine, Invoice.__table__, ["ix_invoices_client_key"])
+
+
+def backfill_client_keys(engine):
+    _backfill(engine, ["customer_name"], ["client_key"], lambda row: (client_key(row.customer_name),))
+
+
+def build_clients(engine):
+    with engine.begin() as connection:
+        rebuild_clients(connection)
+
+
+def build_daily_stats(engine):
+    with engine.begin() as connection:
+        rebuild_daily_stats(connection)
+
+
+def add_invoice_status(engine):
+    _add_columns(engine, Invoice.__table__, ["status", "paid_at"])
+    _backfill(
+        engine,
+        ["total_amount", "due_date_parsed", "created_at"],
+        ["status"],
+        lambda row: (invoice_status(row.total_amount, row.due_date_parsed),),
+    )
+    with engine.begin() as connection:
+        # Invoices without a total were paid, as far as we know, when they were created
+        invoices = Invoice.__table__
+        connection.execute(
+            update(invoices)
+            .where(invoices.c.status == "paid", invoices.c.paid_at.is_(None))
+            .values(paid_at=invoices.c.created_at)
+        )
+    _create_indexes(engine, Invoice.__table__, ["ix_invoices_status", "ix_invoices_status_due_date"])
+
+
+# (version, name, step): append new steps at the end, never renumber
+MIGRATIONS = [
+    (1, "add_parsed_invoice_dates", add_parsed_invoice_dates),
+    (2, "create_stats_indexes", create_stats_indexes),
+    (3, "backfill_parsed_invoice_dates", backfill_parsed_invoice_dates),
+    (4, "create_invoice_list_index", create_invoice_list_index),
+    (5, "add_client_keys", add_client_keys),
+    (6, "backfill_client_keys", backfill_client_keys),
+    (7, "build_clients", build_clients),
+    (8, "build_daily_stats", build_daily_stats),
+    (9, "add_invoice_status", add_invoice_status),
+    # Client names now come from the latest invoice, trimmed
+    (10, "rebuild_client_names", build_clients),
+]
+
+
+@contextmanager
+def _migration_lock(engine):
+    """Keep several workers starting at once from migrating concurrently."""
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect() as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_ID})
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_ID})
+            connection.commit()
+
+
+def applied_migrations(engine=None) -> dict[int, datetime.datetime]:
+    engine = engine or default_engine
+    metadata.create_all(bind=engine)
+    with engine.connect() as connection:
+        rows = connection.execute(select(schema_migrations.c.version, schema_migrations.c.applied_at))
+        return {row.version: row.applied_at for row in rows}
+
+
+def run_migrations(engine=None) -> list[str]:
+    """Apply the pending migrations in order; returns the names of those applied."""
+    engine = engine or default_engine
+    done = []
+    with _migration_lock(engine):
+        applied = applied_migrations(engine)
+        for version, name, step in MIGRATIONS:
+            if version in applied:
+                continue
+            start = time.perf_counter()
+            step(engine)
+            with engine.begin() as connection:
+                connection.execute(insert(schema_migrations).values(
+                    version=version, name=name, applied_at=datetime.datetime.utcnow()
+                ))
+            print(f"Migration {version} ({name}) applied in {time.perf_counter() - start:.2f}s")
+            done.append(name)
+    if done:
+        stats_cache.bump()
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--list", action="store_true", help="show the migrations and whether they are applied")
+    parser.add_argument("--rebuild-clients", action="store_true", help="recompute the clients table from the invoices")
+    parser.add_argument(
+        "--rebuild-daily-stats", action="store_true", help="recompute the invoice_daily_stats rollup from the invoices"
+    )
+    args = parser.parse_args()
+
+    if args.list:
+        applied = applied_migrations()
+        for version, name, _ in MIGRATIONS:
+            status = f"applied {applied[version]:%Y-%m-%d %H:%M:%S}" if version in applied else "pending"
+            print(f"{version:>4}  {name:<32} {status}")
+        return
+
+    from database import create_tables
+
+    create_tables()
+    print("Database is up to date")
+    if args.rebuild_clients:
+        build_clients(default_engine)
+        print("Clients table rebuilt")
+    if args.rebuild_daily_stats:
+        build_daily_stats(default_engine)
+        print("Daily stats rebuilt")
+
+
+if __name__ == "__main__":
+    main()
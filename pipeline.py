@@ -0,0 +1,298 @@
+# pipeline.py
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# OpenCV, numpy, pdf2image and the detector backends are imported in the
+# functions using them: loading the app only pays for them on first use
+from crud import save_invoice_to_db
+from utils.detection import DetectionBatcher, resize_for_detection
+from utils.fast_extract import (
+    INVOICE_FIELDS, LLM_ONLY_FIELDS, extract_fields, fast_path_stats, merge_fields, missing_fields,
+    unfilled_fields,
+)
+from utils.llm import chat_json
+from utils.llm_cache import llm_cache, prompt_version
+from utils.metrics import JSON_PARSE_FAILURES, ROIS_PER_PAGE, timed_stage
+from utils.model_registry import ModelRegistry
+from utils.ocr_engine import crop_rois, ocr_rois
+from utils.result_cache import result_cache
+
+# Specify poppler path (update this to your actual path or set POPPLER_PATH)
+POPPLER_PATH = os.environ.get("POPPLER_PATH", r"C:\poppler-24.08.0\Library\bin")
+# Number of PDF pages rasterized and processed at the same time. This also
+# bounds how many rendered pages are held in memory.
+PDF_PAGE_WORKERS = int(os.environ.get("PDF_PAGE_WORKERS", 2))
+
+# How long a request waits for the detector to finish loading at startup
+MODEL_LOAD_TIMEOUT = float(os.environ.get("MODEL_LOAD_TIMEOUT", 120))
+DETECTION_THRESHOLD = 0.5
+# Concurrent requests are grouped into one forward pass of up to
+# DETECTION_MAX_BATCH images, waiting at most DETECTION_MAX_WAIT_MS for the
+# batch to fill. Batching only starts once the warmup has checked that the
+# model accepts a batch of several images; DETECTION_MAX_BATCH=1 skips the
+# check.
+DETECTION_MAX_BATCH = int(os.environ.get("DETECTION_MAX_BATCH", 8))
+DETECTION_MAX_WAIT_MS = float(os.environ.get("DETECTION_MAX_WAIT_MS", 5))
+# Images are downscaled to this long edge before detection (0 keeps the full
+# resolution); ROIs are still cropped from the original image.
+DETECTION_LONG_EDGE = int(os.environ.get("DETECTION_LONG_EDGE", 1024))
+TEXT_SEPARATOR = "   |||   "
+
+LLM_MODEL = "gemma2:2b"
+
+
+def llm_prompt(fields: list[str]) -> str:
+    return (
+        "can you parse this text and give me json format version with these corresponding values: "
+        f"{', '.join(fields)}. If you can't find values of corresponding field then leave it empty. The text is :"
+    )
+
+
+PROMPT = llm_prompt(INVOICE_FIELDS)
+# Changing the prompt changes its version: entries cached for the previous
+# prompt are no longer looked up (restricted prompts come from the same
+# template and share the version)
+PROMPT_VERSION = prompt_version(PROMPT)
+
+_page_executor = ThreadPoolExecutor(
+    max_workers=PDF_PAGE_WORKERS, thread_name_prefix="pdf-page"
+)
+
+
+def load_image(file_data: bytes):
+    import cv2
+    import numpy as np
+
+    image_array = np.frombuffer(file_data, np.uint8)
+    image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image")
+    return image
+
+
+def count_pdf_pages(file_data: bytes) -> int:
+    from pdf2image import pdfinfo_from_bytes
+
+    info = pdfinfo_from_bytes(file_data, poppler_path=POPPLER_PATH)
+    return int(info.get("Pages", 0))
+
+
+def render_pdf_page(file_data: bytes, page_number: int):
+    """Rasterize a single (1-based) PDF page to a BGR image."""
+    import cv2
+    import numpy as np
+    from pdf2image import convert_from_bytes
+
+    with timed_stage("rasterize"):
+        pages = convert_from_bytes(
+            file_data,
+            first_page=page_number,
+            last_page=page_number,
+            poppler_path=POPPLER_PATH,
+        )
+    if not pages:
+        raise ValueError(f"Failed to extract page {page_number} from PDF")
+    image = np.array(pages[0])
+    return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+
+def _load_detector():
+    from utils.detectors import create_detector
+
+    return create_detector().load()
+
+
+def _warm_up_detector(detector):
+    # Trace the graph once on a page-shaped dummy image
+    long_edge = DETECTION_LONG_EDGE or 1024
+    detector.warmup(long_edge, long_edge * 3 // 4)
+    if DETECTION_MAX_BATCH > 1 and detector.accepts_batches(long_edge, long_edge * 3 // 4):
+        detection_batcher.max_batch_size = DETECTION_MAX_BATCH
+
+
+model_registry = ModelRegistry("detector", _load_detector, _warm_up_detector)
+
+
+def _run_detector(batch) -> dict:
+    return model_registry.get(MODEL_LOAD_TIMEOUT).detect_batch(batch)
+
+
+detection_batcher = DetectionBatcher(
+    _run_detector,
+    # Raised to DETECTION_MAX_BATCH by the warmup when the model allows it
+    max_batch_size=1,
+    max_wait_ms=DETECTION_MAX_WAIT_MS,
+)
+
+
+def detect_boxes(image):
+    """Run the detector and return the normalized boxes above the threshold."""
+    import cv2
+
+    detection_input = resize_for_detection(image, DETECTION_LONG_EDGE)
+    image_rgb = cv2.cvtColor(detection_input, cv2.COLOR_BGR2RGB)
+    with timed_stage("detection"):
+        detections = detection_batcher.detect(image_rgb)
+
+    boxes = detections["detection_boxes"]
+    scores = detections["detection_scores"]
+    return boxes[scores >= DETECTION_THRESHOLD]
+
+
+def ocr_boxes(image, boxes, profile: str | None = None) -> list[str]:
+    """OCR the detected boxes of a page, in box order."""
+    ROIS_PER_PAGE.observe(len(boxes))
+    with timed_stage("tesseract"):
+        return ocr_rois(crop_rois(image, boxes), profile)
+
+
+def ocr_image(image, profile: str | None = None) -> list[str]:
+    return ocr_boxes(image, detect_boxes(image), profile)
+
+
+def _ocr_pdf_page(file_data: bytes, page_number: int, profile: str | None = None) -> list[str]:
+    return ocr_image(render_pdf_page(file_data, page_number), profile)
+
+
+def ocr_pdf(file_data: bytes, page_count: int, profile: str | None = None) -> list[str]:
+    """
+    OCR every page of a PDF. Pages are rendered one at a time inside the page
+    workers, so only PDF_PAGE_WORKERS rasterized pages are alive at once, and
+    the texts of all pages are returned in page order.
+    """
+    page_texts = _page_executor.map(
+        lambda page_number: _ocr_pdf_page(file_data, page_number, profile),
+        range(1, page_count + 1),
+    )
+    return [text for texts in page_texts for text in texts]
+
+
+def extract_invoice_data(texts: str, timings: dict | None = None):
+    """
+    Turn the OCR text into invoice fields. Rule-based extraction runs first
+    and the LLM is only asked when required fields are missing or
+    low-confidence; its answer is then completed with the rule-based values.
+    Returns (invoice_data, json_part); json_part is invoice_data as JSON (the
+    persisted raw_json), or the raw model output with invoice_data None when
+    the model did not produce valid JSON. LLM time-to-first-token and
+    tokens/s are written to timings when given.
+    """
+    fast_data, confidences = extract_fields(texts)
+    missing = missing_fields(confidences)
+    if not missing:
+        fast_path_stats.record(hit=True)
+        return fast_data, json.dumps(fast_data, ensure_ascii=False)
+
+    if all(field in LLM_ONLY_FIELDS for field in missing):
+        # The rules found everything they can: a shorter prompt for every
+        # field they did not fill (names, addresses, line items...)
+        unfilled = unfilled_fields(confidences)
+        llm_data, _ = _extract_with_llm(texts, timings, unfilled)
+        if llm_data is not None:
+            fast_path_stats.record(hit=False, partial=True)
+            invoice_data = {**fast_data, **{field: llm_data.get(field) or "" for field in unfilled}}
+            return invoice_data, json.dumps(invoice_data, ensure_ascii=False)
+    fast_path_stats.record(hit=False)
+
+    invoice_data, json_part = _extract_with_llm(texts, timings)
+    if invoice_data is None:
+        return None, json_part
+    # The merged fields, as returned and cached, not the bare model output
+    invoice_data = merge_fields(invoice_data, fast_data, confidences)
+    return invoice_data, json.dumps(invoice_data, ensure_ascii=False)
+
+
+def _extract_with_llm(texts: str, timings: dict | None = None, fields: list[str] | None = None):
+    """
+    Ask the LLM for the invoice fields (or only `fields`); parsed results are
+    cached per normalized text and requested fields.
+    """
+    prompt = PROMPT if fields is None else llm_prompt(fields)
+    cached = llm_cache.get(LLM_MODEL, PROMPT_VERSION, texts, fields)
+    if cached is not None:
+        return cached, json.dumps(cached, ensure_ascii=False)
+
+    json_part, request_stats = chat_json(LLM_MODEL, prompt + texts)
+    if timings is not None:
+        timings["llm_ttft"] = request_stats["ttft"]
+        timings["llm_tokens"] = request_stats["tokens"]
+        timings["llm_tokens_per_s"] = request_stats["tokens_per_s"]
+
+    try:
+        invoice_data = json.loads(json_part)
+    except json.JSONDecodeError:
+        JSON_PARSE_FAILURES.inc()
+        return None, json_part
+
+    if not isinstance(invoice_data, dict):
+        JSON_PARSE_FAILURES.inc()
+        return None, json_part
+
+    llm_cache.set(LLM_MODEL, PROMPT_VERSION, texts, invoice_data, fields)
+    return invoice_data, json_part
+
+
+def load_document(file_data: bytes, file_type: str, profile: str | None = None) -> dict:
+    """
+    Decode the uploaded bytes into something the OCR stage can consume.
+    profile overrides the ROI preprocessing profile for this document.
+    Raises ValueError when the file cannot be read.
+    """
+    if file_type == "pdf":
+        # Pages are rasterized lazily later on, only count them here
+        page_count = count_pdf_pages(file_data)
+        if not page_count:
+            raise ValueError("Failed to extract images from PDF")
+        document = {"file_type": "pdf", "file_data": file_data, "page_count": page_count}
+    elif file_type == "image":
+        document = {"file_type": "image", "image": load_image(file_data)}
+    else:
+        raise ValueError("Invalid file_type (must be 'image' or 'pdf')")
+    document["profile"] = profile
+    return document
+
+
+def ocr_document(document: dict) -> str:
+    profile = document.get("profile")
+    if document["file_type"] == "pdf":
+        extracted_texts = ocr_pdf(document["file_data"], document["page_count"], profile)
+    else:
+        extracted_texts = ocr_image(document["image"], profile)
+    return TEXT_SEPARATOR.join(extracted_texts)
+
+
+def run_pipeline(
+    document: dict, timings: dict | None = None, on_stage=None, file_hash: str | None = None
+):
+    """
+    Run OCR, LLM extraction and persistence for a loaded document.
+    Returns (result_json, json_part); result_json is None if the LLM output
+    was not valid JSON, otherwise it carries the new invoice_id.
+    When file_hash is given the result is recorded in the result cache.
+    """
+    with timed_stage("ocr", timings, on_stage):
+        texts = ocr_document(document)
+
+    with timed_stage("llm", timings, on_stage):
+        invoice_data, json_part = extract_invoice_data(texts, timings)
+    if invoice_data is None:
+        return None, json_part
+
+    with timed_stage("db", timings, on_stage):
+        result_json = save_result(invoice_data, texts, json_part, file_hash)
+    return result_json, json_part
+
+
+def save_result(invoice_data: dict, texts: str, json_part: str, file_hash: str | None = None) -> dict:
+    """
+    Persist the extracted invoice and return it with its invoice_id (None if
+    saving failed). When file_hash is given the result is recorded in the
+    result cache.
+    """
+    invoice_id = save_invoice_to_db(invoice_data, texts, json_part, file_hash)
+    result_json = invoice_data
+    result_json["invoice_id"] = invoice_id
+    if file_hash and invoice_id is not None:
+        result_cache.store(file_hash, result_json)
+    return result_json
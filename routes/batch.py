@@ -0,0 +1,29 @@
+# routes/batch.py
+from flask import Blueprint, jsonify, request
+
+from ingest import ingestor
+from utils.ocr_utils import parse_bool
+from utils.upload_utils import UploadError, read_batch_upload
+
+batch_bp = Blueprint("batch", __name__)
+
+
+@batch_bp.route("/ocr/batch", methods=["POST"])
+def submit_ocr_batch():
+    try:
+        files, options = read_batch_upload(request)
+    except UploadError as e:
+        return jsonify({"error": e.message}), e.status
+
+    batch = ingestor.submit_batch(files, options)
+    return jsonify({"batch_id": batch.id, "total": batch.total, "status": "running"}), 202
+
+
+@batch_bp.route("/ocr/batch/<batch_id>", methods=["GET"])
+def get_ocr_batch(batch_id):
+    batch = ingestor.get(batch_id)
+    if not batch:
+        return jsonify({"error": "Batch not found"}), 404
+    result = batch.to_dict(include_files=parse_bool(request.args.get("files"), default=True))
+    result["stages"] = ingestor.stats()
+    return jsonify(result)
@@ -1,66 +1,166 @@
 # routes/invoices.py
+import base64
+import json
 from flask import Blueprint, jsonify, request
-from database import get_db, Invoice, InvoiceItem
-from datetime import date, datetime
+from sqlalchemy import and_, false, func, or_
+from crud import (
+    INVOICE_STATUSES, delete_invoice_from_db, invoice_stats_row, invoice_status, refresh_clients, update_daily_stats,
+)
+from database import get_session, Client, Invoice, InvoiceItem
+from datetime import date, datetime, timedelta
+from utils.ocr_utils import client_key, parse_amount, parse_bool, parse_date
+from utils.stats_cache import stats_cache
 
 invoices_bp = Blueprint("invoices", __name__)
 
+# Invoices per page of GET /invoices, by default and at most
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Numeric fields of PUT /invoices/<id> (Float columns)
+NUMBER_FIELDS = ("taxes", "total", "quantity", "unitPrice", "amount")
+
+# Fields GET /invoices can return (?fields=), the first ones by default
+LIST_FIELDS = {
+    "id": Invoice.id,
+    "company_name": Invoice.company_name,
+    "invoice_number": Invoice.invoice_number,
+    "invoice_date": Invoice.invoice_date,
+    "total_amount": Invoice.total_amount,
+    "status": Invoice.status,
+    "created_at": Invoice.created_at,
+    "customer_name": Invoice.customer_name,
+    "due_date": Invoice.due_date,
+    "taxes": Invoice.taxes,
+}
+DEFAULT_LIST_FIELDS = ("id", "company_name", "invoice_number", "invoice_date", "total_amount", "status", "created_at")
+
+
+def encode_cursor(created_at: datetime, invoice_id: int) -> str:
+    payload = json.dumps([created_at.isoformat(), invoice_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, invoice_id = json.loads(payload)
+        return datetime.fromisoformat(created_at), int(invoice_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _list_filters(args) -> list:
+    """SQL conditions for the filters of GET /invoices; ValueError on a bad value."""
+    filters = []
+    status = args.get("status")
+    if status:
+        statuses = status.split(",")
+        if not set(statuses) <= set(INVOICE_STATUSES):
+            raise ValueError("status must be paid, pending or overdue")
+        filters.append(Invoice.status.in_(statuses))
+    if args.get("customer"):
+        # Same normalized key as the clients listed by GET /clients; a blank
+        # name has no key and matches no client (not the invoices without one)
+        key = client_key(args["customer"])
+        filters.append(Invoice.client_key == key if key else false())
+    if args.get("company"):
+        filters.append(Invoice.company_name == args["company"])
+    try:
+        # Days of created_at, both included
+        if args.get("from"):
+            filters.append(Invoice.created_at >= datetime.fromisoformat(args["from"]))
+        if args.get("to"):
+            end = datetime.combine(date.fromisoformat(args["to"]) + timedelta(days=1), datetime.min.time())
+            filters.append(Invoice.created_at < end)
+    except ValueError:
+        raise ValueError("from and to must be dates (YYYY-MM-DD)")
+    try:
+        if args.get("min_amount"):
+            filters.append(Invoice.total_amount >= float(args["min_amount"]))
+        if args.get("max_amount"):
+            filters.append(Invoice.total_amount <= float(args["max_amount"]))
+    except ValueError:
+        raise ValueError("min_amount and max_amount must be numbers")
+    return filters
+
+
+def _list_fields(value: str | None) -> list[str]:
+    if not value:
+        return list(DEFAULT_LIST_FIELDS)
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in LIST_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (available: {', '.join(LIST_FIELDS)})")
+    return fields
+
+
+def _list_value(field: str, value):
+    if field == "total_amount":
+        return float(value) if value is not None else 0.0
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
 @invoices_bp.route("/invoices", methods=["GET"])
 def get_invoices():
-    db = next(get_db())
+    """
+    Invoices, newest first, one page at a time. The response stays a JSON
+    array; X-Next-Cursor holds the cursor of the next page (absent on the
+    last one) and X-Total-Count the number of matching invoices, unless
+    count=false.
+
+    Query parameters: limit, cursor, status (paid, pending, overdue, comma
+    separated), customer, company, from and to (created_at days),
+    min_amount, max_amount, fields (comma separated) and count.
+    """
     try:
-        invoices = db.query(Invoice).order_by(Invoice.created_at.desc()).all()
-        result = []
-
-        for invoice in invoices:
-            invoice_date = invoice.invoice_date
-            created_at = invoice.created_at
-
-            if isinstance(invoice_date, (datetime, date)):
-                invoice_date = invoice_date.isoformat()
-
-            if isinstance(created_at, (datetime, date)):
-                created_at = created_at.isoformat()
-
-            total_amount = float(invoice.total_amount) if invoice.total_amount is not None else 0.0
-
-            # Calculate status dynamically
-            if total_amount <= 0:
-                status = "paid"
-            elif invoice.due_date:
-                try:
-                    due = invoice.due_date
-                    if isinstance(due, str):
-                        due = datetime.fromisoformat(due)
-                    if due < datetime.utcnow():
-                        status = "overdue"
-                    else:
-                        status = "pending"
-                except Exception:
-                    status = "pending"
-            else:
-                status = "pending"
-
-            result.append({
-                "id": invoice.id,
-                "company_name": invoice.company_name,
-                "invoice_number": invoice.invoice_number,
-                "invoice_date": invoice_date,
-                "total_amount": total_amount,
-                "status": status,
-                "created_at": created_at,
-            })
-
-        return jsonify(result), 200
+        limit = min(max(int(request.args.get("limit", DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        filters = _list_filters(request.args)
+        fields = _list_fields(request.args.get("fields"))
+        cursor = request.args.get("cursor")
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_session()
+    try:
+        # Keyset pagination on (created_at, id): each page is an index range
+        # scan, however deep the page
+        columns = [LIST_FIELDS[field].label(field) for field in fields]
+        query = (
+            db.query(*columns, Invoice.created_at.label("cursor_created_at"), Invoice.id.label("cursor_id"))
+            .filter(*filters)
+            .order_by(Invoice.created_at.desc(), Invoice.id.desc())
+        )
+        if after:
+            created_at, invoice_id = after
+            query = query.filter(or_(
+                Invoice.created_at < created_at,
+                and_(Invoice.created_at == created_at, Invoice.id < invoice_id),
+            ))
+        rows = query.limit(limit + 1).all()
+
+        result = [
+            {field: _list_value(field, getattr(row, field)) for field in fields}
+            for row in rows[:limit]
+        ]
+        response = jsonify(result)
+        if len(rows) > limit and rows[limit - 1].cursor_created_at is not None:
+            last = rows[limit - 1]
+            response.headers["X-Next-Cursor"] = encode_cursor(last.cursor_created_at, last.cursor_id)
+        if parse_bool(request.args.get("count"), default=True):
+            total = db.query(func.count(Invoice.id)).filter(*filters).scalar()
+            response.headers["X-Total-Count"] = str(total)
+        return response, 200
     except Exception as e:
         return jsonify({"error": f"Failed to retrieve invoices: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @invoices_bp.route("/invoices/<int:invoice_id>", methods=["GET"])
 def get_invoice(invoice_id):
-    db = next(get_db())
+    db = get_session()
     try:
         invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
         if not invoice:
@@ -97,78 +197,100 @@ def get_invoice(invoice_id):
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": f"Failed to retrieve invoice: {str(e)}"}), 500
-    finally:
-        db.close()
+
+
+# Orders of GET /clients (?sort=), each backed by an index of the clients table
+CLIENT_SORTS = {
+    "name": (Client.key.asc(),),
+    "revenue": (Client.total_value.desc(), Client.id.asc()),
+    "volume": (Client.invoice_count.desc(), Client.id.asc()),
+    "recent": (Client.last_invoice_at.desc(), Client.id.asc()),
+}
 
 
 @invoices_bp.route("/clients", methods=["GET"])
 def get_clients():
-    db = next(get_db())
+    """
+    Clients with their invoice count, total value and last invoice date,
+    read from the clients table. Paginated with limit and offset, sorted by
+    name (default), revenue, volume or recent; X-Total-Count holds the
+    number of clients.
+    """
+    sort = request.args.get("sort", "name")
+    if sort not in CLIENT_SORTS:
+        return jsonify({"error": f"sort must be one of {', '.join(CLIENT_SORTS)}"}), 400
     try:
-        invoices = db.query(Invoice).all()
-
-        client_map = {}
-
-        for inv in invoices:
-            raw_name = (inv.customer_name or "").strip().lower()
-            clean_name = raw_name if raw_name and raw_name != "null" else None
-
-            if not clean_name:
-                continue  # Skip empty/null clients
-            
-            clean_address = inv.customer_address.strip() if inv.customer_address else ""
-            if clean_address.lower() == "null":
-                clean_address = ""
-
-            if clean_name not in client_map:
-                client_map[clean_name] = {
-                    "id": len(client_map) + 1,
-                    "name": inv.customer_name or "",
-                    "email": "",  # No email in your DB model — keep empty or add if available
-                    "address": clean_address,
-                    "createdAt":inv.created_at,
-                    "invoiceCount": 1,
-                    "totalValue": inv.total_amount or 0,
-                    "lastInvoiceDate": inv.created_at
-                }
-            else:
-                client = client_map[clean_name]
-                client["invoiceCount"] += 1
-                client["totalValue"] += inv.total_amount or 0
-
-                # Update lastInvoiceDate if this invoice is newer
-                if inv.created_at and (not client["lastInvoiceDate"] or inv.created_at >client["lastInvoiceDate"]):
-                    client["lastInvoiceDate"] = inv.created_at
-
-        # Return list of clients with camelCase keys, aggregated totals and dates
-        return jsonify(list(client_map.values())), 200
+        limit = min(max(int(request.args.get("limit", DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        offset = max(int(request.args.get("offset", 0)), 0)
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+
+    db = get_session()
+    try:
+        clients = db.query(Client).order_by(*CLIENT_SORTS[sort]).offset(offset).limit(limit).all()
+        result = [
+            {
+                "id": client.id,
+                "name": client.name or "",
+                "email": "",  # No email in your DB model — keep empty or add if available
+                "address": client.address or "",
+                "createdAt": client.first_invoice_at,
+                "invoiceCount": client.invoice_count,
+                "totalValue": client.total_value or 0,
+                "lastInvoiceDate": client.last_invoice_at,
+            }
+            for client in clients
+        ]
+        response = jsonify(result)
+        response.headers["X-Total-Count"] = str(db.query(func.count(Client.id)).scalar())
+        return response, 200
 
     except Exception as e:
         return jsonify({"error": f"Failed to retrieve clients: {str(e)}"}), 500
-    finally:
-        db.close()
 
         
 @invoices_bp.route("/invoices/<int:invoice_id>", methods=["PUT"])
 def update_invoice(invoice_id):
-    db = next(get_db())
+    db = get_session()
     try:
         data = request.get_json()
+        status = data.get('status')
+        if status is not None and status not in INVOICE_STATUSES:
+            return jsonify({"error": f"status must be one of {', '.join(INVOICE_STATUSES)}"}), 400
+        numbers = {}
+        for key in NUMBER_FIELDS:
+            try:
+                numbers[key] = parse_amount(data.get(key))
+            except ValueError:
+                return jsonify({"error": f"{key} must be a number"}), 400
 
         invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
         if not invoice:
             return jsonify({"error": "Invoice not found"}), 404
 
+        previous = invoice_stats_row(invoice)
+        # An invoice with an amount due only becomes paid when marked so: keep it paid
+        marked_paid = invoice.status == "paid" and (invoice.total_amount or 0) > 0
+
         # Update invoice fields
         invoice.invoice_number = data.get('invoiceNumber')
         invoice.company_name = data.get('companyName')
         invoice.company_address = data.get('companyAddress')
         invoice.customer_name = data.get('clientName')
         invoice.customer_address = data.get('clientAddress')
+        invoice.client_key = client_key(invoice.customer_name)
         invoice.invoice_date = data.get('date')
         invoice.due_date = data.get('dueDate')
-        invoice.taxes = data.get('taxes')
-        invoice.total_amount = data.get('total')
+        invoice.invoice_date_parsed = parse_date(invoice.invoice_date)
+        invoice.due_date_parsed = parse_date(invoice.due_date)
+        invoice.taxes = numbers['taxes']
+        invoice.total_amount = numbers['total']
+
+        # Explicit status, or the one the data implies
+        if status is None:
+            status = "paid" if marked_paid else invoice_status(invoice.total_amount, invoice.due_date_parsed)
+        invoice.paid_at = (invoice.paid_at or datetime.utcnow()) if status == "paid" else None
+        invoice.status = status
 
         # Optional: Update single item info if you don’t support multi-items yet
         if invoice.items:
@@ -178,12 +300,28 @@ def update_invoice(invoice_id):
             db.add(item)
 
         item.description = data.get('description')
-        item.quantity = data.get('quantity')
-        item.unit_price = data.get('unitPrice')
-        item.amount = data.get('amount')
+        item.quantity = numbers['quantity']
+        item.unit_price = numbers['unitPrice']
+        item.amount = numbers['amount']
 
+        # Same transaction: the client totals and daily stats never disagree with the invoices
+        db.flush()
+        refresh_clients(db, {previous["client_key"], invoice.client_key})
+        update_daily_stats(db, added=[invoice_stats_row(invoice)], removed=[previous])
         db.commit()
+        stats_cache.bump()
         return jsonify({"success": True})
     except Exception as e:
         db.rollback()
+        return jsonify({"error": "Something went wrong", "details": str(e)}), 500
+
+
+@invoices_bp.route("/invoices/<int:invoice_id>", methods=["DELETE"])
+def delete_invoice(invoice_id):
+    db = get_session()
+    try:
+        if not delete_invoice_from_db(db, invoice_id):
+            return jsonify({"error": "Invoice not found"}), 404
+        return jsonify({"success": True})
+    except Exception as e:
         return jsonify({"error": "Something went wrong", "details": str(e)}), 500
\ No newline at end of file
@@ -0,0 +1,77 @@
+# routes/jobs.py
+import os
+
+from flask import Blueprint, jsonify, request
+
+from pipeline import load_document, run_pipeline
+from utils.job_queue import JobQueue, QueueFullError
+from utils.metrics import timed_stage
+from utils.result_cache import hash_file, result_cache
+from utils.upload_utils import UploadError, read_upload
+
+jobs_bp = Blueprint("jobs", __name__)
+
+OCR_JOB_WORKERS = int(os.environ.get("OCR_JOB_WORKERS", 2))
+OCR_JOB_QUEUE_SIZE = int(os.environ.get("OCR_JOB_QUEUE_SIZE", 32))
+
+
+def _set_stage(job):
+    def on_stage(name):
+        job.stage = name
+    return on_stage
+
+
+def process_ocr_job(job):
+    file_data = job.payload["file_data"]
+    options = job.payload["options"]
+    on_stage = _set_stage(job)
+
+    with timed_stage("cache", job.timings, on_stage):
+        file_hash = hash_file(file_data)
+        cached = None if options["force"] else result_cache.lookup(file_hash)
+    if cached is not None:
+        return cached["invoice_id"]
+
+    with timed_stage("decode", job.timings, on_stage):
+        document = load_document(
+            file_data, job.payload["file_type"], options.get("preprocess")
+        )
+
+    result_json, json_part = run_pipeline(document, job.timings, on_stage, file_hash)
+    if result_json is None:
+        raise ValueError(f"LLM output is not valid JSON: {json_part[:200]}")
+    if result_json["invoice_id"] is None:
+        raise RuntimeError("Failed to save invoice to DB")
+    return result_json["invoice_id"]
+
+
+job_queue = JobQueue(
+    process_ocr_job, maxsize=OCR_JOB_QUEUE_SIZE, workers=OCR_JOB_WORKERS
+)
+
+
+@jobs_bp.route("/ocr/jobs", methods=["POST"])
+def submit_ocr_job():
+    try:
+        file_data, file_type, options = read_upload(request)
+    except UploadError as e:
+        return jsonify({"error": e.message}), e.status
+
+    try:
+        job = job_queue.submit(
+            {"file_data": file_data, "file_type": file_type, "options": options}
+        )
+    except QueueFullError as e:
+        response = jsonify({"error": "OCR queue is full, retry later"})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429
+
+    return jsonify({"job_id": job.id, "status": job.status}), 202
+
+
+@jobs_bp.route("/ocr/jobs/<job_id>", methods=["GET"])
+def get_ocr_job(job_id):
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
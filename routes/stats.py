@@ -1,64 +1,66 @@
 # routes/stats.py
 from flask import Blueprint, jsonify
 from datetime import datetime, timedelta
-from sqlalchemy import func, cast, Date, desc
-from database import get_db, Invoice
+from sqlalchemy import func, desc
+from database import get_session, Client, Invoice, InvoiceDailyStats
 from flask import request
+from utils.stats_cache import stats_cache
+from utils.time_series import daily_series, get_timezone, time_series
 
 stats_bp = Blueprint("stats", __name__)
+# Responses cached until the next invoice write, with ETag / 304
+stats_cache.init_blueprint(stats_bp)
 
 
 @stats_bp.route("/stats/revenue-per-day", methods=["GET"])
 def get_revenue_per_day():
-    db = next(get_db())
+    db = get_session()
     try:
         days = int(request.args.get("days", 7))
-
-        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        tz = get_timezone(request.args.get("tz"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        # Days are those of the tz time zone (UTC by default), all in one grouped query
+        today = datetime.now(tz).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
         start_date = today - timedelta(days=days - 1)
-
-        result = (
-            db.query(
-                cast(Invoice.created_at, Date).label("day"),
-                func.coalesce(func.sum(Invoice.total_amount), 0).label("total")  # 👈 Coalesce here
+        if tz.key == "UTC":
+            # UTC days are exactly those of the daily stats rollup
+            series = daily_series(
+                db, InvoiceDailyStats.day, start_date.date(), today.date(), "day",
+                {"total": func.sum(InvoiceDailyStats.total_amount)},
+            )
+        else:
+            series = time_series(
+                db, Invoice.created_at, start_date, today + timedelta(days=1), "day", tz,
+                {"total": func.sum(Invoice.total_amount)},
             )
-            .filter(Invoice.created_at >= start_date)
-            .group_by("day")
-            .order_by("day")
-            .all()
-        )
 
-        day_totals = {day.strftime("%Y-%m-%d"): total for day, total in result}
-
-        response = []
-        for i in range(days):
-            date_obj = start_date + timedelta(days=i)
-            date_str = date_obj.strftime("%Y-%m-%d")
-            weekday = date_obj.strftime("%a")
-            response.append({
-                "date": date_str,
-                "day": weekday,
-                "total": float(day_totals.get(date_str, 0.0))
-            })
+        response = [
+            {
+                "date": point["start"].strftime("%Y-%m-%d"),
+                "day": point["start"].strftime("%a"),
+                "total": float(point["total"]),
+            }
+            for point in series
+        ]
 
         return jsonify(response)
     except Exception as e:
         return jsonify({"error": f"Failed to fetch revenue per day: {str(e)}"}), 500
-    finally:
-        db.close()
         
 @stats_bp.route("/stats/summary", methods=["GET"])
 def get_invoice_summary():
-    db = next(get_db())
+    db = get_session()
     try:
-        # Total number of invoices
-        total_invoices = db.query(func.count(Invoice.id)).scalar() or 0
+        # Total number of invoices and revenue, from the daily stats rollup
+        total_invoices, total_revenue = db.query(
+            func.coalesce(func.sum(InvoiceDailyStats.invoice_count), 0),
+            func.coalesce(func.sum(InvoiceDailyStats.total_amount), 0.0),
+        ).one()
 
-        # Total revenue (sum of total_amount)
-        total_revenue = db.query(func.sum(Invoice.total_amount)).scalar() or 0.0
-
-        # Number of unique clients
-        total_clients = db.query(func.count(func.distinct(Invoice.customer_name))).scalar() or 0
+        # Number of unique clients (normalized names, see the clients table)
+        total_clients = db.query(func.count(Client.id)).scalar() or 0
 
         return jsonify(
             {
@@ -69,37 +71,32 @@ def get_invoice_summary():
         )
     except Exception as e:
         return jsonify({"error": f"Failed to fetch invoice summary: {str(e)}"}), 500
-    finally:
-        db.close()
 
 @stats_bp.route("/stats/top-clients", methods=["GET"])
 def get_top_clients():
-    db = next(get_db())
+    db = get_session()
     try:
+        limit = int(request.args.get("limit", 10))
+        offset = int(request.args.get("offset", 0))
         data = (
-            db.query(
-                Invoice.customer_name.label("name"),
-                func.sum(Invoice.total_amount).label("total_value")
-            )
-            .group_by(Invoice.customer_name)
-            .order_by(desc(func.sum(Invoice.total_amount)))
-            .limit(10)
+            db.query(Client.name, Client.total_value)
+            .order_by(desc(Client.total_value), Client.id)
+            .offset(offset)
+            .limit(limit)
             .all()
         )
 
         result = [
             {"name": row.name, "totalValue": row.total_value or 0.0}
-            for row in data if row.name
+            for row in data
         ]
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": f"Failed to fetch top clients: {str(e)}"}), 500
-    finally:
-        db.close()
 
 @stats_bp.route("/stats/recent-invoices", methods=["GET"])
 def get_recent_invoices():
-    db = next(get_db())
+    db = get_session()
     try:
         invoices = (
             db.query(
@@ -108,7 +105,7 @@ def get_recent_invoices():
                 Invoice.customer_name,
                 Invoice.created_at,
                 Invoice.total_amount,
-                Invoice.due_date
+                Invoice.status
             )
             .order_by(desc(Invoice.created_at))
             .limit(10)
@@ -117,56 +114,37 @@ def get_recent_invoices():
 
         result = []
         for inv in invoices:
-            # Determine status
-            if inv.total_amount is not None and inv.total_amount <= 0:
-                status = "paid"
-            elif inv.due_date:
-                try:
-                    due = datetime.fromisoformat(inv.due_date)
-                    if due < datetime.utcnow():
-                        status = "overdue"
-                    else:
-                        status = "pending"
-                except ValueError:
-                    status = "pending"
-            else:
-                status = "pending"
-
             result.append({
                 "id": inv.id,
                 "invoiceNumber": inv.invoice_number,
                 "clientName": inv.customer_name,
                 "date": inv.created_at.isoformat(),
                 "amount": inv.total_amount,
-                "status": status
+                "status": inv.status or "pending"
             })
 
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": f"Failed to fetch recent invoices: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @stats_bp.route("/stats/total-revenue", methods=["GET"])
 def get_total_revenue():
-    db = next(get_db())
+    db = get_session()
     try:
-        total = db.query(func.sum(Invoice.total_amount)).scalar() or 0.0
+        total = db.query(func.sum(InvoiceDailyStats.total_amount)).scalar() or 0.0
         return jsonify({"total_revenue": total})
     except Exception as e:
         return jsonify({"error": f"Failed to fetch total revenue: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @stats_bp.route("/stats/revenue-per-company", methods=["GET"])
 def get_revenue_per_company():
-    db = next(get_db())
+    db = get_session()
     try:
         data = (
-            db.query(Invoice.company_name, func.sum(Invoice.total_amount))
-            .group_by(Invoice.company_name)
+            db.query(InvoiceDailyStats.company_name, func.sum(InvoiceDailyStats.total_amount))
+            .group_by(InvoiceDailyStats.company_name)
             .all()
         )
         result = [
@@ -177,5 +155,3 @@ def get_revenue_per_company():
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": f"Failed to fetch revenue per company: {str(e)}"}), 500
-    finally:
-        db.close()
@@ -0,0 +1,140 @@
+# scripts/convert_detector.py
+"""
+Convert the SavedModel detector to a TFLite model for the "tflite" backend.
+
+    python -m scripts.convert_detector --calibration-dir samples/
+    python -m scripts.convert_detector --mode dynamic --output models/detector_dynamic.tflite
+
+Modes:
+  int8     full integer quantization, calibrated on images from --calibration-dir
+  dynamic  int8 weights, float activations (no calibration data needed)
+  float16  float16 weights
+
+TFLite needs a fixed input size; images are resized to --input-size at
+inference time (see utils/detectors.TFLiteDetector). Check the result with
+python -m scripts.detector_parity before switching DETECTOR_BACKEND.
+
+Only TFLite builtin ops are allowed: the detector runs under tflite_runtime,
+which has no TF (Flex) kernels. The post-processing (NMS) of a standard
+SavedModel export needs them, so export the detector for TFLite first with
+the TF2 Object Detection API, which replaces it by the builtin
+TFLite_Detection_PostProcess op:
+
+    python object_detection/export_tflite_graph_tf2.py \
+        --pipeline_config_path <pipeline.config> \
+        --trained_checkpoint_dir <checkpoint dir> \
+        --output_directory models/tflite_export
+    python -m scripts.convert_detector --saved-model models/tflite_export/saved_model --calibration-dir samples/
+
+--allow-select-tf-ops converts anyway with TF ops; the model then needs the
+full tensorflow package to run.
+"""
+import argparse
+import os
+import sys
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+
+
+def calibration_images(directory: str, input_size: int, limit: int):
+    names = sorted(
+        name for name in os.listdir(directory)
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+    )[:limit]
+    for name in names:
+        image = cv2.imread(os.path.join(directory, name), cv2.IMREAD_COLOR)
+        if image is None:
+            continue
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        yield cv2.resize(image, (input_size, input_size), interpolation=cv2.INTER_AREA)
+
+
+def convert(saved_model: str, output: str, mode: str, input_size: int,
+            calibration_dir: str | None = None, num_calibration: int = 100,
+            allow_select_tf_ops: bool = False):
+    import tensorflow as tf
+
+    model = tf.saved_model.load(saved_model)
+    concrete = model.signatures["serving_default"]
+    input_dtype = concrete.inputs[0].dtype
+    concrete.inputs[0].set_shape([1, input_size, input_size, 3])
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([concrete], model)
+
+    if mode in ("int8", "dynamic"):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    if mode == "int8":
+        if not calibration_dir:
+            raise ValueError("int8 quantization needs --calibration-dir")
+        images = list(calibration_images(calibration_dir, input_size, num_calibration))
+        if not images:
+            raise ValueError(f"No calibration images found in {calibration_dir}")
+
+        def representative_dataset():
+            for image in images:
+                yield [tf.convert_to_tensor(image[np.newaxis, ...], dtype=input_dtype)]
+
+        converter.representative_dataset = representative_dataset
+
+    supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8] if mode == "int8" else []
+    supported_ops.append(tf.lite.OpsSet.TFLITE_BUILTINS)
+    if allow_select_tf_ops:
+        supported_ops.append(tf.lite.OpsSet.SELECT_TF_OPS)
+    converter.target_spec.supported_ops = supported_ops
+
+    try:
+        tflite_model = converter.convert()
+    except Exception as e:
+        if allow_select_tf_ops or not any(word in str(e) for word in ("Flex", "TF Select", "SELECT_TF_OPS")):
+            raise
+        raise RuntimeError(
+            "The model uses ops that are not TFLite builtins (usually the NMS post-processing), "
+            "which tflite_runtime cannot run. Export it with the Object Detection API "
+            "export_tflite_graph_tf2.py first (see python -m scripts.convert_detector --help), "
+            "or pass --allow-select-tf-ops to convert it for the full tensorflow interpreter."
+        ) from e
+    # Flex ops are stored as custom ops named Flex<Op>
+    if allow_select_tf_ops and b"Flex" in tflite_model:
+        print(
+            "WARNING: the converted model uses TF (Flex) ops. tflite_runtime cannot load it: "
+            "DETECTOR_BACKEND=tflite needs the full tensorflow package to run it.",
+            file=sys.stderr,
+        )
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "wb") as f:
+        f.write(tflite_model)
+    return len(tflite_model)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--saved-model", default="models/saved_model")
+    parser.add_argument("--output", default="models/detector_int8.tflite")
+    parser.add_argument("--mode", choices=("int8", "dynamic", "float16"), default="int8")
+    parser.add_argument("--input-size", type=int, default=640)
+    parser.add_argument("--calibration-dir", help="sample invoice images used to calibrate int8 ranges")
+    parser.add_argument("--num-calibration", type=int, default=100)
+    parser.add_argument("--allow-select-tf-ops", action="store_true",
+                        help="allow TF (Flex) ops, which tflite_runtime cannot run")
+    args = parser.parse_args()
+
+    size = convert(
+        args.saved_model,
+        args.output,
+        args.mode,
+        args.input_size,
+        args.calibration_dir,
+        args.num_calibration,
+        args.allow_select_tf_ops,
+    )
+    print(f"Wrote {args.output} ({size / 1024 / 1024:.1f} MB, {args.mode})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# scripts/detector_parity.py
+"""
+Parity check between two detector backends: every box the reference backend
+finds above the score threshold must be matched by a box of the candidate
+backend whose coordinates differ by at most --tolerance (normalized units).
+
+    python -m scripts.detector_parity --images samples/
+    python -m scripts.detector_parity --images samples/ --candidate tflite \\
+        --candidate-path models/detector_int8.tflite --tolerance 0.03
+
+Exits with status 1 when the share of matched boxes is below --min-match.
+"""
+import argparse
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from utils.detection import resize_for_detection
+from utils.detectors import create_detector
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+
+
+def load_images(directory: str):
+    for name in sorted(os.listdir(directory)):
+        if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+            continue
+        image = cv2.imread(os.path.join(directory, name), cv2.IMREAD_COLOR)
+        if image is not None:
+            yield name, image
+
+
+def compare(reference, candidate, tolerance: float) -> tuple[int, int, float, float]:
+    """
+    Returns (matched, total, worst coordinate difference, worst score
+    difference), the differences being taken over matched boxes.
+    """
+    ref_boxes, ref_scores, ref_classes = reference
+    cand_boxes, cand_scores, cand_classes = candidate
+    matched = 0
+    worst = worst_score = 0.0
+    for box, score, cls in zip(ref_boxes, ref_scores, ref_classes):
+        same_class = cand_classes == cls
+        if not same_class.any():
+            continue
+        diffs = np.abs(cand_boxes[same_class] - box).max(axis=1)
+        closest = diffs.argmin()
+        if diffs[closest] <= tolerance:
+            matched += 1
+            worst = max(worst, float(diffs[closest]))
+            worst_score = max(worst_score, abs(float(cand_scores[same_class][closest] - score)))
+    return matched, len(ref_boxes), worst, worst_score
+
+
+def filter_scores(detections, threshold: float):
+    boxes, scores, classes = detections
+    keep = scores >= threshold
+    return boxes[keep], scores[keep], classes[keep]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True)
+    parser.add_argument("--reference", default="saved_model")
+    parser.add_argument("--reference-path")
+    parser.add_argument("--candidate", default="tflite")
+    parser.add_argument("--candidate-path")
+    parser.add_argument("--long-edge", type=int, default=int(os.environ.get("DETECTION_LONG_EDGE", 1024)))
+    parser.add_argument("--score-threshold", type=float, default=0.5)
+    parser.add_argument("--tolerance", type=float, default=0.02)
+    parser.add_argument("--min-match", type=float, default=0.95)
+    parser.add_argument("--class-offset", type=int, default=0,
+                        help="added to candidate classes (TFLite exports are often 0-based)")
+    args = parser.parse_args()
+
+    reference = create_detector(args.reference, args.reference_path).load()
+    candidate = create_detector(args.candidate, args.candidate_path).load()
+
+    total_matched = total_boxes = 0
+    worst = worst_score = 0.0
+    for name, image in load_images(args.images):
+        image_rgb = cv2.cvtColor(resize_for_detection(image, args.long_edge), cv2.COLOR_BGR2RGB)
+        ref = filter_scores(reference.detect(image_rgb), args.score_threshold)
+        # Lower threshold on the candidate so borderline scores still match
+        cand_boxes, cand_scores, cand_classes = filter_scores(
+            candidate.detect(image_rgb), args.score_threshold / 2
+        )
+        cand = (cand_boxes, cand_scores, cand_classes + args.class_offset)
+        matched, boxes, image_worst, image_worst_score = compare(ref, cand, args.tolerance)
+        total_matched += matched
+        total_boxes += boxes
+        worst = max(worst, image_worst)
+        worst_score = max(worst_score, image_worst_score)
+        print(f"{name}: {matched}/{boxes} boxes within {args.tolerance}")
+
+    if total_boxes == 0:
+        print("No reference boxes found, nothing to compare")
+        sys.exit(1)
+
+    ratio = total_matched / total_boxes
+    print(
+        f"matched {total_matched}/{total_boxes} ({ratio:.1%}), worst difference {worst:.4f}, "
+        f"worst score difference {worst_score:.4f}"
+    )
+    if ratio < args.min_match:
+        print(f"FAIL: below the required {args.min_match:.0%}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
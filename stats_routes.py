@@ -1,18 +1,22 @@
 from flask import Blueprint, jsonify, request
 from sqlalchemy import func, desc, case, extract
 from sqlalchemy.orm import Session
-from database import get_db, Invoice, InvoiceItem
-from datetime import datetime, timedelta
-import calendar
+from database import get_session, Client, Invoice, InvoiceDailyStats, InvoiceItem
+from datetime import date, datetime, timedelta, timezone
+from utils.ocr_utils import client_key
+from utils.stats_cache import stats_cache
+from utils.time_series import daily_series, get_timezone, time_series
 
 # Création du Blueprint pour les routes de statistiques
 stats_bp = Blueprint('stats', __name__, url_prefix='/api/stats')
+# Réponses en cache jusqu'à la prochaine écriture de facture (ETag / 304)
+stats_cache.init_blueprint(stats_bp)
 
-def get_period_dates(period):
+def get_period_dates(period, today=None):
     """
     Retourne les dates de début et de fin en fonction de la période spécifiée
     """
-    today = datetime.utcnow().date()
+    today = today or datetime.utcnow().date()
     
     if period == 'week':
         start_date = today - timedelta(days=7)
@@ -49,6 +53,15 @@ def get_previous_period_dates(start_date, end_date):
     
     return prev_start_date, prev_end_date
 
+def day_range(column, start_date, end_date):
+    """
+    Conditions équivalentes à start_date <= date(column) <= end_date, écrites
+    comme un intervalle semi-ouvert sur la colonne elle-même pour que son
+    index puisse servir (func.date(column) l'empêche)
+    """
+    return (column >= datetime.combine(start_date, datetime.min.time()),
+            column < datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+
 def calculate_change_percentage(current_value, previous_value):
     """
     Calcule le pourcentage de changement entre deux valeurs
@@ -59,35 +72,58 @@ def calculate_change_percentage(current_value, previous_value):
     change = ((current_value - previous_value) / previous_value) * 100
     return round(change), change > 0
 
+def get_period_totals(db, start_date, end_date, *filters):
+    """
+    Nombre de factures, chiffre d'affaires, factures avec montant et clients
+    distincts des jours start_date à end_date (tous si start_date est None),
+    calculés sur la table invoice_daily_stats plutôt que sur les factures
+    """
+    query = db.query(
+        func.coalesce(func.sum(InvoiceDailyStats.invoice_count), 0).label('invoices'),
+        func.coalesce(func.sum(InvoiceDailyStats.total_amount), 0).label('revenue'),
+        func.coalesce(func.sum(InvoiceDailyStats.invoice_count - InvoiceDailyStats.null_total_count), 0).label('successful'),
+        func.count(func.distinct(func.nullif(InvoiceDailyStats.client_key, ''))).label('clients'),
+    ).filter(*filters)
+    if start_date:
+        query = query.filter(InvoiceDailyStats.day >= start_date, InvoiceDailyStats.day <= end_date)
+    return query.one()
+
+def get_status_counts(query):
+    """
+    Nombre de factures de la requête par statut, en un seul GROUP BY sur la
+    colonne indexée status
+    """
+    counts = {'paid': 0, 'pending': 0, 'overdue': 0}
+    rows = query.with_entities(Invoice.status, func.count(Invoice.id)).group_by(Invoice.status)
+    for status, count in rows:
+        if status in counts:
+            counts[status] = count
+    return counts
+
 @stats_bp.route('/dashboard', methods=['GET'])
 def get_dashboard_stats():
     """
     Endpoint pour obtenir les statistiques globales du tableau de bord
     """
     period = request.args.get('period', 'all')
-    db = next(get_db())
+    db = get_session()
     
     try:
         # Obtenir les dates de la période
         start_date, end_date = get_period_dates(period)
         
-        # Requête de base pour les factures de la période actuelle
-        query = db.query(Invoice)
-        if start_date:
-            query = query.filter(func.date(Invoice.created_at) >= start_date,
-                                func.date(Invoice.created_at) <= end_date)
-        
-        # Calculer les statistiques pour la période actuelle
-        total_revenue = query.with_entities(func.sum(Invoice.total_amount)).scalar() or 0
-        processed_invoices = query.count()
+        # Statistiques de la période actuelle, lues dans les agrégats journaliers
+        totals = get_period_totals(db, start_date, end_date)
+        total_revenue = totals.revenue
+        processed_invoices = totals.invoices
         
         # Nombre de clients actifs (clients distincts dans les factures)
-        active_clients = query.with_entities(func.count(func.distinct(Invoice.customer_name))).scalar() or 0
+        active_clients = totals.clients
         
         # Taux de traitement (pourcentage de factures traitées avec succès)
         # Hypothèse : une facture est traitée avec succès si elle a un montant total
         total_invoices = processed_invoices
-        successful_invoices = query.filter(Invoice.total_amount != None).count()
+        successful_invoices = totals.successful
         processing_rate = round((successful_invoices / total_invoices * 100) if total_invoices > 0 else 0)
         
         # Calculer les statistiques pour la période précédente
@@ -95,17 +131,14 @@ def get_dashboard_stats():
         period_comparison = {}
         
         if prev_start_date:
-            prev_query = db.query(Invoice).filter(
-                func.date(Invoice.created_at) >= prev_start_date,
-                func.date(Invoice.created_at) <= prev_end_date
-            )
+            prev_totals = get_period_totals(db, prev_start_date, prev_end_date)
             
-            prev_total_revenue = prev_query.with_entities(func.sum(Invoice.total_amount)).scalar() or 0
-            prev_processed_invoices = prev_query.count()
-            prev_active_clients = prev_query.with_entities(func.count(func.distinct(Invoice.customer_name))).scalar() or 0
+            prev_total_revenue = prev_totals.revenue
+            prev_processed_invoices = prev_totals.invoices
+            prev_active_clients = prev_totals.clients
             
             prev_total_invoices = prev_processed_invoices
-            prev_successful_invoices = prev_query.filter(Invoice.total_amount != None).count()
+            prev_successful_invoices = prev_totals.successful
             prev_processing_rate = round((prev_successful_invoices / prev_total_invoices * 100) if prev_total_invoices > 0 else 0)
             
             # Calculer les pourcentages de changement
@@ -142,18 +175,53 @@ def get_dashboard_stats():
         })
         
     except Exception as e:
-        db.close()
         return jsonify({"error": str(e)}), 500
-    finally:
-        db.close()
+
+def get_series_range(db, period, tz):
+    """
+    Jours de début et de fin (inclus, dans le fuseau tz) d'une série :
+    from/to s'ils sont donnés, sinon ceux de la période ('all' part de la
+    première facture)
+    """
+    today = datetime.now(tz).date()
+    if request.args.get('from') or request.args.get('to'):
+        try:
+            start_date = date.fromisoformat(request.args['from']) if request.args.get('from') else None
+            end_date = date.fromisoformat(request.args['to']) if request.args.get('to') else today
+        except ValueError:
+            raise ValueError("from and to must be dates (YYYY-MM-DD)")
+    else:
+        start_date, end_date = get_period_dates(period, today)
+    if start_date is None:
+        first = db.query(func.min(Invoice.created_at)).scalar()
+        start_date = first.replace(tzinfo=timezone.utc).astimezone(tz).date() if first else end_date
+    if start_date > end_date:
+        raise ValueError("from must not be after to")
+    return start_date, end_date
+
+def bucket_label(start, bucket, start_date, end_date):
+    """Libellé d'un intervalle de la série, borné à la période demandée"""
+    if bucket == 'hour':
+        return start.strftime('%Y-%m-%dT%H:00')
+    if bucket == 'week':
+        week_start = max(start.date(), start_date)
+        week_end = min(start.date() + timedelta(days=6), end_date)
+        return f"{week_start.isoformat()} to {week_end.isoformat()}"
+    if bucket == 'month':
+        return start.strftime('%Y-%m')
+    return start.date().isoformat()
 
 @stats_bp.route('/invoice-activity', methods=['GET'])
 def get_invoice_activity():
     """
     Endpoint pour obtenir l'activité des factures pour les graphiques
+
+    Paramètres : period ou from/to (AAAA-MM-JJ, inclus), groupBy (hour, day,
+    week, month) et tz (fuseau IANA, UTC par défaut). Une seule requête
+    groupée calcule toute la série ; les intervalles vides valent 0.
     """
     period = request.args.get('period', '30days')
-    group_by = request.args.get('groupBy')
+    group_by = request.args.get('groupBy') or request.args.get('bucket')
     
     # Déterminer le regroupement par défaut en fonction de la période
     if not group_by:
@@ -164,110 +232,46 @@ def get_invoice_activity():
         else:  # '90days'
             group_by = 'week'
     
-    db = next(get_db())
+    db = get_session()
+    
+    try:
+        tz = get_timezone(request.args.get('tz'))
+        start_date, end_date = get_series_range(db, period, tz)
+        if tz.key == 'UTC' and group_by != 'hour':
+            # Les agrégats journaliers (jours UTC) suffisent
+            series = daily_series(
+                db, InvoiceDailyStats.day, start_date, end_date, group_by,
+                {'invoices': func.sum(InvoiceDailyStats.invoice_count),
+                 'amount': func.sum(InvoiceDailyStats.total_amount)},
+            )
+        else:
+            series = time_series(
+                db, Invoice.created_at,
+                datetime.combine(start_date, datetime.min.time()),
+                datetime.combine(end_date + timedelta(days=1), datetime.min.time()),
+                group_by, tz,
+                {'invoices': func.count(Invoice.id), 'amount': func.sum(Invoice.total_amount)},
+            )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     try:
-        # Obtenir les dates de la période
-        start_date, end_date = get_period_dates(period)
-        
-        # Préparer les listes pour les résultats
-        labels = []
-        invoices_data = []
-        amounts_data = []
-        
-        if group_by == 'day':
-            # Générer toutes les dates de la période
-            current_date = start_date
-            while current_date <= end_date:
-                labels.append(current_date.isoformat())
-                
-                # Compter les factures pour cette date
-                day_invoices = db.query(Invoice).filter(
-                    func.date(Invoice.created_at) == current_date
-                ).count()
-                invoices_data.append(day_invoices)
-                
-                # Calculer le montant total pour cette date
-                day_amount = db.query(func.sum(Invoice.total_amount)).filter(
-                    func.date(Invoice.created_at) == current_date
-                ).scalar() or 0
-                amounts_data.append(float(day_amount))
-                
-                current_date += timedelta(days=1)
-                
-        elif group_by == 'week':
-            # Calculer le nombre de semaines dans la période
-            weeks = (end_date - start_date).days // 7 + 1
-            
-            for i in range(weeks):
-                week_start = start_date + timedelta(days=i*7)
-                week_end = min(week_start + timedelta(days=6), end_date)
-                labels.append(f"{week_start.isoformat()} to {week_end.isoformat()}")
-                
-                # Compter les factures pour cette semaine
-                week_invoices = db.query(Invoice).filter(
-                    func.date(Invoice.created_at) >= week_start,
-                    func.date(Invoice.created_at) <= week_end
-                ).count()
-                invoices_data.append(week_invoices)
-                
-                # Calculer le montant total pour cette semaine
-                week_amount = db.query(func.sum(Invoice.total_amount)).filter(
-                    func.date(Invoice.created_at) >= week_start,
-                    func.date(Invoice.created_at) <= week_end
-                ).scalar() or 0
-                amounts_data.append(float(week_amount))
-                
-        elif group_by == 'month':
-            # Déterminer le nombre de mois dans la période
-            months_diff = (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
-            
-            for i in range(months_diff):
-                month = (start_date.month + i - 1) % 12 + 1
-                year = start_date.year + (start_date.month + i - 1) // 12
-                
-                month_start = datetime(year, month, 1).date()
-                last_day = calendar.monthrange(year, month)[1]
-                month_end = datetime(year, month, last_day).date()
-                
-                if month_end > end_date:
-                    month_end = end_date
-                
-                labels.append(f"{year}-{month:02d}")
-                
-                # Compter les factures pour ce mois
-                month_invoices = db.query(Invoice).filter(
-                    func.date(Invoice.created_at) >= month_start,
-                    func.date(Invoice.created_at) <= month_end
-                ).count()
-                invoices_data.append(month_invoices)
-                
-                # Calculer le montant total pour ce mois
-                month_amount = db.query(func.sum(Invoice.total_amount)).filter(
-                    func.date(Invoice.created_at) >= month_start,
-                    func.date(Invoice.created_at) <= month_end
-                ).scalar() or 0
-                amounts_data.append(float(month_amount))
-        
         return jsonify({
-            "labels": labels,
+            "labels": [bucket_label(point['start'], group_by, start_date, end_date) for point in series],
             "datasets": [
                 {
                     "label": "Factures traitées",
-                    "data": invoices_data
+                    "data": [point['invoices'] for point in series]
                 },
                 {
                     "label": "Montant (€)",
-                    "data": amounts_data
+                    "data": [float(point['amount']) for point in series]
                 }
             ]
         })
         
     except Exception as e:
-        db.close()
         return jsonify({"error": str(e)}), 500
-    finally:
-        db.close()
 
 @stats_bp.route('/top-clients', methods=['GET'])
 def get_top_clients():
@@ -276,28 +280,25 @@ def get_top_clients():
     """
     sort_by = request.args.get('sortBy', 'revenue')
     limit = int(request.args.get('limit', 5))
+    offset = int(request.args.get('offset', 0))
     
-    db = next(get_db())
+    db = get_session()
     
     try:
         # Calculer le revenu total pour le calcul des pourcentages
-        total_revenue = db.query(func.sum(Invoice.total_amount)).scalar() or 0
+        total_revenue = db.query(func.sum(InvoiceDailyStats.total_amount)).scalar() or 0
         
-        # Requête pour obtenir les statistiques par client
-        query = db.query(
-            Invoice.company_name.label('name'),
-            func.count(Invoice.id).label('invoiceCount'),
-            func.sum(Invoice.total_amount).label('totalValue')
-        ).group_by(Invoice.company_name)
+        # Les totaux par client sont lus dans la table clients (indexée)
+        query = db.query(Client)
         
         # Trier selon le critère spécifié
         if sort_by == 'revenue':
-            query = query.order_by(desc('totalValue'))
+            query = query.order_by(desc(Client.total_value), Client.id)
         else:  # 'volume'
-            query = query.order_by(desc('invoiceCount'))
+            query = query.order_by(desc(Client.invoice_count), Client.id)
         
-        # Limiter le nombre de résultats
-        clients = query.limit(limit).all()
+        # Paginer les résultats
+        clients = query.offset(offset).limit(limit).all()
         
         result = {
             "clients": [],
@@ -305,86 +306,73 @@ def get_top_clients():
         }
         
         # Formater les résultats
-        for i, client in enumerate(clients):
-            percentage = round((client.totalValue / total_revenue * 100) if total_revenue > 0 else 0)
+        for client in clients:
+            percentage = round((client.total_value / total_revenue * 100) if total_revenue > 0 else 0)
             
             result["clients"].append({
-                "id": f"client-{i+1}",  # ID généré car nous n'avons pas d'ID client dans la requête
+                "id": f"client-{client.id}",
                 "name": client.name,
-                "totalValue": float(client.totalValue),
-                "invoiceCount": client.invoiceCount,
+                "totalValue": float(client.total_value),
+                "invoiceCount": client.invoice_count,
                 "percentage": percentage
             })
         
         return jsonify(result)
         
     except Exception as e:
-        db.close()
         return jsonify({"error": str(e)}), 500
-    finally:
-        db.close()
 
 @stats_bp.route('/client/<client_name>', methods=['GET'])
 def get_client_stats(client_name):
     """
-    Endpoint pour obtenir les statistiques d'un client spécifique
+    Endpoint pour obtenir les statistiques d'un client spécifique (nom tel
+    que listé par /top-clients, comparé sous sa forme normalisée)
     """
     period = request.args.get('period', 'all')
+    key = client_key(client_name)
+    if key is None:
+        # Nom vide : aucun client (et non les factures sans client)
+        return jsonify({"error": "Client not found"}), 404
     
-    db = next(get_db())
+    db = get_session()
     
     try:
         # Obtenir les dates de la période
         start_date, end_date = get_period_dates(period)
         
         # Requête de base pour les factures du client
-        query = db.query(Invoice).filter(Invoice.company_name == client_name)
+        query = db.query(Invoice).filter(Invoice.client_key == key)
         
         if start_date:
-            query = query.filter(func.date(Invoice.created_at) >= start_date,
-                                func.date(Invoice.created_at) <= end_date)
+            query = query.filter(*day_range(Invoice.created_at, start_date, end_date))
         
-        # Calculer les statistiques de base
-        total_invoices = query.count()
-        total_value = query.with_entities(func.sum(Invoice.total_amount)).scalar() or 0
+        # Calculer les statistiques de base, à partir des agrégats journaliers
+        client_filters = [InvoiceDailyStats.client_key == key]
+        totals = get_period_totals(db, start_date, end_date, *client_filters)
+        total_invoices = totals.invoices
+        total_value = totals.revenue
         average_value = total_value / total_invoices if total_invoices > 0 else 0
         
-        # Calculer les statuts de paiement
-        # Note: Comme nous n'avons pas de statut de paiement dans notre modèle actuel,
-        # nous allons simuler cela en fonction des dates
+        # Calculer les statuts de paiement (statut persisté, voir crud.invoice_status)
         today = datetime.utcnow().date()
-        
-        paid_count = query.filter(
-            func.date(Invoice.invoice_date) <= today - timedelta(days=30)
-        ).count()
-        
-        pending_count = query.filter(
-            func.date(Invoice.invoice_date) > today - timedelta(days=30),
-            func.date(Invoice.invoice_date) <= today
-        ).count()
-        
-        overdue_count = query.filter(
-            func.date(Invoice.due_date) < today
-        ).count()
-        
-        # Calculer l'activité par mois (pour les 5 derniers mois)
-        activity_labels = []
-        activity_data = []
-        
-        for i in range(4, -1, -1):
-            month_date = today.replace(day=1) - timedelta(days=i*30)
-            month_name = month_date.strftime("%b")
-            activity_labels.append(month_name)
-            
-            month_start = month_date
-            month_end = (month_date.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
-            
-            month_count = query.filter(
-                func.date(Invoice.created_at) >= month_start,
-                func.date(Invoice.created_at) <= month_end
-            ).count()
-            
-            activity_data.append(month_count)
+        status_counts = get_status_counts(query)
+        paid_count = status_counts['paid']
+        pending_count = status_counts['pending']
+        overdue_count = status_counts['overdue']
+        
+        # Calculer l'activité par mois (pour les 5 derniers mois), en une requête groupée
+        first_month = today.replace(day=1)
+        for _ in range(4):
+            first_month = (first_month - timedelta(days=1)).replace(day=1)
+        if start_date:
+            client_filters.append(InvoiceDailyStats.day >= start_date)
+        activity = daily_series(
+            db, InvoiceDailyStats.day, first_month, today, 'month',
+            {'invoices': func.sum(InvoiceDailyStats.invoice_count)},
+            filters=client_filters,
+        )
+        activity_labels = [point['start'].strftime("%b") for point in activity]
+        activity_data = [point['invoices'] for point in activity]
         
         return jsonify({
             "totalInvoices": total_invoices,
@@ -402,10 +390,7 @@ def get_client_stats(client_name):
         })
         
     except Exception as e:
-        db.close()
         return jsonify({"error": str(e)}), 500
-    finally:
-        db.close()
 
 @stats_bp.route('/invoice-status', methods=['GET'])
 def get_invoice_status_stats():
@@ -414,7 +399,7 @@ def get_invoice_status_stats():
     """
     period = request.args.get('period', 'all')
     
-    db = next(get_db())
+    db = get_session()
     
     try:
         # Obtenir les dates de la période
@@ -424,29 +409,14 @@ def get_invoice_status_stats():
         query = db.query(Invoice)
         
         if start_date:
-            query = query.filter(func.date(Invoice.created_at) >= start_date,
-                                func.date(Invoice.created_at) <= end_date)
-        
-        # Calculer le nombre total de factures
-        total_count = query.count()
-        
-        # Calculer les statuts de paiement
-        # Note: Comme nous n'avons pas de statut de paiement dans notre modèle actuel,
-        # nous allons simuler cela en fonction des dates
-        today = datetime.utcnow().date()
-        
-        paid_count = query.filter(
-            func.date(Invoice.invoice_date) <= today - timedelta(days=30)
-        ).count()
-        
-        pending_count = query.filter(
-            func.date(Invoice.invoice_date) > today - timedelta(days=30),
-            func.date(Invoice.invoice_date) <= today
-        ).count()
+            query = query.filter(*day_range(Invoice.created_at, start_date, end_date))
         
-        overdue_count = query.filter(
-            func.date(Invoice.due_date) < today
-        ).count()
+        # Calculer les statuts de paiement (statut persisté, voir crud.invoice_status)
+        status_counts = get_status_counts(query)
+        paid_count = status_counts['paid']
+        pending_count = status_counts['pending']
+        overdue_count = status_counts['overdue']
+        total_count = paid_count + pending_count + overdue_count
         
         # Calculer les pourcentages
         paid_percent = round((paid_count / total_count * 100) if total_count > 0 else 0)
@@ -468,7 +438,4 @@ def get_invoice_status_stats():
         })
         
     except Exception as e:
-        db.close()
         return jsonify({"error": str(e)}), 500
-    finally:
-        db.close()
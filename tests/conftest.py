@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Modules are imported from the repository root, as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# database.py connects at import time: never to the PostgreSQL default from the tests
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'invoice_ocr_tests.db')}")
@@ -0,0 +1,34 @@
+import datetime
+
+from crud import _client_deltas, _daily_stats_deltas
+
+
+def _row(total_amount):
+    return {
+        "created_at": datetime.datetime(2024, 3, 1, 12),
+        "company_name": "Acme",
+        "client_key": "bob co",
+        "total_amount": total_amount,
+    }
+
+
+def test_total_from_none_to_zero_moves_null_total_count():
+    deltas = _daily_stats_deltas(added=[_row(0.0)], removed=[_row(None)])
+    assert len(deltas) == 1
+    assert deltas[0]["invoice_count"] == 0
+    assert deltas[0]["total_amount"] == 0.0
+    assert deltas[0]["null_total_count"] == -1
+
+
+def test_unchanged_invoice_has_no_delta():
+    assert _daily_stats_deltas(added=[_row(10.0)], removed=[_row(10.0)]) == []
+
+
+def test_client_name_is_the_trimmed_name_of_the_latest_invoice():
+    rows = [
+        {**_row(10.0), "customer_name": " Bob  Co ", "created_at": datetime.datetime(2024, 3, 2)},
+        {**_row(5.0), "customer_name": "bob co", "created_at": datetime.datetime(2024, 3, 1)},
+    ]
+    (client,) = _client_deltas(rows)
+    assert client["name"] == "Bob  Co"
+    assert client["invoice_count"] == 2
@@ -0,0 +1,23 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from database import POOL_CHECKOUT_TIMEOUTS, TimedQueuePool
+
+
+def _timeouts(role: str) -> float:
+    return POOL_CHECKOUT_TIMEOUTS._values.get((role,), 0)
+
+
+def test_exhausted_pool_counts_checkout_timeouts():
+    engine = create_engine(
+        "sqlite://", poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05,
+        connect_args={"check_same_thread": False},
+    )
+    engine.pool.role = "test"
+    before = _timeouts("test")
+    with engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+    assert _timeouts("test") == before + 1
+    engine.dispose()
@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+from utils.detectors import DETECTOR_MODEL_PATHS
+
+# Same defaults as python -m scripts.detector_parity
+PARITY_IMAGES = os.environ.get("DETECTOR_PARITY_IMAGES", "samples")
+SCORE_THRESHOLD = 0.5
+TOLERANCE = 0.02
+SCORE_TOLERANCE = 0.1
+MIN_MATCH = 0.95
+
+pytestmark = pytest.mark.skipif(
+    not all(os.path.exists(path) for path in (*DETECTOR_MODEL_PATHS.values(), PARITY_IMAGES)),
+    reason="detector models or parity images not present",
+)
+
+
+def test_tflite_boxes_match_saved_model():
+    pytest.importorskip("tensorflow")
+    import cv2
+
+    from scripts.detector_parity import compare, filter_scores, load_images
+    from utils.detection import resize_for_detection
+    from utils.detectors import create_detector
+
+    reference = create_detector("saved_model", DETECTOR_MODEL_PATHS["saved_model"]).load()
+    candidate = create_detector("tflite", DETECTOR_MODEL_PATHS["tflite"]).load()
+
+    total_matched = total_boxes = 0
+    for _, image in load_images(PARITY_IMAGES):
+        image_rgb = cv2.cvtColor(resize_for_detection(image, 1024), cv2.COLOR_BGR2RGB)
+        ref = filter_scores(reference.detect(image_rgb), SCORE_THRESHOLD)
+        cand = filter_scores(candidate.detect(image_rgb), SCORE_THRESHOLD / 2)
+        matched, boxes, worst, worst_score = compare(ref, cand, TOLERANCE)
+        assert worst <= TOLERANCE
+        assert worst_score <= SCORE_TOLERANCE
+        total_matched += matched
+        total_boxes += boxes
+
+    if total_boxes == 0:
+        pytest.skip("no reference boxes found in the parity images")
+    assert total_matched / total_boxes >= MIN_MATCH
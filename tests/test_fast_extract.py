@@ -0,0 +1,47 @@
+from utils.fast_extract import extract_fields, missing_fields
+
+# ROIs are joined the way pipeline.ocr_document joins them
+SEPARATOR = "   |||   "
+
+
+def ocr_text(*rois: str) -> str:
+    return SEPARATOR.join(rois)
+
+
+def test_invoice_number_in_same_roi():
+    data, confidences = extract_fields(ocr_text("ACME Corp", "Invoice No: INV-2024-001", "Invoice Date: 12/01/2024"))
+    assert data["Invoice Number"] == "INV-2024-001"
+    assert confidences["Invoice Number"] == 0.95
+
+
+def test_invoice_number_in_next_roi():
+    data, confidences = extract_fields(ocr_text("INVOICE #", "10234", "Date: 03/02/2024"))
+    assert data["Invoice Number"] == "10234"
+    assert confidences["Invoice Number"] == 0.85
+
+
+def test_french_invoice_number():
+    data, _ = extract_fields(ocr_text("Facture n° F2024/17", "Date de facture : 05/03/2024"))
+    assert data["Invoice Number"] == "F2024/17"
+
+
+def test_empty_invoice_number_does_not_capture_next_label():
+    texts = "Invoice Number: Invoice Date: 12/01/2024 Total Due: 99.00"
+    data, confidences = extract_fields(texts)
+    assert data["Invoice Number"] == ""
+    assert confidences["Invoice Number"] == 0.0
+    assert data["Invoice Date"] == "12/01/2024"
+    assert "Invoice Number" in missing_fields(confidences)
+
+
+def test_empty_invoice_number_does_not_capture_next_roi_label():
+    data, confidences = extract_fields(ocr_text("Invoice number:", "Date 12/01/2024", "Total 99.00"))
+    assert data["Invoice Number"] == ""
+    assert "Invoice Number" in missing_fields(confidences)
+
+
+def test_invoice_number_without_digit_is_rejected():
+    data, _ = extract_fields(ocr_text("Invoice No.: No", "Bill To: Bob Co"))
+    assert data["Invoice Number"] == ""
+    data, _ = extract_fields("Invoice # PENDING")
+    assert data["Invoice Number"] == ""
@@ -0,0 +1,20 @@
+import uuid
+
+from database import Base, engine
+from utils.llm_cache import LLMCache
+
+
+def test_workers_on_different_prompt_versions_keep_each_others_entries():
+    Base.metadata.create_all(bind=engine)
+    texts = f"Invoice {uuid.uuid4()}"
+    old_worker, new_worker = LLMCache(), LLMCache()
+
+    old_worker.set("model", "v1", texts, {"Total": "1"})
+    new_worker.set("model", "v2", texts, {"Total": "2"})
+    assert new_worker.get("model", "v2", texts) == {"Total": "2"}
+
+    # A worker started after both still reads each version from the table
+    restarted = LLMCache()
+    assert restarted.get("model", "v1", texts) == {"Total": "1"}
+    assert restarted.get("model", "v2", texts) == {"Total": "2"}
+    assert restarted.get("model", "v3", texts) is None
@@ -0,0 +1,18 @@
+import pytest
+
+from utils.ocr_utils import parse_amount
+
+
+def test_parse_amount():
+    assert parse_amount(None) is None
+    assert parse_amount("") is None
+    assert parse_amount(50) == 50.0
+    assert parse_amount("50") == 50.0
+    assert parse_amount("1 234,50 €") == 1234.5
+    assert parse_amount("$1,234.50") == 1234.5
+
+
+@pytest.mark.parametrize("value", ["abc", "1-2", True, [1]])
+def test_parse_amount_rejects_non_numbers(value):
+    with pytest.raises(ValueError):
+        parse_amount(value)
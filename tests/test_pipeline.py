@@ -0,0 +1,49 @@
+import pipeline
+from utils import fast_extract
+
+TEXTS = pipeline.TEXT_SEPARATOR.join((
+    "ACME Corp", "Invoice No: INV-2024-001", "Invoice Date: 12/01/2024", "Bill To: Bob Co",
+    "Widget 2 x 10.00", "Total: 20.00",
+))
+
+
+def fake_llm(requested: list):
+    def extract(texts, timings=None, fields=None):
+        requested.append(fields)
+        data = {
+            "Company Name": "ACME Corp",
+            "Customer Name": "Bob Co",
+            "Description": ["Widget"],
+            "Quantity": ["2"],
+            "Unit Price": ["10.00"],
+            "Amount": ["20.00"],
+        }
+        return data, ""
+
+    return extract
+
+
+def test_fast_path_hit_skips_the_llm(monkeypatch):
+    requested = []
+    monkeypatch.setattr(pipeline, "_extract_with_llm", fake_llm(requested))
+    invoice_data, _ = pipeline.extract_invoice_data(TEXTS)
+    assert requested == []
+    assert invoice_data["Invoice Number"] == "INV-2024-001"
+    assert invoice_data["Total"] == "20.00"
+
+
+def test_partial_path_keeps_the_items_returned_by_the_llm(monkeypatch):
+    requested = []
+    monkeypatch.setattr(pipeline, "_extract_with_llm", fake_llm(requested))
+    monkeypatch.setattr(
+        fast_extract, "FAST_PATH_REQUIRED_FIELDS", ["Invoice Number", "Invoice Date", "Total", "Company Name"],
+    )
+    invoice_data, _ = pipeline.extract_invoice_data(TEXTS)
+
+    fields = requested[0]
+    assert set(fast_extract.LLM_ONLY_FIELDS) <= set(fields)
+    assert "Invoice Number" not in fields
+    assert invoice_data["Invoice Number"] == "INV-2024-001"
+    assert invoice_data["Customer Name"] == "Bob Co"
+    assert invoice_data["Description"] == ["Widget"]
+    assert invoice_data["Amount"] == ["20.00"]
@@ -0,0 +1,163 @@
+# detection.py
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+def resize_for_detection(image, long_edge: int):
+    """
+    Downscale the image so its longest side is at most long_edge pixels,
+    keeping the aspect ratio. Detection boxes are normalized, so they still
+    map onto the original full-resolution image.
+    """
+    import cv2
+
+    height, width = image.shape[:2]
+    if not long_edge or max(height, width) <= long_edge:
+        return image
+    scale = long_edge / max(height, width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+class _DetectionRequest:
+    def __init__(self, image):
+        self.image = image
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class DetectionBatcher:
+    """
+    Collects images from concurrent callers for up to max_wait_ms and runs
+    them through the detector as a single batch.
+
+    run_batch receives a uint8 array of shape [N, H, W, 3] and must return a
+    dict of numpy arrays with a leading batch dimension, in the format of the
+    TF object detection API (num_detections, detection_boxes, ...).
+    Images of different sizes are zero-padded to the largest one in the
+    batch; boxes are mapped back so they stay normalized to each image.
+    When a batch of several images fails but the images pass one by one
+    (a model whose signature only takes a batch of 1), batching is turned
+    off instead of failing the requests.
+    """
+
+    def __init__(self, run_batch, max_batch_size: int = 8, max_wait_ms: float = 5):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+
+    def detect(self, image) -> dict:
+        """Detect on one RGB image; returns boxes, scores and classes."""
+        self._ensure_thread()
+        request = _DetectionRequest(image)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            histogram = dict(sorted(self._batch_sizes.items()))
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": sum(histogram.values()),
+            "images": sum(size * count for size, count in histogram.items()),
+            "batch_size_histogram": histogram,
+        }
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name="detection-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            requests = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(requests) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    requests.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._run(requests)
+
+    def _run(self, requests):
+        try:
+            results = self._detect_batch([r.image for r in requests])
+            for request, result in zip(requests, results):
+                request.result = result
+        except Exception as e:
+            if len(requests) == 1:
+                requests[0].error = e
+            else:
+                self._run_one_by_one(requests, e)
+        finally:
+            with self._stats_lock:
+                self._batch_sizes[len(requests)] += 1
+            for request in requests:
+                request.done.set()
+
+    def _run_one_by_one(self, requests, batch_error: Exception):
+        failed = 0
+        for request in requests:
+            try:
+                request.result = self._detect_batch([request.image])[0]
+            except Exception as e:
+                request.error = e
+                failed += 1
+        if not failed:
+            logger.warning(
+                "Detection batch of %d images failed (%s) but single images pass: disabling batching",
+                len(requests), batch_error,
+            )
+            self.max_batch_size = 1
+
+    def _detect_batch(self, images) -> list[dict]:
+        import numpy as np
+
+        height = max(image.shape[0] for image in images)
+        width = max(image.shape[1] for image in images)
+
+        if len(images) == 1:
+            batch = images[0][np.newaxis, ...]
+        else:
+            batch = np.zeros((len(images), height, width, 3), dtype=np.uint8)
+            for i, image in enumerate(images):
+                batch[i, : image.shape[0], : image.shape[1]] = image
+
+        detections = self.run_batch(batch)
+
+        results = []
+        for i, image in enumerate(images):
+            num_detections = int(detections["num_detections"][i])
+            boxes = detections["detection_boxes"][i, :num_detections].copy()
+            # Boxes are normalized to the padded frame, rescale them to the image
+            boxes[:, [0, 2]] *= height / image.shape[0]
+            boxes[:, [1, 3]] *= width / image.shape[1]
+            results.append({
+                "detection_boxes": np.clip(boxes, 0.0, 1.0),
+                "detection_scores": detections["detection_scores"][i, :num_detections],
+                "detection_classes": detections["detection_classes"][i, :num_detections].astype(np.int64),
+            })
+        return results
@@ -0,0 +1,188 @@
+# detectors.py
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# "saved_model" (TensorFlow) or "tflite" (quantized model, see scripts/convert_detector.py)
+DETECTOR_BACKEND = os.environ.get("DETECTOR_BACKEND", "saved_model")
+DETECTOR_MODEL_PATHS = {
+    "saved_model": "models/saved_model",
+    "tflite": "models/detector_int8.tflite",
+}
+DETECTOR_THREADS = int(os.environ.get("DETECTOR_THREADS", os.cpu_count() or 1))
+
+OUTPUT_KEYS = ("detection_boxes", "detection_scores", "detection_classes", "num_detections")
+
+
+class Detector:
+    """
+    Common detector interface. detect_batch takes a uint8 RGB array of shape
+    [N, H, W, 3] and returns numpy arrays with a leading batch dimension
+    (num_detections, detection_boxes, detection_scores, detection_classes),
+    boxes being normalized (ymin, xmin, ymax, xmax).
+    """
+
+    name = "base"
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+
+    def load(self):
+        raise NotImplementedError
+
+    def detect_batch(self, batch) -> dict:
+        raise NotImplementedError
+
+    def detect(self, image):
+        """Detect on one RGB image; returns (boxes, scores, classes)."""
+        detections = self.detect_batch(image[np.newaxis, ...])
+        num_detections = int(detections["num_detections"][0])
+        return (
+            detections["detection_boxes"][0, :num_detections],
+            detections["detection_scores"][0, :num_detections],
+            detections["detection_classes"][0, :num_detections].astype(np.int64),
+        )
+
+    def warmup(self, height: int, width: int):
+        self.detect_batch(np.full((1, height, width, 3), 255, dtype=np.uint8))
+
+    def accepts_batches(self, height: int, width: int) -> bool:
+        """
+        Whether the model takes a batch of several images: TF2 object
+        detection API exports usually have a [1, None, None, 3] signature.
+        """
+        try:
+            detections = self.detect_batch(np.full((2, height, width, 3), 255, dtype=np.uint8))
+        except Exception:
+            return False
+        return len(detections["num_detections"]) == 2
+
+
+class SavedModelDetector(Detector):
+    name = "saved_model"
+
+    def load(self):
+        # TensorFlow is only imported here, off the import path of the app
+        import tensorflow as tf
+
+        self._tf = tf
+        self.model = tf.saved_model.load(self.model_path)
+        return self
+
+    def detect_batch(self, batch) -> dict:
+        detections = self.model(self._tf.convert_to_tensor(batch, dtype=self._tf.uint8))
+        return {key: value.numpy() for key, value in detections.items()}
+
+
+class TFLiteDetector(Detector):
+    """
+    Runs a converted (typically int8-quantized) model under the TFLite
+    interpreter. These models have a fixed input size, so images are resized
+    to it; boxes are normalized and still map onto the original image.
+    """
+
+    name = "tflite"
+
+    def __init__(self, model_path: str, num_threads: int = DETECTOR_THREADS):
+        super().__init__(model_path)
+        self.num_threads = num_threads
+        # The interpreter is not thread-safe
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=self.model_path, num_threads=self.num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()
+        return self
+
+    def _prepare_input(self, image):
+        _, height, width, _ = self.input_detail["shape"]
+        if image.shape[:2] != (height, width):
+            image = cv2.resize(image, (int(width), int(height)), interpolation=cv2.INTER_AREA)
+
+        dtype = self.input_detail["dtype"]
+        if dtype == np.uint8:
+            return image[np.newaxis, ...]
+        if dtype == np.int8:
+            scale, zero_point = self.input_detail["quantization"]
+            quantized = np.round(image.astype(np.float32) / scale + zero_point)
+            return np.clip(quantized, -128, 127).astype(np.int8)[np.newaxis, ...]
+        return image.astype(dtype)[np.newaxis, ...]
+
+    def _read_output(self, detail):
+        value = self.interpreter.get_tensor(detail["index"])
+        scale, zero_point = detail.get("quantization", (0.0, 0))
+        if scale:
+            value = (value.astype(np.float32) - zero_point) * scale
+        return value
+
+    def _named_outputs(self, values: list) -> dict:
+        """Map the interpreter outputs onto the TF object detection API names."""
+        by_name = {}
+        for detail, value in zip(self.output_details, values):
+            for key in OUTPUT_KEYS:
+                if key in detail["name"]:
+                    by_name[key] = value
+        if len(by_name) == len(OUTPUT_KEYS):
+            return by_name
+
+        # Converted graphs often lose the names: tell outputs apart by shape,
+        # classes being the [1, N] output holding whole numbers.
+        by_name = {}
+        pairs = []
+        for value in values:
+            if value.size == 1:
+                by_name["num_detections"] = value.reshape(1)
+            elif value.ndim == 3 and value.shape[-1] == 4:
+                by_name["detection_boxes"] = value
+            else:
+                pairs.append(value)
+        if len(pairs) != 2 or len(by_name) != 2:
+            raise RuntimeError("Unrecognized TFLite detector outputs")
+        first, second = pairs
+        if np.all(np.mod(first, 1) == 0) and not np.all(np.mod(second, 1) == 0):
+            by_name["detection_classes"], by_name["detection_scores"] = first, second
+        else:
+            by_name["detection_classes"], by_name["detection_scores"] = second, first
+        return by_name
+
+    def accepts_batches(self, height: int, width: int) -> bool:
+        # Images run one at a time at the fixed input size: a batch brings no
+        # speedup, and its padding to the largest page would shrink the others
+        return False
+
+    def detect_batch(self, batch) -> dict:
+        results = []
+        with self._lock:
+            for image in batch:
+                self.interpreter.set_tensor(self.input_detail["index"], self._prepare_input(image))
+                self.interpreter.invoke()
+                values = [self._read_output(detail) for detail in self.output_details]
+                results.append(self._named_outputs(values))
+        return {key: np.concatenate([r[key] for r in results], axis=0) for key in OUTPUT_KEYS}
+
+
+DETECTOR_BACKENDS = {
+    SavedModelDetector.name: SavedModelDetector,
+    TFLiteDetector.name: TFLiteDetector,
+}
+
+
+def create_detector(backend: str | None = None, model_path: str | None = None) -> Detector:
+    backend = backend or DETECTOR_BACKEND
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(
+            f"Unknown detector backend '{backend}' (must be one of {', '.join(DETECTOR_BACKENDS)})"
+        )
+    model_path = model_path or os.environ.get("DETECTOR_MODEL_PATH") or DETECTOR_MODEL_PATHS[backend]
+    return DETECTOR_BACKENDS[backend](model_path)
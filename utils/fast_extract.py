@@ -0,0 +1,181 @@
+# fast_extract.py
+import os
+import re
+import threading
+
+INVOICE_FIELDS = [
+    "Company Name",
+    "Company Address",
+    "Customer Name",
+    "Customer Address",
+    "Invoice Number",
+    "Invoice Date",
+    "Due Date",
+    "Description",
+    "Quantity",
+    "Unit Price",
+    "Taxes",
+    "Amount",
+    "Total",
+]
+
+# The LLM is skipped when all of these were found with enough confidence; the
+# fields without a rule (names, addresses, line items) are then left empty.
+# Required fields without a rule (e.g. Company Name) never skip the LLM but
+# shorten its prompt (see pipeline.extract_invoice_data)
+FAST_PATH_REQUIRED_FIELDS = [
+    field.strip()
+    for field in os.environ.get("FAST_PATH_REQUIRED_FIELDS", "Invoice Number,Invoice Date,Total").split(",")
+    if field.strip()
+]
+FAST_PATH_MIN_CONFIDENCE = float(os.environ.get("FAST_PATH_MIN_CONFIDENCE", 0.8))
+
+# Label and value may sit in neighbouring ROIs, joined by "   |||   "
+_GAP = r"[\s:|#.\-]{0,20}?"
+_DATE = (
+    r"(\d{4}-\d{1,2}-\d{1,2}"
+    r"|\d{1,2}[/.\-]\d{1,2}[/.\-]\d{2,4}"
+    r"|\d{1,2}(?:st|nd|rd|th)?\s+[A-Za-zéû]{3,9}\.?,?\s+\d{4}"
+    r"|[A-Za-z]{3,9}\.?\s+\d{1,2}(?:st|nd|rd|th)?,?\s+\d{4})"
+)
+_AMOUNT = r"(?:[$€£]|EUR|USD|GBP)?\s*(-?\d{1,3}(?:[ ,.]\d{3})*(?:[.,]\d{1,2})?|-?\d+(?:[.,]\d{1,2})?)"
+
+# Words of other labels: an empty "Invoice Number:" must not capture the next
+# label as its value
+_LABEL_WORDS = (
+    "invoice", "inv", "facture", "date", "number", "num", "no", "total", "due", "amount", "balance",
+    "tax", "vat", "tva", "page", "bill", "customer", "client", "order", "ref", "reference",
+)
+# An invoice number holds at least one digit and is not a label word
+_INVOICE_NUMBER = r"(?!(?:" + "|".join(_LABEL_WORDS) + r")(?![A-Z0-9\-/]))(?=[A-Z\-/]*\d)([A-Z0-9][A-Z0-9\-/]{2,})"
+
+# (pattern, confidence) pairs, strongest first
+_PATTERNS = {
+    "Invoice Number": [
+        (r"\b(?:invoice|facture)\s*(?:no\.?|number|num(?:ber|éro)?|n°|#)" + _GAP + _INVOICE_NUMBER, 0.95),
+        (r"\binv(?:oice)?\s*#" + _GAP + _INVOICE_NUMBER, 0.9),
+    ],
+    "Invoice Date": [
+        (r"\b(?:invoice\s+date|date\s+of\s+issue|issue\s+date|date\s+de\s+facture)" + _GAP + _DATE, 0.95),
+        (r"(?<!due\s)\bdate" + _GAP + _DATE, 0.75),
+    ],
+    "Due Date": [
+        (r"\b(?:due\s+date|payment\s+due|date\s+d'échéance|échéance)" + _GAP + _DATE, 0.95),
+        (r"\bdue" + _GAP + _DATE, 0.8),
+    ],
+    "Total": [
+        (r"\b(?:grand\s+total|total\s+due|amount\s+due|balance\s+due|total\s+ttc)" + _GAP + _AMOUNT, 0.95),
+        (r"(?<!sub)(?<!sub\s)\btotal" + _GAP + _AMOUNT, 0.8),
+    ],
+    "Taxes": [
+        (r"\b(?:tax|vat|tva|gst)(?:\s*\(?\d+(?:[.,]\d+)?\s*%\)?)?" + _GAP + _AMOUNT, 0.85),
+    ],
+}
+_COMPILED = {
+    field: [(re.compile(pattern, re.IGNORECASE), confidence) for pattern, confidence in patterns]
+    for field, patterns in _PATTERNS.items()
+}
+# Fields no pattern extracts, only the LLM can fill them
+LLM_ONLY_FIELDS = [field for field in INVOICE_FIELDS if field not in _PATTERNS]
+_AMOUNT_FIELDS = {"Total", "Taxes"}
+# Prefer the last match for these (the final total comes after subtotals)
+_LAST_MATCH_FIELDS = {"Total"}
+
+
+def normalize_amount(value: str) -> str:
+    """Turn '1 234,56' / '1,234.56' / '1.234,56' into '1234.56'."""
+    value = value.replace(" ", "")
+    if "," in value and "." in value:
+        if value.rfind(",") > value.rfind("."):
+            value = value.replace(".", "").replace(",", ".")
+        else:
+            value = value.replace(",", "")
+    elif "," in value:
+        head, _, tail = value.rpartition(",")
+        value = f"{head.replace(',', '')}.{tail}" if len(tail) <= 2 else value.replace(",", "")
+    elif value.count(".") > 1 or (value.count(".") == 1 and len(value.rpartition(".")[2]) == 3):
+        value = value.replace(".", "")
+    return value
+
+
+def extract_fields(texts: str) -> tuple[dict, dict]:
+    """
+    Extract invoice fields with regular expressions and keyword proximity.
+    Returns (invoice_data, confidences): invoice_data has the same 13 keys the
+    LLM produces (empty string when not found) and confidences maps each key
+    to a score between 0 and 1.
+    """
+    invoice_data = {field: "" for field in INVOICE_FIELDS}
+    confidences = {field: 0.0 for field in INVOICE_FIELDS}
+
+    for field, patterns in _COMPILED.items():
+        for regex, confidence in patterns:
+            matches = list(regex.finditer(texts))
+            if not matches:
+                continue
+            match = matches[-1] if field in _LAST_MATCH_FIELDS else matches[0]
+            value = match.group(1).strip()
+            if field in _AMOUNT_FIELDS:
+                value = normalize_amount(value)
+            # The value was taken from the next ROI, a bit less reliable
+            if "|" in match.group(0):
+                confidence -= 0.1
+            invoice_data[field] = value
+            confidences[field] = round(confidence, 2)
+            break
+
+    return invoice_data, confidences
+
+
+def missing_fields(confidences: dict, required=None, min_confidence: float | None = None) -> list[str]:
+    required = FAST_PATH_REQUIRED_FIELDS if required is None else required
+    min_confidence = FAST_PATH_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    return [field for field in required if confidences.get(field, 0.0) < min_confidence]
+
+
+def unfilled_fields(confidences: dict, min_confidence: float | None = None) -> list[str]:
+    """Every field the rules did not extract with enough confidence, LLM_ONLY_FIELDS included."""
+    min_confidence = FAST_PATH_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    return [field for field in INVOICE_FIELDS if confidences.get(field, 0.0) < min_confidence]
+
+
+def merge_fields(llm_data: dict, fast_data: dict, confidences: dict,
+                 min_confidence: float | None = None) -> dict:
+    """Fill the fields the LLM left empty with confident fast-path values."""
+    min_confidence = FAST_PATH_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    merged = dict(llm_data)
+    for field, value in fast_data.items():
+        if value and not merged.get(field) and confidences.get(field, 0.0) >= min_confidence:
+            merged[field] = value
+    return merged
+
+
+class FastPathStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.hits = 0
+        self.partial = 0
+
+    def record(self, hit: bool, partial: bool = False):
+        """hit: the LLM was skipped; partial: it was only asked for the fields the rules did not fill."""
+        with self._lock:
+            self.documents += 1
+            if hit:
+                self.hits += 1
+            elif partial:
+                self.partial += 1
+
+    def stats(self) -> dict:
+        return {
+            "required_fields": FAST_PATH_REQUIRED_FIELDS,
+            "min_confidence": FAST_PATH_MIN_CONFIDENCE,
+            "documents": self.documents,
+            "fast_path_hits": self.hits,
+            "partial_llm_calls": self.partial,
+            "llm_calls": self.documents - self.hits - self.partial,
+            "hit_ratio": round(self.hits / self.documents, 4) if self.documents else 0.0,
+        }
+
+
+fast_path_stats = FastPathStats()
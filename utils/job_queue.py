@@ -0,0 +1,125 @@
+# job_queue.py
+import math
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Job queue is full")
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, payload):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = "queued"
+        self.stage = "queued"
+        self.timings = {}
+        self.invoice_id = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "timings": dict(self.timings),
+            "invoice_id": self.invoice_id,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    Bounded in-process job queue served by a fixed number of worker threads.
+
+    handler(job) runs the work for a job; it may update job.stage and
+    job.timings as it progresses and returns the invoice id. Any exception
+    marks the job as failed.
+    """
+
+    def __init__(self, handler, maxsize: int = 32, workers: int = 2, retention: int = 1000):
+        self.handler = handler
+        self.workers = workers
+        self.retention = retention
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._avg_duration = None
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"ocr-job-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, payload) -> Job:
+        self._ensure_workers()
+        job = Job(payload)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise QueueFullError(self.retry_after())
+
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict_finished()
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def retry_after(self) -> int:
+        """Rough number of seconds until a queue slot frees up."""
+        avg_duration = self._avg_duration or 1.0
+        return max(1, math.ceil(avg_duration * self._queue.qsize() / self.workers))
+
+    def _evict_finished(self):
+        # Forget the oldest finished jobs once more than `retention` are kept
+        excess = len(self._jobs) - self.retention
+        if excess <= 0:
+            return
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at][:excess]:
+            del self._jobs[job_id]
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.invoice_id = self.handler(job)
+                job.status = "succeeded"
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.stage = "done"
+                job.finished_at = time.time()
+                job.payload = None
+                duration = job.finished_at - job.started_at
+                if self._avg_duration is None:
+                    self._avg_duration = duration
+                else:
+                    self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+                self._queue.task_done()
@@ -0,0 +1,150 @@
+# llm.py
+import os
+import threading
+import time
+
+from utils.metrics import LLM_TOKENS
+
+# Upper bound on generated tokens, the invoice JSON never needs more
+LLM_NUM_PREDICT = int(os.environ.get("LLM_NUM_PREDICT", 1024))
+# Ask the backend for JSON-constrained output (ollama `format="json"`)
+LLM_JSON_FORMAT = os.environ.get("LLM_JSON_FORMAT", "true").lower() in ("1", "true", "yes", "on")
+
+
+class JsonObjectScanner:
+    """
+    Incremental brace-aware scanner: feed it chunks of model output and it
+    reports when the first top-level JSON object is complete, ignoring braces
+    inside strings.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.start = -1
+        self.end = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def complete(self) -> bool:
+        return self.end != -1
+
+    def feed(self, chunk: str) -> bool:
+        offset = len(self.text)
+        self.text += chunk
+        if self.complete:
+            return True
+
+        for i, char in enumerate(chunk, start=offset):
+            if self.start == -1:
+                if char == "{":
+                    self.start = i
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = i + 1
+                    return True
+        return False
+
+    def json_part(self) -> str:
+        if self.complete:
+            return self.text[self.start:self.end]
+        return self.text
+
+
+class LLMStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.early_stops = 0
+        self.tokens = 0
+        self.ttft_total = 0.0
+        self.generation_time = 0.0
+
+    def record(self, request_stats: dict):
+        with self._lock:
+            self.requests += 1
+            self.early_stops += int(request_stats["early_stop"])
+            self.tokens += request_stats["tokens"]
+            self.ttft_total += request_stats["ttft"] or 0.0
+            self.generation_time += request_stats["generation_time"]
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "early_stops": self.early_stops,
+            "tokens": self.tokens,
+            "avg_ttft": round(self.ttft_total / self.requests, 4) if self.requests else 0.0,
+            "avg_tokens_per_s": round(self.tokens / self.generation_time, 2) if self.generation_time else 0.0,
+        }
+
+
+llm_stats = LLMStats()
+
+
+def chat_json(model: str, prompt: str) -> tuple[str, dict]:
+    """
+    Stream a completion and stop as soon as the first top-level JSON object is
+    closed. Returns (json_part, request_stats); json_part is the whole output
+    when no complete object was produced.
+    """
+    # Imported here so that loading the app does not pay for the client
+    import ollama
+
+    options = {"num_predict": LLM_NUM_PREDICT}
+    kwargs = {"format": "json"} if LLM_JSON_FORMAT else {}
+
+    start = time.perf_counter()
+    first_token_at = None
+    tokens = 0
+    scanner = JsonObjectScanner()
+
+    stream = ollama.chat(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+        options=options,
+        **kwargs,
+    )
+    try:
+        for chunk in stream:
+            content = chunk["message"]["content"]
+            if not content:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            tokens += 1
+            if scanner.feed(content):
+                break
+    finally:
+        # Closing the stream drops the HTTP response, which stops generation
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+    end = time.perf_counter()
+    generation_time = end - first_token_at if first_token_at is not None else 0.0
+    request_stats = {
+        "ttft": round(first_token_at - start, 4) if first_token_at is not None else None,
+        "tokens": tokens,
+        "tokens_per_s": round(tokens / generation_time, 2) if generation_time else 0.0,
+        "generation_time": round(generation_time, 4),
+        "early_stop": scanner.complete,
+    }
+    llm_stats.record(request_stats)
+    LLM_TOKENS.inc(tokens)
+    return scanner.json_part(), request_stats
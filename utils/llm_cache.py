@@ -0,0 +1,159 @@
+# llm_cache.py
+import copy
+import datetime
+import hashlib
+import os
+import re
+import threading
+
+from database import LLMCacheEntry, get_db
+from utils.cache import LRUCache
+
+LLM_CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", 1024))
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 30 * 24 * 3600))
+LLM_CACHE_MAX_ROWS = int(os.environ.get("LLM_CACHE_MAX_ROWS", 100000))
+# Run the database eviction once every this many inserts
+PRUNE_EVERY = 500
+
+
+def normalize_text(texts: str) -> str:
+    return re.sub(r"\s+", " ", texts).strip().lower()
+
+
+def prompt_version(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+class LLMCache:
+    """
+    Caches the parsed LLM output keyed on (model, prompt version, normalized
+    OCR text), plus the requested fields for prompts restricted to a few of
+    them. An in-memory LRU sits in front of the llm_cache table; entries
+    expire after LLM_CACHE_TTL seconds. Lookups only see the entries of
+    their prompt version, so workers running different prompts (during a
+    rolling deploy) share the table; entries of a retired version age out
+    with the TTL and LLM_CACHE_MAX_ROWS.
+    """
+
+    def __init__(self, maxsize: int = LLM_CACHE_SIZE, ttl: float = LLM_CACHE_TTL,
+                 max_rows: int = LLM_CACHE_MAX_ROWS):
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, version: str, texts: str, fields: list[str] | None = None) -> str:
+        parts = [model, version, normalize_text(texts)]
+        if fields:
+            parts.insert(2, ",".join(fields))
+        raw = "\0".join(parts)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, version: str, texts: str, fields: list[str] | None = None) -> dict | None:
+        key = self.make_key(model, version, texts, fields)
+
+        invoice_data = self.memory.get(key)
+        if invoice_data is not None:
+            return copy.deepcopy(invoice_data)
+
+        invoice_data = self._load_from_db(key, version)
+        with self._lock:
+            if invoice_data is None:
+                self.misses += 1
+                return None
+            self.db_hits += 1
+        self.memory.set(key, invoice_data)
+        return copy.deepcopy(invoice_data)
+
+    def set(self, model: str, version: str, texts: str, invoice_data: dict, fields: list[str] | None = None):
+        key = self.make_key(model, version, texts, fields)
+        invoice_data = copy.deepcopy(invoice_data)
+        self.memory.set(key, invoice_data)
+
+        db = next(get_db())
+        try:
+            db.merge(LLMCacheEntry(
+                cache_key=key,
+                model=model,
+                prompt_version=version,
+                response=invoice_data,
+                created_at=datetime.datetime.utcnow(),
+            ))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Error writing LLM cache: {str(e)}")
+        finally:
+            db.close()
+
+        with self._lock:
+            self._inserts += 1
+            prune = self._inserts % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """Delete expired rows and the oldest rows beyond max_rows."""
+        db = next(get_db())
+        try:
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl)
+            db.query(LLMCacheEntry).filter(LLMCacheEntry.created_at < cutoff).delete(
+                synchronize_session=False
+            )
+            oldest_kept = (
+                db.query(LLMCacheEntry.created_at)
+                .order_by(LLMCacheEntry.created_at.desc())
+                .offset(self.max_rows)
+                .limit(1)
+                .scalar()
+            )
+            if oldest_kept is not None:
+                db.query(LLMCacheEntry).filter(
+                    LLMCacheEntry.created_at <= oldest_kept
+                ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Error pruning LLM cache: {str(e)}")
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        memory_stats = self.memory.stats()
+        lookups = memory_stats["hits"] + self.db_hits + self.misses
+        return {
+            "size": memory_stats["size"],
+            "maxsize": memory_stats["maxsize"],
+            "evictions": memory_stats["evictions"],
+            "memory_hits": memory_stats["hits"],
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((memory_stats["hits"] + self.db_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    def _load_from_db(self, key: str, version: str) -> dict | None:
+        db = next(get_db())
+        try:
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl)
+            entry = (
+                db.query(LLMCacheEntry)
+                .filter(
+                    LLMCacheEntry.cache_key == key,
+                    LLMCacheEntry.prompt_version == version,
+                    LLMCacheEntry.created_at >= cutoff,
+                )
+                .first()
+            )
+            return entry.response if entry else None
+        except Exception as e:
+            print(f"Error reading LLM cache: {str(e)}")
+            return None
+        finally:
+            db.close()
+
+
+llm_cache = LLMCache()
@@ -0,0 +1,81 @@
+# model_registry.py
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """
+    Loads a model once in a background thread and warms it up, so workers
+    come up quickly and the first request does not pay for loading or graph
+    tracing. loader() returns the model and warmup(model) runs a dummy
+    inference on it.
+    """
+
+    def __init__(self, name: str, loader, warmup=None):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.state = "not_started"
+        self.error = None
+        self.timings = {}
+        self._model = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start loading in the background; calling it again is a no-op."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = "loading"
+            self._thread = threading.Thread(
+                target=self._load, name=f"load-{self.name}", daemon=True
+            )
+            self._thread.start()
+
+    def get(self, timeout: float | None = None):
+        """Return the loaded model, waiting for the background load if needed."""
+        self.start()
+        if not self._ready.wait(timeout):
+            raise RuntimeError(f"Model '{self.name}' is still loading")
+        if self.error is not None:
+            raise RuntimeError(f"Model '{self.name}' failed to load: {self.error}")
+        return self._model
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "error": self.error,
+            "timings": dict(self.timings),
+        }
+
+    def _timed(self, phase: str, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.timings[phase] = round(time.perf_counter() - start, 3)
+        logger.info("%s: %s took %.3fs", self.name, phase, self.timings[phase])
+        return result
+
+    def _load(self):
+        try:
+            model = self._timed("load", self.loader)
+            if self.warmup is not None:
+                self.state = "warming_up"
+                self._timed("warmup", self.warmup, model)
+            self._model = model
+            self.state = "ready"
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+            logger.exception("%s: failed to load", self.name)
+        finally:
+            self._ready.set()
@@ -0,0 +1,73 @@
+# ocr_engine.py
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Each tesseract process would otherwise spawn one OpenMP thread per core,
+# which oversubscribes the CPU as soon as several ROIs run side by side.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+from utils.ocr_utils import DEFAULT_PREPROCESS_PROFILE, preprocess_image
+
+TESSERACT_CONFIG = "--oem 3 --psm 6"
+TESSERACT_LANG = "eng"
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Return the process-wide OCR worker pool, creating it on first use.
+
+    Threads are enough here: pytesseract hands the work to an external
+    tesseract process and the OpenCV preprocessing releases the GIL.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=OCR_WORKERS, thread_name_prefix="ocr"
+                )
+    return _executor
+
+
+def crop_rois(image, boxes) -> list:
+    """Crop the normalized (ymin, xmin, ymax, xmax) boxes out of the image."""
+    height, width = image.shape[:2]
+    rois = []
+    for ymin, xmin, ymax, xmax in boxes:
+        rois.append(
+            image[
+                int(ymin * height) : int(ymax * height),
+                int(xmin * width) : int(xmax * width),
+            ]
+        )
+    return rois
+
+
+def _ocr_roi(roi, profile: str) -> str:
+    if roi.size == 0:
+        return ""
+    # Imported on first use, off the import path of the app
+    import pytesseract
+
+    preprocessed_roi = preprocess_image(roi, profile)
+    text = pytesseract.image_to_string(
+        preprocessed_roi, config=TESSERACT_CONFIG, lang=TESSERACT_LANG
+    )
+    return text.strip()
+
+
+def ocr_rois(rois, profile: str | None = None) -> list[str]:
+    """
+    Preprocess and OCR every ROI of a page concurrently on the worker pool.
+    Texts are returned in the same order as the ROIs.
+    """
+    if not rois:
+        return []
+    profile = profile or DEFAULT_PREPROCESS_PROFILE
+    return list(get_executor().map(partial(_ocr_roi, profile=profile), rois))
@@ -1,10 +1,54 @@
 # ocr_utils.py
+import datetime
+import os
 import re
-import cv2
 
+# "fast": grayscale + Otsu, "balanced": + median blur, "accurate": + NL-means
+# denoising and CLAHE. "auto" picks one per ROI from noise/contrast estimates.
+PREPROCESS_PROFILES = ("fast", "balanced", "accurate")
+DEFAULT_PREPROCESS_PROFILE = os.environ.get("OCR_PREPROCESS_PROFILE", "auto")
+
+# Thresholds used by choose_profile (noise in gray levels, contrast = std dev)
+CLEAN_NOISE_MAX = 3.0
+BALANCED_NOISE_MAX = 10.0
+LOW_CONTRAST_MIN = 40.0
+
+
+def estimate_noise(gray) -> float:
+    """Mean absolute difference between the ROI and its 3x3 median, a cheap noise proxy."""
+    import cv2
+
+    return float(cv2.absdiff(gray, cv2.medianBlur(gray, 3)).mean())
+
+
+def choose_profile(gray) -> str:
+    noise = estimate_noise(gray)
+    contrast = float(gray.std())
+    if noise <= CLEAN_NOISE_MAX and contrast >= LOW_CONTRAST_MIN:
+        return "fast"
+    if noise <= BALANCED_NOISE_MAX:
+        return "balanced"
+    return "accurate"
+
+
+def preprocess_image(image, profile: str = "accurate"):
+    # Imported here: the date and name helpers of this module are used by the
+    # web routes, which should not load OpenCV
+    import cv2
+
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if profile == "auto":
+        profile = choose_profile(gray)
+
+    if profile == "fast":
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return binary
+
+    if profile == "balanced":
+        blurred = cv2.medianBlur(gray, 3)
+        _, binary = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return binary
 
-def preprocess_image(image):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     _, binary = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
     denoised = cv2.fastNlMeansDenoising(binary, None, 30, 7, 21)
     clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
@@ -18,3 +62,113 @@ def safe_parse_float(value) -> float | None:
     # Extract first valid float-looking number from string
     match = re.search(r"[-+]?\d*\.\d+|\d+", value.replace(",", "."))
     return float(match.group()) if match else None
+
+
+def parse_amount(value) -> float | None:
+    """
+    Strict number parsing for user input: JSON numbers, or strings such as
+    '50', '1 234,50 €' or '$1,234.50'. None for an empty value, ValueError
+    when the value is not a number.
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"not a number: {value!r}")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        raise ValueError(f"not a number: {value!r}")
+    from utils.fast_extract import normalize_amount
+
+    digits = re.sub(r"(?i)[$€£\s]|eur|usd|gbp", " ", value).strip()
+    if not re.fullmatch(r"-?[\d ,.]*\d[\d ,.]*", digits):
+        raise ValueError(f"not a number: {value!r}")
+    return float(normalize_amount(digits))
+
+
+# English and French month names, matched on their first three letters
+# ("sept." and "septembre" both give 9; "juin"/"juillet" need four)
+MONTHS = {
+    "jan": 1, "feb": 2, "fev": 2, "fév": 2, "mar": 3, "apr": 4, "avr": 4, "may": 5, "mai": 5,
+    "jun": 6, "juin": 6, "jul": 7, "juil": 7, "aug": 8, "aou": 8, "aoû": 8, "sep": 9,
+    "oct": 10, "nov": 11, "dec": 12, "déc": 12,
+}
+
+ISO_DATE = re.compile(r"(?<!\d)(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})(?!\d)")
+NUMERIC_DATE = re.compile(r"(?<!\d)(\d{1,2})[-/.](\d{1,2})[-/.](\d{4}|\d{2})(?!\d)")
+DAY_MONTH_DATE = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th|er)?\s+([^\W\d_]+)\.?,?\s+(\d{4})\b")
+MONTH_DAY_DATE = re.compile(r"\b([^\W\d_]+)\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})\b")
+
+
+def _month_number(name: str) -> int | None:
+    name = name.lower()
+    return MONTHS.get(name[:4]) or MONTHS.get(name[:3])
+
+
+def _make_date(year, month, day) -> datetime.date | None:
+    if month is None:
+        return None
+    try:
+        return datetime.date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def parse_date(value) -> datetime.date | None:
+    """
+    Date of a date string as emitted by the LLM ("2024-03-12", "12/03/2024",
+    "12 mars 2024", "March 12, 2024", ...), or None when none can be read.
+    Numeric dates are read day first, unless only month first is valid.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    if not value or not isinstance(value, str):
+        return None
+
+    match = ISO_DATE.search(value)
+    if match:
+        year, month, day = match.groups()
+        return _make_date(year, month, day)
+
+    match = NUMERIC_DATE.search(value)
+    if match:
+        day, month, year = (int(part) for part in match.groups())
+        if year < 100:
+            year += 2000
+        if month > 12 >= day:
+            day, month = month, day
+        return _make_date(year, month, day)
+
+    match = DAY_MONTH_DATE.search(value)
+    if match:
+        day, month, year = match.groups()
+        parsed = _make_date(year, _month_number(month), day)
+        if parsed:
+            return parsed
+
+    match = MONTH_DAY_DATE.search(value)
+    if match:
+        month, day, year = match.groups()
+        return _make_date(year, _month_number(month), day)
+    return None
+
+
+def client_key(name) -> str | None:
+    """
+    Normalized customer name used to group invoices by client: trimmed,
+    lowercased, inner whitespace collapsed. None for an empty or "null" name.
+    """
+    if not name or not isinstance(name, str):
+        return None
+    key = " ".join(name.split()).lower()
+    return key if key and key != "null" else None
+
+
+def parse_bool(value, default: bool = False) -> bool:
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
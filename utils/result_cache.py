@@ -0,0 +1,89 @@
+# result_cache.py
+import copy
+import hashlib
+import json
+import os
+import threading
+
+from database import Invoice, InvoiceFileHash, get_db
+from utils.cache import LRUCache
+
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 1024))
+
+
+def hash_file(file_data: bytes) -> str:
+    return hashlib.sha256(file_data).hexdigest()
+
+
+class ResultCache:
+    """
+    Maps the SHA-256 of an uploaded file to the /ocr response it produced.
+    Lookups go to an in-memory LRU first and then to the persisted
+    invoice_file_hashes index, so a resubmitted file skips the pipeline.
+    """
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE):
+        self.memory = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.db_hits = 0
+        self.misses = 0
+
+    def lookup(self, file_hash: str) -> dict | None:
+        result = self.memory.get(file_hash)
+        if result is not None:
+            return copy.deepcopy(result)
+
+        result = self._load_from_db(file_hash)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.db_hits += 1
+        self.memory.set(file_hash, result)
+        return copy.deepcopy(result)
+
+    def store(self, file_hash: str, result_json: dict):
+        self.memory.set(file_hash, copy.deepcopy(result_json))
+
+    def forget(self, file_hash: str):
+        """Drop a file whose invoice was deleted, so that it is processed again."""
+        self.memory.delete(file_hash)
+
+    def stats(self) -> dict:
+        memory_stats = self.memory.stats()
+        lookups = memory_stats["hits"] + self.db_hits + self.misses
+        return {
+            "size": memory_stats["size"],
+            "maxsize": memory_stats["maxsize"],
+            "evictions": memory_stats["evictions"],
+            "memory_hits": memory_stats["hits"],
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((memory_stats["hits"] + self.db_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    def _load_from_db(self, file_hash: str) -> dict | None:
+        db = next(get_db())
+        try:
+            invoice = (
+                db.query(Invoice)
+                .join(InvoiceFileHash, InvoiceFileHash.invoice_id == Invoice.id)
+                .filter(InvoiceFileHash.file_hash == file_hash)
+                .first()
+            )
+            if invoice is None or invoice.raw_json is None:
+                return None
+
+            result_json = invoice.raw_json
+            if isinstance(result_json, str):
+                result_json = json.loads(result_json)
+            result_json["invoice_id"] = invoice.id
+            return result_json
+        except Exception as e:
+            print(f"Error reading result cache: {str(e)}")
+            return None
+        finally:
+            db.close()
+
+
+result_cache = ResultCache()
@@ -0,0 +1,166 @@
+# stage_pipeline.py
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class Stage:
+    """
+    One step of a StagedPipeline: func(item) runs on `workers` threads and
+    reads its input from a bounded queue, so a slow stage applies
+    back-pressure to the stages before it.
+
+    With batch_size > 1, func receives a list of up to batch_size items,
+    collected for at most max_wait_ms after the first one arrives. A batch
+    function reports a per-item failure by setting item.error and item.done.
+    """
+
+    def __init__(self, name: str, func, workers: int = 1, batch_size: int = 1, max_wait_ms: float = 0):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, duration: float, processed: int, failed: int):
+        with self._lock:
+            self.processed += processed
+            self.failed += failed
+            self.busy_seconds += duration
+
+
+class StagedPipeline:
+    """
+    Runs items through a fixed sequence of stages connected by bounded
+    queues, each stage with its own number of worker threads.
+
+    A stage function receives the item and updates it in place. It may set
+    item.done to skip the remaining stages (e.g. a cache hit); an exception
+    marks the item as failed and skips them as well. The time spent in each
+    stage is written to item.timings when the item has one. on_done(item) is
+    called exactly once per item, from a worker thread.
+    """
+
+    def __init__(self, stages: list[Stage], on_done, queue_size: int = 8):
+        self.stages = stages
+        self.on_done = on_done
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stopped_workers = [0] * len(stages)
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return self
+            for index, stage in enumerate(self.stages):
+                for i in range(stage.workers):
+                    thread = threading.Thread(
+                        target=self._worker, args=(index,), name=f"{stage.name}-{i}", daemon=True
+                    )
+                    thread.start()
+                    self._threads.append(thread)
+        return self
+
+    def submit(self, item, timeout: float | None = None):
+        """Queue an item for the first stage; blocks while that queue is full."""
+        self.start()
+        self._queues[0].put(item, timeout=timeout)
+
+    def close(self):
+        """Let queued items drain, then stop every worker (see join)."""
+        for _ in range(self.stages[0].workers):
+            self._queues[0].put(_STOP)
+
+    def join(self):
+        self.close()
+        for thread in self._threads:
+            thread.join()
+
+    def _forward(self, index: int, item):
+        if getattr(item, "done", False) or index + 1 == len(self.stages):
+            self.on_done(item)
+        else:
+            self._queues[index + 1].put(item)
+
+    def _stop_worker(self, index: int):
+        # The last worker of a stage to stop passes the stop on to the next stage
+        with self._lock:
+            self._stopped_workers[index] += 1
+            last = self._stopped_workers[index] == self.stages[index].workers
+        if last and index + 1 < len(self.stages):
+            for _ in range(self.stages[index + 1].workers):
+                self._queues[index + 1].put(_STOP)
+
+    def _collect(self, source: queue.Queue, stage: Stage, first) -> tuple[list, bool]:
+        """Gather a batch starting with `first`; returns (items, stop_seen)."""
+        items = [first]
+        deadline = time.monotonic() + stage.max_wait
+        while len(items) < stage.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = source.get(timeout=remaining) if remaining > 0 else source.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def _worker(self, index: int):
+        stage = self.stages[index]
+        source = self._queues[index]
+        while True:
+            item = source.get()
+            if item is _STOP:
+                self._stop_worker(index)
+                return
+
+            stop = False
+            if stage.batch_size > 1:
+                items, stop = self._collect(source, stage, item)
+            else:
+                items = [item]
+            for item in items:
+                item.stage = stage.name
+
+            start = time.perf_counter()
+            try:
+                stage.func(items if stage.batch_size > 1 else items[0])
+            except Exception as e:
+                for item in items:
+                    item.error = f"{stage.name}: {e}"
+                    item.done = True
+            duration = time.perf_counter() - start
+            stage.record(duration, len(items), sum(1 for item in items if item.error))
+
+            for item in items:
+                timings = getattr(item, "timings", None)
+                if timings is not None:
+                    timings[stage.name] = round(duration, 4)
+                try:
+                    self._forward(index, item)
+                except Exception as e:
+                    print(f"Error finishing pipeline item: {str(e)}")
+
+            if stop:
+                self._stop_worker(index)
+                return
+
+    def stats(self) -> dict:
+        return {
+            stage.name: {
+                "workers": stage.workers,
+                "queued": self._queues[index].qsize(),
+                "processed": stage.processed,
+                "failed": stage.failed,
+                "busy_seconds": round(stage.busy_seconds, 3),
+            }
+            for index, stage in enumerate(self.stages)
+        }
@@ -0,0 +1,79 @@
+# stats_cache.py
+import hashlib
+import os
+import threading
+
+from flask import Response, g, request
+
+from utils.cache import LRUCache
+
+STATS_CACHE_SIZE = int(os.environ.get("STATS_CACHE_SIZE", 512))
+# Upper bound (seconds) on the staleness of a cached response: covers writes
+# made by other processes (python -m ingest, other workers, replica lag) and
+# periods that move with the current date
+STATS_CACHE_TTL = float(os.environ.get("STATS_CACHE_TTL", 30))
+
+
+class StatsCache:
+    """
+    Response cache of the stats blueprints, keyed by data version, path and
+    query args. Writers call bump() after committing: entries of older
+    versions are never served again and age out of the LRU. Responses carry
+    an ETag (hash of the body); a matching If-None-Match is answered with
+    304 straight from the cache, without opening a database session.
+    """
+
+    def __init__(self, maxsize: int = STATS_CACHE_SIZE, ttl: float = STATS_CACHE_TTL):
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl or None)
+        self._lock = threading.Lock()
+        self.version = 0
+        self.not_modified = 0
+
+    def bump(self):
+        """Invalidate every cached response: call once a write is committed."""
+        with self._lock:
+            self.version += 1
+
+    def _key(self, version: int) -> tuple:
+        return (version, request.path, tuple(sorted(request.args.items(multi=True))))
+
+    def _before_request(self):
+        if request.method != "GET":
+            return None
+        # Version read before the view runs: a write committed meanwhile makes the entry stale
+        g.stats_cache_key = self._key(self.version)
+        entry = self.memory.get(g.stats_cache_key)
+        if entry is None:
+            return None
+        g.stats_cache_hit = True
+        body, mimetype, etag = entry
+        return self._respond(Response(body, mimetype=mimetype), etag)
+
+    def _after_request(self, response):
+        key = g.pop("stats_cache_key", None)
+        if key is None or g.pop("stats_cache_hit", False) or response.status_code != 200:
+            return response
+        body = response.get_data()
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        self.memory.set(key, (body, response.mimetype, etag))
+        return self._respond(response, etag)
+
+    def _respond(self, response, etag: str):
+        response.set_etag(etag)
+        # Browsers may keep the response but must revalidate it on every poll
+        response.headers["Cache-Control"] = "no-cache"
+        if request.if_none_match.contains_weak(etag):
+            with self._lock:
+                self.not_modified += 1
+            response = Response(status=304, headers={"ETag": response.headers["ETag"], "Cache-Control": "no-cache"})
+        return response
+
+    def init_blueprint(self, blueprint):
+        blueprint.before_request(self._before_request)
+        blueprint.after_request(self._after_request)
+
+    def stats(self) -> dict:
+        return {**self.memory.stats(), "version": self.version, "not_modified": self.not_modified}
+
+
+stats_cache = StatsCache()
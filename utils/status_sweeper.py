@@ -0,0 +1,89 @@
+# status_sweeper.py
+import datetime
+import os
+import threading
+import time
+
+from sqlalchemy import update
+
+from database import Invoice, engine
+from utils.metrics import REGISTRY
+from utils.stats_cache import stats_cache
+
+# Seconds between two sweeps (0 disables the sweeper)
+INVOICE_STATUS_SWEEP_SECONDS = float(os.environ.get("INVOICE_STATUS_SWEEP_SECONDS", 300))
+
+STATUS_TRANSITIONS = REGISTRY.counter(
+    "invoice_status_transitions_total", "Invoices moved from pending to overdue by the sweeper"
+)
+
+
+class StatusSweeper:
+    """
+    Background thread that marks pending invoices as overdue once their due
+    date has passed, with one UPDATE per sweep over the (status,
+    due_date_parsed) index. Several processes may sweep at once: the UPDATE
+    is idempotent.
+    """
+
+    def __init__(self, interval: float = INVOICE_STATUS_SWEEP_SECONDS):
+        self.interval = interval
+        self.runs = 0
+        self.transitions = 0
+        self.last_run_at = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.interval <= 0:
+            return self
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="status-sweeper", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def sweep(self, today: datetime.date | None = None) -> int:
+        """Mark overdue the pending invoices due before today; returns how many."""
+        today = today or datetime.datetime.utcnow().date()
+        with engine.begin() as connection:
+            result = connection.execute(
+                update(Invoice)
+                .where(Invoice.status == "pending", Invoice.due_date_parsed < today)
+                .values(status="overdue")
+            )
+        count = max(result.rowcount or 0, 0)
+        self.runs += 1
+        self.transitions += count
+        self.last_run_at = time.time()
+        if count:
+            STATUS_TRANSITIONS.inc(count)
+            stats_cache.bump()
+        return count
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error sweeping invoice statuses: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "transitions": self.transitions,
+            "last_run_at": self.last_run_at,
+            "last_error": self.last_error,
+        }
+
+
+status_sweeper = StatusSweeper()
@@ -0,0 +1,168 @@
+# time_series.py
+import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import func, literal_column, select
+
+BUCKETS = ("hour", "day", "week", "month")
+
+# Buckets a single series may hold, so a typo in from/to cannot ask for millions
+MAX_BUCKETS = 5000
+
+
+def get_timezone(name: str | None) -> ZoneInfo:
+    """ZoneInfo for an IANA name (default UTC); ValueError when unknown."""
+    try:
+        return ZoneInfo(name or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone: {name}")
+
+
+def to_utc(local: datetime.datetime, tz: ZoneInfo) -> datetime.datetime:
+    """Naive UTC datetime (as stored in created_at) of a naive local time in tz."""
+    return local.replace(tzinfo=tz).astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def bucket_start(moment: datetime.datetime, bucket: str) -> datetime.datetime:
+    if bucket == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start: datetime.datetime, bucket: str) -> datetime.datetime:
+    if bucket == "hour":
+        return start + datetime.timedelta(hours=1)
+    if bucket == "week":
+        return start + datetime.timedelta(days=7)
+    if bucket == "month":
+        return (start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return start + datetime.timedelta(days=1)
+
+
+def bucket_starts(start: datetime.datetime, end: datetime.datetime, bucket: str) -> list[datetime.datetime]:
+    """Start of every bucket overlapping [start, end)."""
+    starts = []
+    current = bucket_start(start, bucket)
+    while current < end:
+        starts.append(current)
+        if len(starts) > MAX_BUCKETS:
+            raise ValueError(f"Range too large for {bucket} buckets (at most {MAX_BUCKETS})")
+        current = next_bucket(current, bucket)
+    return starts
+
+
+def _bucket_expression(dialect: str, column, bucket: str, tz: ZoneInfo, start: datetime.datetime):
+    """
+    SQL expression of the local start of the bucket holding `column` (a
+    naive UTC timestamp), or None when the dialect has no support here.
+    """
+    if dialect == "postgresql":
+        local = func.timezone(tz.key, func.timezone("UTC", column))
+        return func.date_trunc(bucket, local)
+    if dialect == "sqlite":
+        # SQLite has no time zone database: shift by the offset in effect at
+        # the start of the range (exact unless the range crosses a DST change)
+        offset = start.replace(tzinfo=tz).utcoffset()
+        minutes = int(offset.total_seconds() // 60) if offset else 0
+        local = func.datetime(column, f"{minutes:+d} minutes") if minutes else column
+        if bucket == "hour":
+            return func.strftime("%Y-%m-%d %H:00:00", local)
+        if bucket == "week":
+            # Monday of the week: next Sunday (or the same day), minus six days
+            return func.strftime("%Y-%m-%d 00:00:00", local, "weekday 0", "-6 days")
+        if bucket == "month":
+            return func.strftime("%Y-%m-01 00:00:00", local)
+        return func.strftime("%Y-%m-%d 00:00:00", local)
+    return None
+
+
+def _as_datetime(value) -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time.min)
+    return datetime.datetime.fromisoformat(value)
+
+
+def time_series(db, column, start: datetime.datetime, end: datetime.datetime, bucket: str,
+                tz: ZoneInfo, aggregates: dict, filters=()) -> list[dict]:
+    """
+    One grouped query: the aggregates of the rows whose `column` falls in
+    [start, end), per bucket (hour, day, week with weeks starting on
+    Monday, or month). start and end are naive local times in tz; column
+    holds naive UTC timestamps and is filtered as a plain range so its
+    index can be used.
+
+    Returns one dict per bucket overlapping the range, gaps included, with
+    "start" (local bucket start) and each aggregate (0 for empty buckets).
+    Aggregates must be additive (count, sum) for the fallback used on
+    databases other than PostgreSQL and SQLite.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    starts = bucket_starts(start, end, bucket)
+    conditions = [column >= to_utc(start, tz), column < to_utc(end, tz), *filters]
+    labels = list(aggregates)
+
+    expression = _bucket_expression(db.get_bind().dialect.name, column, bucket, tz, start)
+    totals = {}
+    if expression is not None:
+        query = (
+            select(expression.label("bucket"), *(aggregates[name].label(name) for name in labels))
+            .where(*conditions)
+            .group_by(literal_column("bucket"))
+        )
+        for row in db.execute(query):
+            totals[_as_datetime(row.bucket)] = [getattr(row, name) for name in labels]
+    else:
+        # Other databases: bucket the matching rows in one pass
+        query = select(column, *(aggregates[name].label(name) for name in labels)).where(*conditions)
+        query = query.group_by(column)
+        for row in db.execute(query):
+            local = row[0].replace(tzinfo=datetime.timezone.utc).astimezone(tz).replace(tzinfo=None)
+            key = bucket_start(local, bucket)
+            current = totals.setdefault(key, [0] * len(labels))
+            for index, value in enumerate(row[1:]):
+                current[index] += value or 0
+
+    return _fill(starts, totals, labels)
+
+
+def _fill(starts, totals: dict, labels: list[str]) -> list[dict]:
+    series = []
+    for bucket_begin in starts:
+        values = totals.get(bucket_begin, [0] * len(labels))
+        series.append({"start": bucket_begin, **{name: value or 0 for name, value in zip(labels, values)}})
+    return series
+
+
+def daily_series(db, day_column, start_date: datetime.date, end_date: datetime.date, bucket: str,
+                 aggregates: dict, filters=()) -> list[dict]:
+    """
+    Same result as time_series, from a table already aggregated per day
+    (day_column, e.g. the invoice_daily_stats rollup) for the days from
+    start_date to end_date included: one query grouped by day, then the
+    days are summed into day, week or month buckets. Aggregates must be
+    additive (sums of the rollup counters).
+    """
+    if bucket not in ("day", "week", "month"):
+        raise ValueError("bucket must be one of day, week, month")
+    start = datetime.datetime.combine(start_date, datetime.time.min)
+    starts = bucket_starts(start, start + datetime.timedelta(days=(end_date - start_date).days + 1), bucket)
+    labels = list(aggregates)
+    query = (
+        select(day_column, *(aggregates[name].label(name) for name in labels))
+        .where(day_column >= start_date, day_column <= end_date, *filters)
+        .group_by(day_column)
+    )
+    totals = {}
+    for row in db.execute(query):
+        current = totals.setdefault(bucket_start(_as_datetime(row[0]), bucket), [0] * len(labels))
+        for index, value in enumerate(row[1:]):
+            current[index] += value or 0
+    return _fill(starts, totals, labels)
@@ -0,0 +1,190 @@
+# upload_utils.py
+import binascii
+import io
+import os
+import zipfile
+
+from utils.ocr_utils import PREPROCESS_PROFILES, parse_bool
+
+# Maximum accepted request body, applied through Flask's MAX_CONTENT_LENGTH
+OCR_MAX_BODY_MB = float(os.environ.get("OCR_MAX_BODY_MB", 50))
+MAX_CONTENT_LENGTH = int(OCR_MAX_BODY_MB * 1024 * 1024)
+
+FILE_TYPES = ("image", "pdf")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp")
+ZIP_MIMETYPES = ("application/zip", "application/x-zip-compressed")
+
+
+class UploadError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def decode_base64_file(base64_data: str) -> bytes:
+    """
+    Decode a base64 payload, optionally prefixed with a data: URL header.
+    binascii skips newlines and whitespace itself, so the string is only
+    copied once (to ASCII bytes) before decoding.
+    """
+    start = 0
+    if base64_data.startswith("data:"):
+        # Strip base64 prefix if present
+        comma = base64_data.find(",", 0, 256)
+        if comma != -1 and base64_data[:comma].endswith(";base64"):
+            start = comma + 1
+
+    view = memoryview(base64_data.encode("ascii"))[start:]
+    try:
+        return binascii.a2b_base64(view)
+    except binascii.Error:
+        # Missing padding, extra "=" are ignored by the decoder
+        return binascii.a2b_base64(bytes(view) + b"==")
+
+
+def guess_file_type(mimetype: str | None, filename: str | None = None) -> str | None:
+    mimetype = (mimetype or "").lower()
+    if mimetype == "application/pdf":
+        return "pdf"
+    if mimetype.startswith("image/"):
+        return "image"
+
+    filename = (filename or "").lower()
+    if filename.endswith(".pdf"):
+        return "pdf"
+    if filename.endswith(IMAGE_EXTENSIONS):
+        return "image"
+    return None
+
+
+def _check_file_type(file_type: str | None) -> str:
+    if not file_type:
+        raise UploadError("No file_type specified (must be 'image' or 'pdf')")
+    file_type = file_type.lower()
+    if file_type not in FILE_TYPES:
+        raise UploadError("Invalid file_type (must be 'image' or 'pdf')")
+    return file_type
+
+
+def read_upload(request) -> tuple[bytes, str, dict]:
+    """
+    Read the uploaded document from a Flask request. Accepts:
+      - application/json with the file as base64 ("file", "file_type")
+      - multipart/form-data with a "file" part (file_type optional)
+      - a raw application/pdf or image/* body
+    Returns (file_data, file_type, options) where options holds the other
+    request parameters (body fields, form fields or query string).
+    Raises UploadError with the HTTP status to answer.
+    """
+    if request.content_length and request.content_length > MAX_CONTENT_LENGTH:
+        raise UploadError(f"Request body exceeds {OCR_MAX_BODY_MB:g} MB", 413)
+
+    mimetype = request.mimetype or ""
+
+    if request.is_json:
+        data = request.get_json()
+        if "file" not in data:
+            raise UploadError("No file data provided")
+        file_type = _check_file_type(data.get("file_type"))
+        try:
+            file_data = decode_base64_file(data.pop("file"))
+        except Exception as e:
+            raise UploadError(f"Invalid file data: {str(e)}")
+        options = {**request.args.to_dict(), **data}
+
+    elif mimetype == "multipart/form-data":
+        storage = request.files.get("file")
+        if storage is None:
+            raise UploadError("No file data provided")
+        file_type = _check_file_type(
+            request.form.get("file_type")
+            or guess_file_type(storage.mimetype, storage.filename)
+        )
+        file_data = storage.read()
+        options = {**request.args.to_dict(), **request.form.to_dict()}
+
+    elif guess_file_type(mimetype):
+        file_type = _check_file_type(request.args.get("file_type") or guess_file_type(mimetype))
+        # Read the body straight into a single buffer
+        file_data = request.stream.read()
+        options = request.args.to_dict()
+
+    else:
+        raise UploadError(
+            "Request must be application/json, multipart/form-data, "
+            "application/pdf or image/*",
+            415,
+        )
+
+    if not file_data:
+        raise UploadError("No file data provided")
+
+    return file_data, file_type, _check_options(options)
+
+
+def _check_options(options: dict) -> dict:
+    options["force"] = parse_bool(options.get("force"))
+    profile = options.get("preprocess")
+    if profile and profile not in PREPROCESS_PROFILES + ("auto",):
+        raise UploadError(
+            f"Invalid preprocess profile (must be one of {', '.join(PREPROCESS_PROFILES)} or auto)"
+        )
+    return options
+
+
+def files_from_zip(zip_data: bytes) -> list[tuple[str, bytes, str]]:
+    """Documents of a ZIP archive; entries that are not images or PDFs are ignored."""
+    files = []
+    with zipfile.ZipFile(io.BytesIO(zip_data)) as archive:
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+                continue
+            file_type = guess_file_type(None, name)
+            if file_type:
+                files.append((name, archive.read(info), file_type))
+    return files
+
+
+def _is_zip(mimetype: str | None, filename: str | None = None) -> bool:
+    return (mimetype or "").lower() in ZIP_MIMETYPES or (filename or "").lower().endswith(".zip")
+
+
+def read_batch_upload(request) -> tuple[list, dict]:
+    """
+    Read the documents of a batch upload from a Flask request. Accepts:
+      - a raw application/zip body
+      - multipart/form-data with one or more "files" (or "file") parts, each
+        an image, a PDF or a ZIP of them
+    Returns (files, options) with files as (name, file_data, file_type).
+    Raises UploadError with the HTTP status to answer.
+    """
+    if request.content_length and request.content_length > MAX_CONTENT_LENGTH:
+        raise UploadError(f"Request body exceeds {OCR_MAX_BODY_MB:g} MB", 413)
+
+    mimetype = request.mimetype or ""
+    files = []
+    try:
+        if _is_zip(mimetype):
+            files = files_from_zip(request.stream.read())
+            options = request.args.to_dict()
+        elif mimetype == "multipart/form-data":
+            for storage in request.files.getlist("files") + request.files.getlist("file"):
+                if _is_zip(storage.mimetype, storage.filename):
+                    files.extend(files_from_zip(storage.read()))
+                    continue
+                file_type = guess_file_type(storage.mimetype, storage.filename)
+                if file_type is None:
+                    raise UploadError(f"Unsupported file {storage.filename!r} (must be an image, a PDF or a ZIP)")
+                files.append((storage.filename, storage.read(), file_type))
+            options = {**request.args.to_dict(), **request.form.to_dict()}
+        else:
+            raise UploadError("Request must be application/zip or multipart/form-data", 415)
+    except zipfile.BadZipFile as e:
+        raise UploadError(f"Invalid ZIP file: {str(e)}")
+
+    files = [f for f in files if f[1]]
+    if not files:
+        raise UploadError("No image or PDF found in the upload")
+    return files, _check_options(options)